@@ -3,25 +3,519 @@ Business: Handles user registration, login, and session management
 Args: event with httpMethod, body (username, email, password)
 Returns: HTTP response with user data and session token
 '''
+import base64
+import functools
+import gzip
+import importlib
 import json
 import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
 import hashlib
+import hmac
 import secrets
 from datetime import datetime, timedelta
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from typing import Dict, Any, List, Optional, Tuple
 
-def hash_password(password: str) -> str:
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PASSWORD_SCRYPT_N = int(os.environ.get('PASSWORD_SCRYPT_N', '16384'))
+PASSWORD_SCRYPT_R = int(os.environ.get('PASSWORD_SCRYPT_R', '8'))
+PASSWORD_SCRYPT_P = int(os.environ.get('PASSWORD_SCRYPT_P', '1'))
+PASSWORD_SALT_BYTES = 16
+PASSWORD_KEY_BYTES = 32
+
+def scrypt_digest(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        password.encode(), salt=salt, n=n, r=r, p=p,
+        maxmem=256 * n * r + 1024 * 1024, dklen=PASSWORD_KEY_BYTES
+    )
+
+def hash_password(password: str, n: int = PASSWORD_SCRYPT_N, r: int = PASSWORD_SCRYPT_R,
+                  p: int = PASSWORD_SCRYPT_P) -> str:
+    salt = secrets.token_bytes(PASSWORD_SALT_BYTES)
+    digest = scrypt_digest(password, salt, n, r, p)
+    return '$'.join([
+        'scrypt', str(n), str(r), str(p),
+        base64.b64encode(salt).decode(), base64.b64encode(digest).decode()
+    ])
+
+def legacy_hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
+def verify_password(password: str, stored_hash: str) -> bool:
+    if not stored_hash.startswith('scrypt$'):
+        return hmac.compare_digest(legacy_hash_password(password), stored_hash)
+    try:
+        _, n, r, p, salt, digest = stored_hash.split('$')
+        expected = base64.b64decode(digest)
+        actual = scrypt_digest(password, base64.b64decode(salt), int(n), int(r), int(p))
+    except ValueError:
+        return False
+    return hmac.compare_digest(actual, expected)
+
+def needs_rehash(stored_hash: str) -> bool:
+    current = 'scrypt${}${}${}$'.format(PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return not stored_hash.startswith(current)
+
+dummy_password_hash: Optional[str] = None
+
+def get_dummy_password_hash() -> str:
+    global dummy_password_hash
+    if dummy_password_hash is None:
+        dummy_password_hash = hash_password(secrets.token_urlsafe(16))
+    return dummy_password_hash
+
 def generate_token() -> str:
     return secrets.token_urlsafe(32)
 
+SESSION_TTL_DAYS = int(os.environ.get('SESSION_TTL_DAYS', '30'))
+
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'auth'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
 def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        return db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
 
+def release_db_connection(conn) -> None:
+    db_pool.putconn(conn)
+    print(json.dumps({'event': 'db_pool', **db_pool.snapshot()}))
+
+def use_autocommit(conn) -> None:
+    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.commit()
+    conn.autocommit = True
+
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_REVOCATION_CHECK_INTERVAL = float(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '1'))
+
+class TokenCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked': 0}
+        self.revision: Optional[str] = None
+        self._synced_at = 0.0
+    
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+    
+    def put(self, key: str, user_id: int, expires_in: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def revocations_due(self, interval: float) -> bool:
+        with self._lock:
+            return self.revision is None or time.monotonic() - self._synced_at >= interval
+    
+    def revoke(self, keys: List[str], revision: str) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['revoked'] += 1
+            self.revision = revision
+            self._synced_at = time.monotonic()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return {**self.stats, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+token_cache = TokenCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'x-auth-token' and value:
+            return value
+    return None
+
+REVOCATIONS_SQL = """
+    WITH horizon AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin
+    )
+    SELECT h.xmin::text as horizon,
+           ARRAY(SELECT r.token_hash::text FROM session_revocations r
+                 WHERE r.txid >= COALESCE(%s::xid8, h.xmin)) as revoked
+    FROM horizon h
+"""
+
+def sync_revocations(cur) -> None:
+    cur.execute(REVOCATIONS_SQL, (token_cache.revision,))
+    row = cur.fetchone()
+    token_cache.revoke(row['revoked'], row['horizon'])
+
+def verify_token(cur, token: str) -> Optional[int]:
+    key = hash_token(token)
+    if token_cache.revocations_due(AUTH_REVOCATION_CHECK_INTERVAL):
+        sync_revocations(cur)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    cur.execute("""
+        SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as expires_in
+        FROM sessions
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP
+    """, (key,))
+    session = cur.fetchone()
+    print(json.dumps({'event': 'auth_cache', **token_cache.snapshot()}))
+    
+    if not session:
+        return None
+    
+    token_cache.put(key, session['user_id'], float(session['expires_in']))
+    return session['user_id']
+
+SESSION_EXPIRY_SQL = "CURRENT_TIMESTAMP + make_interval(days => %s)"
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def text_field(body: Dict[str, Any], name: str) -> str:
+    value = body.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+def check_request(method: str, body: Dict[str, Any], token: Optional[str]) -> Optional[Tuple[int, str]]:
+    if method == 'GET':
+        return None if token else (401, 'X-Auth-Token header is required')
+    if method != 'POST':
+        return 405, 'Method not allowed'
+    
+    action = body.get('action')
+    if action == 'register':
+        if not text_field(body, 'username') or not text_field(body, 'email') or not body.get('password'):
+            return 400, 'Username, email and password are required'
+        if not isinstance(body['password'], str):
+            return 400, 'Password must be a string'
+    elif action == 'login':
+        if not text_field(body, 'username') or not body.get('password'):
+            return 400, 'Username and password are required'
+        if not isinstance(body['password'], str):
+            return 400, 'Password must be a string'
+    elif action == 'logout':
+        if not token and not body.get('token'):
+            return 400, 'Token is required'
+    else:
+        return 400, 'Invalid action'
+    return None
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -43,9 +537,59 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
-    if method == 'POST':
+    try:
+        body = parse_body(event) if method == 'POST' else {}
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    token = get_auth_token(event)
+    rejection = check_request(method, body, token)
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    if method in ('GET', 'POST'):
+        conn = None
+        cur = None
+        
         try:
-            body = json.loads(event.get('body', '{}'))
+            if method == 'GET':
+                conn = get_db_connection()
+                cur = conn.cursor(cursor_factory=RealDictCursor)
+                
+                user_id = verify_token(cur, token)
+                user = None
+                if user_id is not None:
+                    cur.execute(
+                        "SELECT id, username, email, rank, reputation, time_spent_minutes FROM users WHERE id = %s",
+                        (user_id,)
+                    )
+                    user = cur.fetchone()
+                
+                if not user:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Invalid or expired token'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': encode_body({'user': dict(user)}),
+                    'isBase64Encoded': False
+                }
+            
             action = body.get('action')
             
             conn = get_db_connection()
@@ -56,29 +600,27 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 email = body.get('email', '').strip()
                 password = body.get('password', '')
                 
-                if not username or not email or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'Username, email and password are required'}),
-                        'isBase64Encoded': False
-                    }
-                
                 password_hash = hash_password(password)
+                token = generate_token()
                 
-                cur.execute(
-                    "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s) RETURNING id, username, email, rank, reputation",
-                    (username, email, password_hash)
-                )
+                use_autocommit(conn)
+                cur.execute("""
+                    WITH new_user AS (
+                        INSERT INTO users (username, email, password_hash)
+                        VALUES (%s, %s, %s)
+                        RETURNING id, username, email, rank, reputation
+                    ), session AS (
+                        INSERT INTO sessions (token_hash, user_id, expires_at)
+                        SELECT %s, id, """ + SESSION_EXPIRY_SQL + """ FROM new_user
+                    )
+                    SELECT * FROM new_user
+                """, (username, email, password_hash, hash_token(token), SESSION_TTL_DAYS))
                 user = dict(cur.fetchone())
-                conn.commit()
-                
-                token = generate_token()
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': encode_body({
                         'success': True,
                         'user': user,
                         'token': token
@@ -90,23 +632,15 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 username = body.get('username', '').strip()
                 password = body.get('password', '')
                 
-                if not username or not password:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'Username and password are required'}),
-                        'isBase64Encoded': False
-                    }
-                
-                password_hash = hash_password(password)
-                
+                use_autocommit(conn)
                 cur.execute(
-                    "SELECT id, username, email, rank, reputation, time_spent_minutes FROM users WHERE username = %s AND password_hash = %s",
-                    (username, password_hash)
+                    "SELECT id, username, email, rank, reputation, time_spent_minutes, password_hash FROM users WHERE username = %s",
+                    (username,)
                 )
                 user = cur.fetchone()
                 
-                if not user:
+                stored_hash = user['password_hash'] if user else get_dummy_password_hash()
+                if not verify_password(password, stored_hash) or not user:
                     return {
                         'statusCode': 401,
                         'headers': headers,
@@ -115,19 +649,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     }
                 
                 user = dict(user)
-                
-                cur.execute(
-                    "UPDATE users SET last_login = CURRENT_TIMESTAMP WHERE id = %s",
-                    (user['id'],)
-                )
-                conn.commit()
+                del user['password_hash']
                 
                 token = generate_token()
+                new_hash = hash_password(password) if needs_rehash(stored_hash) else None
+                
+                cur.execute("""
+                    WITH touched AS (
+                        UPDATE users
+                        SET last_login = CURRENT_TIMESTAMP, password_hash = COALESCE(%s, password_hash)
+                        WHERE id = %s
+                        RETURNING id
+                    ), expired AS (
+                        DELETE FROM sessions WHERE user_id = %s AND expires_at <= CURRENT_TIMESTAMP
+                    )
+                    INSERT INTO sessions (token_hash, user_id, expires_at)
+                    SELECT %s, id, """ + SESSION_EXPIRY_SQL + """ FROM touched
+                """, (new_hash, user['id'], user['id'], hash_token(token), SESSION_TTL_DAYS))
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({
+                    'body': encode_body({
                         'success': True,
                         'user': user,
                         'token': token
@@ -135,26 +678,34 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            else:
+            elif action == 'logout':
+                token = token or body.get('token')
+                
+                key = hash_token(token)
+                cur.execute(
+                    "UPDATE sessions SET revoked_at = CURRENT_TIMESTAMP WHERE token_hash = %s AND revoked_at IS NULL",
+                    (key,)
+                )
+                conn.commit()
+                token_cache.invalidate(key)
+                
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Invalid action'}),
+                    'body': json.dumps({'success': True}),
                     'isBase64Encoded': False
                 }
             
-        except psycopg2.IntegrityError as e:
-            if conn:
-                conn.rollback()
-            return {
-                'statusCode': 409,
-                'headers': headers,
-                'body': json.dumps({'error': 'Username or email already exists'}),
-                'isBase64Encoded': False
-            }
         except Exception as e:
-            if conn:
+            if conn and not conn.closed:
                 conn.rollback()
+            if psycopg2 is not None and isinstance(e, psycopg2.IntegrityError):
+                return {
+                    'statusCode': 409,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Username or email already exists'}),
+                    'isBase64Encoded': False
+                }
             return {
                 'statusCode': 500,
                 'headers': headers,
@@ -165,7 +716,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             if cur:
                 cur.close()
             if conn:
-                conn.close()
+                release_db_connection(conn)
     
     return {
         'statusCode': 405,
@@ -173,3 +724,43 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'body': json.dumps({'error': 'Method not allowed'}),
         'isBase64Encoded': False
     }
+
+def calibrate_password_hashing(target_p99_ms: float, samples: int, r: int, p: int) -> Dict[str, Any]:
+    results = []
+    n = 1024
+    while n <= 2 ** 20:
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            scrypt_digest('calibration-password', secrets.token_bytes(PASSWORD_SALT_BYTES), n, r, p)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        p99 = timings[min(len(timings) - 1, int(len(timings) * 0.99))]
+        results.append({'n': n, 'p50_ms': round(timings[len(timings) // 2], 2), 'p99_ms': round(p99, 2)})
+        if p99 > target_p99_ms:
+            break
+        n *= 2
+    
+    within_budget = [result for result in results if result['p99_ms'] <= target_p99_ms]
+    chosen = within_budget[-1] if within_budget else results[0]
+    return {
+        'target_p99_ms': target_p99_ms,
+        'results': results,
+        'env': {
+            'PASSWORD_SCRYPT_N': chosen['n'],
+            'PASSWORD_SCRYPT_R': r,
+            'PASSWORD_SCRYPT_P': p
+        }
+    }
+
+if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Pick scrypt parameters that fit a login latency budget on this host')
+    parser.add_argument('--target-p99-ms', type=float, default=100.0)
+    parser.add_argument('--samples', type=int, default=50)
+    parser.add_argument('--r', type=int, default=PASSWORD_SCRYPT_R)
+    parser.add_argument('--p', type=int, default=PASSWORD_SCRYPT_P)
+    args = parser.parse_args()
+    
+    print(json.dumps(calibrate_password_hashing(args.target_p99_ms, args.samples, args.r, args.p), indent=2))
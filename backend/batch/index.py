@@ -0,0 +1,531 @@
+'''
+Business: Runs several sub-requests to other functions in one invocation on one DB connection
+Args: event with httpMethod, body (requests: list of {id, function, httpMethod, queryStringParameters, body})
+Returns: HTTP response with per-item statusCode and body
+'''
+import base64
+import functools
+import gzip
+import importlib.util
+import json
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'batch'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+def get_db_connection():
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        return db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    db_pool.putconn(conn)
+    print(json.dumps({'event': 'db_pool', **db_pool.snapshot()}))
+
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', '20'))
+BATCH_FUNCTIONS = ('auth', 'scripts', 'forum', 'comments', 'stats')
+BATCH_PARENT_ONLY_HEADERS = ('accept-encoding', 'if-none-match', 'if-modified-since')
+BATCH_SNAPSHOT_SKIPPED = ('maybe_flush_counters', 'maybe_flush_heartbeats')
+FUNCTIONS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class SharedConnection:
+    def __init__(self, conn, snapshot: bool):
+        self._conn = conn
+        self._snapshot = snapshot
+    
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._conn, name)
+    
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name.startswith('_'):
+            object.__setattr__(self, name, value)
+        else:
+            setattr(self._conn, name, value)
+    
+    def commit(self) -> None:
+        if not self._snapshot:
+            self._conn.commit()
+    
+    def rollback(self) -> None:
+        if self._snapshot:
+            with self._conn.cursor() as cur:
+                cur.execute("ROLLBACK TO SAVEPOINT batch_item")
+        else:
+            self._conn.rollback()
+
+batch_state = threading.local()
+handler_modules: Dict[str, Any] = {}
+handler_modules_lock = threading.Lock()
+
+def skip_in_snapshot(maintenance):
+    @functools.wraps(maintenance)
+    def wrapper(conn, cur) -> None:
+        if not getattr(batch_state, 'snapshot', False):
+            maintenance(conn, cur)
+    return wrapper
+
+def load_function(name: str):
+    module = handler_modules.get(name)
+    if module is not None:
+        return module
+    with handler_modules_lock:
+        if name not in handler_modules:
+            path = os.path.join(FUNCTIONS_DIR, name, 'index.py')
+            spec = importlib.util.spec_from_file_location('batch_' + name, path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            module.load_db_stack()
+            module.get_db_connection = lambda *args, **kwargs: getattr(batch_state, 'connection', None)
+            module.release_db_connection = lambda conn: None
+            for attr in BATCH_SNAPSHOT_SKIPPED:
+                if hasattr(module, attr):
+                    setattr(module, attr, skip_in_snapshot(getattr(module, attr)))
+            handler_modules[name] = module
+        return handler_modules[name]
+
+def build_event(item: Dict[str, Any], parent_headers: Dict[str, Any]) -> Dict[str, Any]:
+    body = item.get('body')
+    if body is not None and not isinstance(body, str):
+        body = json.dumps(body)
+    headers = {key: value for key, value in parent_headers.items() if key.lower() not in BATCH_PARENT_ONLY_HEADERS}
+    return {
+        'httpMethod': item.get('httpMethod', 'GET'),
+        'queryStringParameters': item.get('queryStringParameters') or {},
+        'headers': {**headers, **(item.get('headers') or {})},
+        'body': body if body is not None else '{}'
+    }
+
+def run_item(module, event: Dict[str, Any], conn, snapshot: bool) -> Dict[str, Any]:
+    if snapshot:
+        with conn.cursor() as cur:
+            cur.execute("SAVEPOINT batch_item")
+    response = module.handler(event, None)
+    if snapshot:
+        with conn.cursor() as cur:
+            cur.execute("RELEASE SAVEPOINT batch_item")
+    elif conn.autocommit:
+        conn.autocommit = False
+    return response
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def decode_body(response: Dict[str, Any]) -> Any:
+    body = response.get('body') or ''
+    if response.get('isBase64Encoded') or not body:
+        return body
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body
+
+@instrumented
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    
+    if method != 'POST':
+        return {
+            'statusCode': 405,
+            'headers': headers,
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+    
+    try:
+        body = parse_body(event)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    snapshot = False
+    
+    try:
+        items = body.get('requests')
+        
+        if not isinstance(items, list) or not items or len(items) > BATCH_MAX_REQUESTS:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'requests must be a list of 1 to {} items'.format(BATCH_MAX_REQUESTS)}),
+                'isBase64Encoded': False
+            }
+        
+        for item in items:
+            if not isinstance(item, dict) or item.get('function') not in BATCH_FUNCTIONS:
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Each request needs a function: ' + ', '.join(BATCH_FUNCTIONS)}),
+                    'isBase64Encoded': False
+                }
+            if not all(isinstance(item.get(name) or {}, dict) for name in ('headers', 'queryStringParameters')):
+                return {
+                    'statusCode': 400,
+                    'headers': headers,
+                    'body': json.dumps({'error': 'Request headers and queryStringParameters must be objects'}),
+                    'isBase64Encoded': False
+                }
+        
+        parent_headers = {
+            name: value for name, value in (event.get('headers') or {}).items()
+            if name.lower() == 'x-auth-token'
+        }
+        snapshot = all(item.get('httpMethod', 'GET') == 'GET' for item in items)
+        
+        conn = get_db_connection()
+        if snapshot:
+            conn.set_session(isolation_level='REPEATABLE READ')
+        batch_state.connection = SharedConnection(conn, snapshot)
+        batch_state.snapshot = snapshot
+        
+        responses = []
+        for index, item in enumerate(items):
+            module = load_function(item['function'])
+            response = run_item(module, build_event(item, parent_headers), conn, snapshot)
+            responses.append({
+                'id': item.get('id', index),
+                'statusCode': response['statusCode'],
+                'body': decode_body(response)
+            })
+        
+        conn.commit()
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': encode_body({'responses': responses}),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        if conn and not conn.closed:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        batch_state.connection = None
+        batch_state.snapshot = False
+        if conn:
+            if snapshot and not conn.closed:
+                conn.set_session(isolation_level='DEFAULT')
+            release_db_connection(conn)
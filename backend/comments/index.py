@@ -3,16 +3,720 @@ Business: Manages comments on scripts and forum topics
 Args: event with httpMethod, body (script_id/topic_id, author_id, content)
 Returns: HTTP response with comments list or created comment
 '''
+import base64
+import functools
+import gzip
+import hashlib
+import importlib
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'comments'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+TEXT_ENCODED_TYPE_OIDS = frozenset((1082, 1083, 1114, 1184, 1186, 1266, 1700))
+
+class RowEncoder:
+    def __init__(self, description):
+        self.names = [column[0] for column in description]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.text_positions = [
+            position for position, column in enumerate(description) if column[1] in TEXT_ENCODED_TYPE_OIDS
+        ]
+    
+    def value(self, row: Tuple[Any, ...], name: str) -> Any:
+        return row[self.positions[name]]
+    
+    def record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(row)
+        for position in self.text_positions:
+            name = self.names[position]
+            if record[name] is not None:
+                record[name] = str(record[name])
+        return record
+    
+    def records(self, rows: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+        names = self.names
+        if not self.text_positions or not rows:
+            return [dict(zip(names, row)) for row in rows]
+        columns = [list(column) for column in zip(*rows)]
+        for position in self.text_positions:
+            columns[position] = [None if value is None else str(value) for value in columns[position]]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+DATABASE_REPLICA_URLS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '1'))
+READ_AFTER_HEADER = 'X-Read-After'
+
+REPLICA_STATUS_SQL = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text,
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END::float8
+"""
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    high, separator, low = (value or '').strip().partition('/')
+    if not separator:
+        return None
+    try:
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+class ReplicaRouter:
+    def __init__(self, pools: List[ConnectionPool], max_lag: float, check_interval: float):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status: Dict[int, Tuple[int, float, float]] = {}
+        self._leased: Dict[int, ConnectionPool] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats = {'reads': 0, 'fallbacks': 0, 'lagging': 0, 'behind': 0, 'errors': 0}
+    
+    def _cached_status(self, index: int) -> Optional[Tuple[int, float, float]]:
+        status = self._status.get(index)
+        if status is None or time.monotonic() - status[2] >= self.check_interval:
+            return None
+        return status
+    
+    def _probe(self, index: int, conn) -> Tuple[int, float, float]:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_STATUS_SQL)
+            replay_lsn, lag = cur.fetchone()
+        conn.rollback()
+        self._status[index] = (parse_lsn(replay_lsn) or 0, lag, time.monotonic())
+        return self._status[index]
+    
+    def _mark_failed(self, index: int) -> None:
+        self._status[index] = (0, float('inf'), time.monotonic())
+        self.stats['errors'] += 1
+    
+    def getconn(self, read_after: Optional[int]):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            pool = self.pools[index]
+            status = self._cached_status(index)
+            if status is not None and status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+                continue
+            
+            try:
+                conn = pool.getconn()
+            except psycopg2.Error:
+                self._mark_failed(index)
+                continue
+            
+            try:
+                if status is None or (read_after is not None and status[0] < read_after):
+                    status = self._probe(index, conn)
+            except psycopg2.Error:
+                pool.putconn(conn)
+                self._mark_failed(index)
+                continue
+            
+            if status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+            elif read_after is not None and status[0] < read_after:
+                self.stats['behind'] += 1
+            else:
+                with self._lock:
+                    self._leased[id(conn)] = pool
+                self.stats['reads'] += 1
+                return conn
+            pool.putconn(conn)
+        
+        self.stats['fallbacks'] += 1
+        return None
+    
+    def putconn(self, conn) -> bool:
+        with self._lock:
+            pool = self._leased.pop(id(conn), None)
+        if pool is None:
+            return False
+        pool.putconn(conn)
+        return True
+    
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, 'pools': len(self.pools)}
+
+replica_router = ReplicaRouter(
+    [
+        ConnectionPool(dsn, DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER)
+        for dsn in DATABASE_REPLICA_URLS
+    ],
+    REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL
+) if DATABASE_REPLICA_URLS else None
+
+def get_db_connection(read_only: bool = False, read_after: Optional[int] = None):
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        conn = replica_router.getconn(read_after) if read_only and replica_router is not None else None
+        return conn if conn is not None else db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    if replica_router is None or not replica_router.putconn(conn):
+        db_pool.putconn(conn)
+    snapshot = db_pool.snapshot()
+    if replica_router is not None:
+        snapshot['replicas'] = replica_router.snapshot()
+    print(json.dumps({'event': 'db_pool', **snapshot}))
+
+def read_after_headers(cur) -> Dict[str, str]:
+    if replica_router is None:
+        return {}
+    cur.execute("SELECT pg_current_wal_lsn()::text as lsn")
+    return {READ_AFTER_HEADER: cur.fetchone()['lsn'], 'Access-Control-Expose-Headers': READ_AFTER_HEADER}
+
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_REVOCATION_CHECK_INTERVAL = float(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '1'))
+
+class TokenCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked': 0}
+        self.revision: Optional[str] = None
+        self._synced_at = 0.0
+    
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+    
+    def put(self, key: str, user_id: int, expires_in: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def revocations_due(self, interval: float) -> bool:
+        with self._lock:
+            return self.revision is None or time.monotonic() - self._synced_at >= interval
+    
+    def revoke(self, keys: List[str], revision: str) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['revoked'] += 1
+            self.revision = revision
+            self._synced_at = time.monotonic()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return {**self.stats, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+token_cache = TokenCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'x-auth-token' and value:
+            return value
+    return None
+
+REVOCATIONS_SQL = """
+    WITH horizon AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin
+    )
+    SELECT h.xmin::text as horizon,
+           ARRAY(SELECT r.token_hash::text FROM session_revocations r
+                 WHERE r.txid >= COALESCE(%s::xid8, h.xmin)) as revoked
+    FROM horizon h
+"""
+
+def sync_revocations(cur) -> None:
+    cur.execute(REVOCATIONS_SQL, (token_cache.revision,))
+    row = cur.fetchone()
+    token_cache.revoke(row['revoked'], row['horizon'])
+
+def verify_token(cur, token: str) -> Optional[int]:
+    key = hash_token(token)
+    if token_cache.revocations_due(AUTH_REVOCATION_CHECK_INTERVAL):
+        sync_revocations(cur)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    cur.execute("""
+        SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as expires_in
+        FROM sessions
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP
+    """, (key,))
+    session = cur.fetchone()
+    print(json.dumps({'event': 'auth_cache', **token_cache.snapshot()}))
+    
+    if not session:
+        return None
+    
+    token_cache.put(key, session['user_id'], float(session['expires_in']))
+    return session['user_id']
+
+def resolve_user_id(event: Dict[str, Any], cur, claimed_id: Any) -> Tuple[Any, Optional[str]]:
+    token = get_auth_token(event)
+    if not token:
+        if AUTH_REQUIRED:
+            return None, 'Authentication required'
+        return claimed_id, None
+    
+    user_id = verify_token(cur, token)
+    if user_id is None:
+        return None, 'Invalid or expired token'
+    if claimed_id and str(claimed_id) != str(user_id):
+        return None, 'Token does not belong to this user'
+    return user_id, None
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+THREADS = {
+    'script': {
+        'table': 'script_comments',
+        'parent': 'script_id',
+        'ascending': False,
+        'key': 'comments',
+        'total_sql': "SELECT comment_count as total FROM scripts WHERE id = %s"
+    },
+    'forum': {
+        'table': 'forum_replies',
+        'parent': 'topic_id',
+        'ascending': True,
+        'key': 'replies',
+        'total_sql': "SELECT reply_count as total FROM forum_topics WHERE id = %s"
+    }
+}
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_page_size(value: Optional[str]) -> int:
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if size < 1:
+        raise ValueError('limit must be positive')
+    return min(size, MAX_PAGE_SIZE)
+
+def fetch_thread_page(conn, thread: Dict[str, Any], parent_id: Any, page_size: int,
+                      after: Optional[Tuple[datetime, int]],
+                      before: Optional[Tuple[datetime, int]]) -> Dict[str, Any]:
+    forward = before is None
+    ascending = thread['ascending'] == forward
+    query = """
+        SELECT c.*, u.username as author_name, u.rank
+        FROM """ + thread['table'] + """ c
+        JOIN users u ON c.author_id = u.id
+        WHERE c.""" + thread['parent'] + """ = %s
+    """
+    query_params: List[Any] = [parent_id]
+    
+    boundary = after if forward else before
+    if boundary:
+        query += " AND (c.created_at, c.id) " + ('>' if ascending else '<') + " (%s, %s)"
+        query_params.extend(boundary)
+    
+    order = 'ASC' if ascending else 'DESC'
+    query += " ORDER BY c.created_at " + order + ", c.id " + order + " LIMIT %s"
+    query_params.append(page_size + 1)
+    
+    with conn.cursor() as rows_cur:
+        rows_cur.execute(query, query_params)
+        encoder = RowEncoder(rows_cur.description)
+        rows = rows_cur.fetchall()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if not forward:
+        rows.reverse()
+    
+    has_next = has_more if forward else True
+    has_prev = boundary is not None if forward else has_more
+    return {
+        'items': encoder.records(rows),
+        'next_cursor': encode_cursor(encoder.value(rows[-1], 'created_at'), encoder.value(rows[-1], 'id'))
+                       if rows and has_next else None,
+        'prev_cursor': encode_cursor(encoder.value(rows[0], 'created_at'), encoder.value(rows[0], 'id'))
+                       if rows and has_prev else None
+    }
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def text_field(body: Dict[str, Any], name: str) -> str:
+    value = body.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+def check_request(method: str, params: Dict[str, Any], body: Dict[str, Any], token: Optional[str]) -> Optional[Tuple[int, str]]:
+    if method == 'GET':
+        if not params.get('script_id') and not params.get('topic_id'):
+            return 400, 'script_id or topic_id required'
+        try:
+            parse_page_size(params.get('limit'))
+            after = decode_cursor(params['cursor']) if params.get('cursor') else None
+            before = decode_cursor(params['before']) if params.get('before') else None
+        except ValueError as e:
+            return 400, str(e)
+        if after and before:
+            return 400, 'Use either cursor or before, not both'
+        return None
+    
+    if method != 'POST':
+        return 405, 'Method not allowed'
+    
+    if AUTH_REQUIRED and not token:
+        return 401, 'Authentication required'
+    if not text_field(body, 'content') or not (token or body.get('author_id')):
+        return 400, 'author_id and content are required'
+    
+    comment_type = body.get('type', 'script')
+    if comment_type not in THREADS:
+        return 400, 'Invalid type'
+    if comment_type == 'script' and not body.get('script_id'):
+        return 400, 'script_id is required'
+    if comment_type == 'forum' and not body.get('topic_id'):
+        return 400, 'topic_id is required'
+    return None
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +726,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, X-Read-After',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -34,146 +738,158 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    params = event.get('queryStringParameters') or {}
+    try:
+        body = parse_body(event) if method == 'POST' else {}
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    rejection = check_request(method, params, body, get_auth_token(event))
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    read_after = parse_lsn(get_header(event, READ_AFTER_HEADER.lower()))
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        conn = get_db_connection(read_only=method == 'GET', read_after=read_after)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
-            params = event.get('queryStringParameters') or {}
             script_id = params.get('script_id')
             topic_id = params.get('topic_id')
             
-            if script_id:
-                cur.execute("""
-                    SELECT c.*, u.username as author_name, u.rank
-                    FROM script_comments c
-                    JOIN users u ON c.author_id = u.id
-                    WHERE c.script_id = %s
-                    ORDER BY c.created_at DESC
-                """, (script_id,))
-                comments = [dict(row) for row in cur.fetchall()]
-                
-                return {
-                    'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'comments': comments}, default=str),
-                    'isBase64Encoded': False
-                }
+            thread = THREADS['script'] if script_id else THREADS['forum']
+            parent_id = script_id or topic_id
+            page_size = parse_page_size(params.get('limit'))
+            after = decode_cursor(params['cursor']) if params.get('cursor') else None
+            before = decode_cursor(params['before']) if params.get('before') else None
             
-            elif topic_id:
-                cur.execute("""
-                    SELECT r.*, u.username as author_name, u.rank
-                    FROM forum_replies r
-                    JOIN users u ON r.author_id = u.id
-                    WHERE r.topic_id = %s
-                    ORDER BY r.created_at ASC
-                """, (topic_id,))
-                replies = [dict(row) for row in cur.fetchall()]
-                
-                return {
-                    'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'replies': replies}, default=str),
-                    'isBase64Encoded': False
-                }
+            page = fetch_thread_page(conn, thread, parent_id, page_size, after, before)
+            result = {
+                thread['key']: page['items'],
+                'next_cursor': page['next_cursor'],
+                'prev_cursor': page['prev_cursor']
+            }
             
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'script_id or topic_id required'}),
-                    'isBase64Encoded': False
-                }
+            if params.get('include_total') in ('1', 'true'):
+                cur.execute(thread['total_sql'], (parent_id,))
+                counter = cur.fetchone()
+                result['total'] = counter['total'] if counter else 0
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': encode_body(result),
+                'isBase64Encoded': False
+            }
         
         elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
             comment_type = body.get('type', 'script')
-            author_id = body.get('author_id')
+            author_id, auth_error = resolve_user_id(event, cur, body.get('author_id'))
             content = body.get('content', '').strip()
             
-            if not author_id or not content:
+            if auth_error:
                 return {
-                    'statusCode': 400,
+                    'statusCode': 401,
                     'headers': headers,
-                    'body': json.dumps({'error': 'author_id and content are required'}),
+                    'body': json.dumps({'error': auth_error}),
                     'isBase64Encoded': False
                 }
             
             if comment_type == 'script':
                 script_id = body.get('script_id')
                 
-                if not script_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'script_id is required'}),
-                        'isBase64Encoded': False
-                    }
-                
                 cur.execute("""
-                    INSERT INTO script_comments (script_id, author_id, content)
-                    VALUES (%s, %s, %s)
-                    RETURNING id, script_id, author_id, content, created_at
+                    WITH comment AS (
+                        INSERT INTO script_comments (script_id, author_id, content)
+                        VALUES (%s, %s, %s)
+                        RETURNING id, script_id, author_id, content, created_at
+                    ), script AS (
+                        UPDATE scripts s
+                        SET comment_count = s.comment_count + 1
+                        FROM comment
+                        WHERE s.id = comment.script_id
+                    ), author_stats AS (
+                        INSERT INTO user_stats (user_id, comments_posted)
+                        SELECT author_id, 1 FROM comment
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET comments_posted = user_stats.comments_posted + 1,
+                            updated_at = CURRENT_TIMESTAMP
+                    ), activity AS (
+                        INSERT INTO activity_events (kind, subject_id, parent_id, actor_id, payload)
+                        SELECT 'comment_created', id, script_id, author_id,
+                               jsonb_build_object('preview', LEFT(content, 200))
+                        FROM comment
+                    )
+                    SELECT * FROM comment
                 """, (script_id, author_id, content))
                 
-                comment = dict(cur.fetchone())
+                comment = RowEncoder(cur.description).record(cur.fetchone())
                 conn.commit()
+                headers.update(read_after_headers(cur))
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'comment': comment}, default=str),
+                    'body': encode_body({'success': True, 'comment': comment}),
                     'isBase64Encoded': False
                 }
             
             elif comment_type == 'forum':
                 topic_id = body.get('topic_id')
                 
-                if not topic_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'topic_id is required'}),
-                        'isBase64Encoded': False
-                    }
-                
                 cur.execute("""
-                    INSERT INTO forum_replies (topic_id, author_id, content)
-                    VALUES (%s, %s, %s)
-                    RETURNING id, topic_id, author_id, content, created_at
+                    WITH reply AS (
+                        INSERT INTO forum_replies (topic_id, author_id, content)
+                        VALUES (%s, %s, %s)
+                        RETURNING id, topic_id, author_id, content, created_at
+                    ), topic AS (
+                        UPDATE forum_topics t
+                        SET reply_count = t.reply_count + 1,
+                            last_reply_at = GREATEST(t.last_reply_at, reply.created_at),
+                            last_activity_at = GREATEST(t.last_activity_at, reply.created_at)
+                        FROM reply
+                        WHERE t.id = reply.topic_id
+                    ), author_stats AS (
+                        INSERT INTO user_stats (user_id, replies_posted)
+                        SELECT author_id, 1 FROM reply
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET replies_posted = user_stats.replies_posted + 1,
+                            updated_at = CURRENT_TIMESTAMP
+                    ), activity AS (
+                        INSERT INTO activity_events (kind, subject_id, parent_id, actor_id, payload)
+                        SELECT 'reply_created', id, topic_id, author_id,
+                               jsonb_build_object('preview', LEFT(content, 200))
+                        FROM reply
+                    )
+                    SELECT * FROM reply
                 """, (topic_id, author_id, content))
                 
-                reply = dict(cur.fetchone())
+                reply = RowEncoder(cur.description).record(cur.fetchone())
                 conn.commit()
+                headers.update(read_after_headers(cur))
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'reply': reply}, default=str),
-                    'isBase64Encoded': False
-                }
-            
-            else:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'Invalid type'}),
+                    'body': encode_body({'success': True, 'reply': reply}),
                     'isBase64Encoded': False
                 }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
     
     except Exception as e:
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         return {
             'statusCode': 500,
@@ -185,4 +901,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
@@ -0,0 +1,641 @@
+'''
+Business: Activity feed of new scripts, topics, replies, comments and topic status changes since a cursor,
+          with long-poll so clients stop re-running the list queries to stay fresh
+Args: event with httpMethod GET, queryStringParameters (cursor, wait seconds, limit, kinds)
+Returns: HTTP response with events after the cursor and the cursor to poll with next
+'''
+import base64
+import functools
+import gzip
+import importlib
+import json
+import os
+import random
+import re
+import select
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'feed'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+TEXT_ENCODED_TYPE_OIDS = frozenset((1082, 1083, 1114, 1184, 1186, 1266, 1700))
+
+class RowEncoder:
+    def __init__(self, description):
+        self.names = [column[0] for column in description]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.text_positions = [
+            position for position, column in enumerate(description) if column[1] in TEXT_ENCODED_TYPE_OIDS
+        ]
+    
+    def value(self, row: Tuple[Any, ...], name: str) -> Any:
+        return row[self.positions[name]]
+    
+    def record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(row)
+        for position in self.text_positions:
+            name = self.names[position]
+            if record[name] is not None:
+                record[name] = str(record[name])
+        return record
+    
+    def records(self, rows: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+        names = self.names
+        if not self.text_positions or not rows:
+            return [dict(zip(names, row)) for row in rows]
+        columns = [list(column) for column in zip(*rows)]
+        for position in self.text_positions:
+            columns[position] = [None if value is None else str(value) for value in columns[position]]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+
+def get_db_connection():
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        return db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    db_pool.putconn(conn)
+    print(json.dumps({'event': 'db_pool', **db_pool.snapshot()}))
+
+FEED_CHANNEL = 'activity_events'
+FEED_KINDS = ('script_created', 'topic_created', 'topic_status_changed', 'reply_created', 'comment_created')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+FEED_MAX_WAIT = float(os.environ.get('FEED_MAX_WAIT', '25'))
+FEED_RECHECK_INTERVAL = float(os.environ.get('FEED_RECHECK_INTERVAL', '2'))
+FEED_LISTEN_PING = float(os.environ.get('FEED_LISTEN_PING', '30'))
+FEED_RETENTION_HOURS = float(os.environ.get('FEED_RETENTION_HOURS', '72'))
+FEED_PRUNE_INTERVAL = float(os.environ.get('FEED_PRUNE_INTERVAL', '600'))
+FEED_PRUNE_SLACK_HOURS = 1.0
+last_feed_prune = 0.0
+
+class ChangeListener:
+    def __init__(self, dsn: Optional[str], channel: str, ping_interval: float):
+        self.dsn = dsn
+        self.channel = channel
+        self.ping_interval = ping_interval
+        self._generation = 0
+        self._thread: Optional[threading.Thread] = None
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'notifications': 0, 'errors': 0, 'wakeups': 0, 'timeouts': 0}
+    
+    def _bump(self) -> None:
+        with self._cond:
+            self._generation += 1
+            self._cond.notify_all()
+    
+    def _listen(self) -> None:
+        conn = psycopg2.connect(self.dsn)
+        try:
+            conn.autocommit = True
+            with conn.cursor() as cur:
+                cur.execute('LISTEN ' + self.channel)
+            self.stats['connects'] += 1
+            self._bump()
+            while True:
+                if select.select([conn], [], [], self.ping_interval) == ([], [], []):
+                    with conn.cursor() as cur:
+                        cur.execute('SELECT 1')
+                    continue
+                conn.poll()
+                if conn.notifies:
+                    self.stats['notifications'] += len(conn.notifies)
+                    conn.notifies.clear()
+                    self._bump()
+        finally:
+            conn.close()
+    
+    def _run(self) -> None:
+        backoff = 0.5
+        while True:
+            connects = self.stats['connects']
+            try:
+                self._listen()
+            except (psycopg2.Error, OSError):
+                self.stats['errors'] += 1
+            self._bump()
+            backoff = 0.5 if self.stats['connects'] > connects else min(backoff * 2, 30.0)
+            time.sleep(backoff)
+    
+    def generation(self) -> int:
+        load_db_stack()
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='feed-listener', daemon=True)
+                self._thread.start()
+            return self._generation
+    
+    def wait(self, generation: int, timeout: float) -> bool:
+        with self._cond:
+            changed = self._cond.wait_for(lambda: self._generation != generation, timeout)
+        self.stats['wakeups' if changed else 'timeouts'] += 1
+        return changed
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'generation': self._generation}
+
+change_listener = ChangeListener(os.environ.get('DATABASE_URL'), FEED_CHANNEL, FEED_LISTEN_PING)
+
+def encode_cursor(txid: int, event_id: int) -> str:
+    raw = json.dumps([txid, event_id, int(time.time())]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor: str) -> Tuple[int, int, int]:
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        txid, event_id, issued_at = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return int(txid), int(event_id), int(issued_at)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_page_size(value: Optional[str]) -> int:
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if size < 1:
+        raise ValueError('limit must be positive')
+    return min(size, MAX_PAGE_SIZE)
+
+def parse_wait(value: Optional[str]) -> float:
+    if value is None or value == '':
+        return 0.0
+    try:
+        wait = float(value)
+    except ValueError:
+        raise ValueError('wait must be a number of seconds')
+    if wait < 0:
+        raise ValueError('wait must not be negative')
+    return min(wait, FEED_MAX_WAIT)
+
+def parse_kinds(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    kinds = [kind.strip() for kind in value.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in FEED_KINDS]
+    if unknown:
+        raise ValueError('Unknown kinds: ' + ', '.join(unknown))
+    return kinds or None
+
+def fetch_feed_page(conn, after: Optional[Tuple[int, int]], kinds: Optional[List[str]],
+                    page_size: int) -> Dict[str, Any]:
+    forward = after is not None
+    order = 'ASC' if forward else 'DESC'
+    query = """
+        WITH horizon AS (
+            SELECT s.xmin, EXISTS (
+                SELECT 1 FROM activity_events e
+                WHERE e.txid >= s.xmin
+                  AND (%(kinds)s::text[] IS NULL OR e.kind = ANY(%(kinds)s::text[]))
+            ) as held
+            FROM (SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin) s
+        ), events AS (
+            SELECT e.id, e.txid, e.kind, e.subject_id, e.parent_id, e.actor_id, e.payload, e.created_at
+            FROM activity_events e
+            WHERE e.txid < (SELECT xmin FROM horizon)
+              AND (%(kinds)s::text[] IS NULL OR e.kind = ANY(%(kinds)s::text[]))
+    """
+    if forward:
+        query += " AND (e.txid, e.id) > (%(txid)s::text::xid8, %(id)s)"
+    query += """
+            ORDER BY e.txid """ + order + """, e.id """ + order + """
+            LIMIT %(limit)s
+        )
+        SELECT h.xmin::text::bigint as horizon, h.held, ev.txid::text::bigint as txid, ev.id, ev.kind, ev.subject_id,
+               ev.parent_id, ev.actor_id, u.username as actor_name, ev.payload, ev.created_at
+        FROM horizon h
+        LEFT JOIN events ev ON true
+        LEFT JOIN users u ON u.id = ev.actor_id
+        ORDER BY ev.txid ASC, ev.id ASC
+    """
+    query_params = {
+        'kinds': kinds,
+        'txid': after[0] if forward else 0,
+        'id': after[1] if forward else 0,
+        'limit': page_size + 1 if forward else page_size
+    }
+    
+    with conn.cursor() as rows_cur:
+        rows_cur.execute(query, query_params)
+        encoder = RowEncoder(rows_cur.description)
+        rows = rows_cur.fetchall()
+    conn.commit()
+    
+    horizon = encoder.value(rows[0], 'horizon')
+    held = encoder.value(rows[0], 'held')
+    rows = [row for row in rows if encoder.value(row, 'id') is not None]
+    has_more = forward and len(rows) > page_size
+    rows = rows[:page_size]
+    
+    if has_more:
+        position = (encoder.value(rows[-1], 'txid'), encoder.value(rows[-1], 'id'))
+    else:
+        position = max((horizon, 0), after or (0, 0))
+    
+    events = encoder.records(rows)
+    for event in events:
+        del event['horizon'], event['held'], event['txid']
+    return {'events': events, 'cursor': encode_cursor(*position), 'has_more': has_more, 'held': held}
+
+def prune_events(cur) -> int:
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", ('activity_prune',))
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute(
+        "DELETE FROM activity_events WHERE created_at < CURRENT_TIMESTAMP - %s * interval '1 hour'",
+        (FEED_RETENTION_HOURS + FEED_PRUNE_SLACK_HOURS,)
+    )
+    return cur.rowcount
+
+def maybe_prune_events(conn) -> None:
+    global last_feed_prune
+    now = time.monotonic()
+    if now - last_feed_prune < FEED_PRUNE_INTERVAL:
+        return
+    last_feed_prune = now
+    with conn.cursor() as cur:
+        pruned = prune_events(cur)
+    conn.commit()
+    print(json.dumps({'event': 'feed_prune', 'pruned': pruned}))
+
+def poll_feed(after: Optional[Tuple[int, int]], kinds: Optional[List[str]], page_size: int,
+              wait: float) -> Dict[str, Any]:
+    deadline = time.monotonic() + wait
+    while True:
+        generation = change_listener.generation() if wait > 0 else 0
+        conn = get_db_connection()
+        try:
+            page = fetch_feed_page(conn, after, kinds, page_size)
+            maybe_prune_events(conn)
+        finally:
+            release_db_connection(conn)
+        
+        held = page.pop('held')
+        remaining = deadline - time.monotonic()
+        if page['events'] or remaining <= 0:
+            return page
+        after = decode_cursor(page['cursor'])[:2]
+        timeout = min(remaining, FEED_RECHECK_INTERVAL) if held else remaining
+        if not change_listener.wait(generation, timeout) and not held:
+            return page
+
+def check_request(method: str, params: Dict[str, Any]) -> Optional[Tuple[int, str]]:
+    if method != 'GET':
+        return 405, 'Method not allowed'
+    try:
+        parse_page_size(params.get('limit'))
+        parse_wait(params.get('wait'))
+        parse_kinds(params.get('kinds'))
+        cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+    except ValueError as e:
+        return 400, str(e)
+    if cursor and time.time() - cursor[2] > FEED_RETENTION_HOURS * 3600:
+        return 410, 'Cursor expired, reload the lists and start a new feed'
+    return None
+
+@instrumented
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*',
+        'Cache-Control': 'no-store'
+    }
+    
+    params = event.get('queryStringParameters') or {}
+    rejection = check_request(method, params)
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    after = decode_cursor(params['cursor'])[:2] if params.get('cursor') else None
+    wait = parse_wait(params.get('wait')) if after else 0.0
+    
+    try:
+        page = poll_feed(after, parse_kinds(params.get('kinds')), parse_page_size(params.get('limit')), wait)
+        if wait > 0:
+            print(json.dumps({'event': 'feed_listener', **change_listener.snapshot()}))
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': encode_body(page),
+            'isBase64Encoded': False
+        }
+    
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
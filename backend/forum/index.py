@@ -3,16 +3,888 @@ Business: Manages forum topics - create, read, update status (open/close)
 Args: event with httpMethod, body (title, author_id, status)
 Returns: HTTP response with topic data or topics list
 '''
+import base64
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'forum'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+TEXT_ENCODED_TYPE_OIDS = frozenset((1082, 1083, 1114, 1184, 1186, 1266, 1700))
+
+class RowEncoder:
+    def __init__(self, description):
+        self.names = [column[0] for column in description]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.text_positions = [
+            position for position, column in enumerate(description) if column[1] in TEXT_ENCODED_TYPE_OIDS
+        ]
+    
+    def value(self, row: Tuple[Any, ...], name: str) -> Any:
+        return row[self.positions[name]]
+    
+    def record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(row)
+        for position in self.text_positions:
+            name = self.names[position]
+            if record[name] is not None:
+                record[name] = str(record[name])
+        return record
+    
+    def records(self, rows: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+        names = self.names
+        if not self.text_positions or not rows:
+            return [dict(zip(names, row)) for row in rows]
+        columns = [list(column) for column in zip(*rows)]
+        for position in self.text_positions:
+            columns[position] = [None if value is None else str(value) for value in columns[position]]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+DATABASE_REPLICA_URLS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '1'))
+READ_AFTER_HEADER = 'X-Read-After'
+
+REPLICA_STATUS_SQL = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text,
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END::float8
+"""
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    high, separator, low = (value or '').strip().partition('/')
+    if not separator:
+        return None
+    try:
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+class ReplicaRouter:
+    def __init__(self, pools: List[ConnectionPool], max_lag: float, check_interval: float):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status: Dict[int, Tuple[int, float, float]] = {}
+        self._leased: Dict[int, ConnectionPool] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats = {'reads': 0, 'fallbacks': 0, 'lagging': 0, 'behind': 0, 'errors': 0}
+    
+    def _cached_status(self, index: int) -> Optional[Tuple[int, float, float]]:
+        status = self._status.get(index)
+        if status is None or time.monotonic() - status[2] >= self.check_interval:
+            return None
+        return status
+    
+    def _probe(self, index: int, conn) -> Tuple[int, float, float]:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_STATUS_SQL)
+            replay_lsn, lag = cur.fetchone()
+        conn.rollback()
+        self._status[index] = (parse_lsn(replay_lsn) or 0, lag, time.monotonic())
+        return self._status[index]
+    
+    def _mark_failed(self, index: int) -> None:
+        self._status[index] = (0, float('inf'), time.monotonic())
+        self.stats['errors'] += 1
+    
+    def getconn(self, read_after: Optional[int]):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            pool = self.pools[index]
+            status = self._cached_status(index)
+            if status is not None and status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+                continue
+            
+            try:
+                conn = pool.getconn()
+            except psycopg2.Error:
+                self._mark_failed(index)
+                continue
+            
+            try:
+                if status is None or (read_after is not None and status[0] < read_after):
+                    status = self._probe(index, conn)
+            except psycopg2.Error:
+                pool.putconn(conn)
+                self._mark_failed(index)
+                continue
+            
+            if status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+            elif read_after is not None and status[0] < read_after:
+                self.stats['behind'] += 1
+            else:
+                with self._lock:
+                    self._leased[id(conn)] = pool
+                self.stats['reads'] += 1
+                return conn
+            pool.putconn(conn)
+        
+        self.stats['fallbacks'] += 1
+        return None
+    
+    def putconn(self, conn) -> bool:
+        with self._lock:
+            pool = self._leased.pop(id(conn), None)
+        if pool is None:
+            return False
+        pool.putconn(conn)
+        return True
+    
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, 'pools': len(self.pools)}
+
+replica_router = ReplicaRouter(
+    [
+        ConnectionPool(dsn, DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER)
+        for dsn in DATABASE_REPLICA_URLS
+    ],
+    REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL
+) if DATABASE_REPLICA_URLS else None
+
+def get_db_connection(read_only: bool = False, read_after: Optional[int] = None):
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        conn = replica_router.getconn(read_after) if read_only and replica_router is not None else None
+        return conn if conn is not None else db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    if replica_router is None or not replica_router.putconn(conn):
+        db_pool.putconn(conn)
+    snapshot = db_pool.snapshot()
+    if replica_router is not None:
+        snapshot['replicas'] = replica_router.snapshot()
+    print(json.dumps({'event': 'db_pool', **snapshot}))
+
+def read_after_headers(cur) -> Dict[str, str]:
+    if replica_router is None:
+        return {}
+    cur.execute("SELECT pg_current_wal_lsn()::text as lsn")
+    return {READ_AFTER_HEADER: cur.fetchone()['lsn'], 'Access-Control-Expose-Headers': READ_AFTER_HEADER}
+
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_REVOCATION_CHECK_INTERVAL = float(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '1'))
+
+class TokenCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked': 0}
+        self.revision: Optional[str] = None
+        self._synced_at = 0.0
+    
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+    
+    def put(self, key: str, user_id: int, expires_in: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def revocations_due(self, interval: float) -> bool:
+        with self._lock:
+            return self.revision is None or time.monotonic() - self._synced_at >= interval
+    
+    def revoke(self, keys: List[str], revision: str) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['revoked'] += 1
+            self.revision = revision
+            self._synced_at = time.monotonic()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return {**self.stats, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+token_cache = TokenCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'x-auth-token' and value:
+            return value
+    return None
+
+REVOCATIONS_SQL = """
+    WITH horizon AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin
+    )
+    SELECT h.xmin::text as horizon,
+           ARRAY(SELECT r.token_hash::text FROM session_revocations r
+                 WHERE r.txid >= COALESCE(%s::xid8, h.xmin)) as revoked
+    FROM horizon h
+"""
+
+def sync_revocations(cur) -> None:
+    cur.execute(REVOCATIONS_SQL, (token_cache.revision,))
+    row = cur.fetchone()
+    token_cache.revoke(row['revoked'], row['horizon'])
+
+def verify_token(cur, token: str) -> Optional[int]:
+    key = hash_token(token)
+    if token_cache.revocations_due(AUTH_REVOCATION_CHECK_INTERVAL):
+        sync_revocations(cur)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    cur.execute("""
+        SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as expires_in
+        FROM sessions
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP
+    """, (key,))
+    session = cur.fetchone()
+    print(json.dumps({'event': 'auth_cache', **token_cache.snapshot()}))
+    
+    if not session:
+        return None
+    
+    token_cache.put(key, session['user_id'], float(session['expires_in']))
+    return session['user_id']
+
+def resolve_user_id(event: Dict[str, Any], cur, claimed_id: Any) -> Tuple[Any, Optional[str]]:
+    token = get_auth_token(event)
+    if not token:
+        if AUTH_REQUIRED:
+            return None, 'Authentication required'
+        return claimed_id, None
+    
+    user_id = verify_token(cur, token)
+    if user_id is None:
+        return None, 'Invalid or expired token'
+    if claimed_id and str(claimed_id) != str(user_id):
+        return None, 'Token does not belong to this user'
+    return user_id, None
+
+TOPIC_SORT_ORDERS = {
+    'new': 't.created_at DESC, t.id DESC',
+    'activity': 't.last_activity_at DESC, t.id DESC'
+}
+
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '30'))
+COUNTER_TARGET = 'topic_view'
+COUNTER_FLUSH_SQL = """
+    WITH drained AS (
+        DELETE FROM counter_events WHERE target = %s RETURNING target_id, delta
+    ), totals AS (
+        SELECT target_id, SUM(delta) as delta FROM drained GROUP BY target_id
+    )
+    UPDATE forum_topics SET views = forum_topics.views + totals.delta
+    FROM totals
+    WHERE forum_topics.id = totals.target_id
+"""
+last_counter_flush = 0.0
+
+def record_counter_event(cur, target_id: Any) -> None:
+    cur.execute(
+        "INSERT INTO counter_events (target, target_id) VALUES (%s, %s)",
+        (COUNTER_TARGET, target_id)
+    )
+
+def flush_counters(cur) -> int:
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", ('counter_flush:' + COUNTER_TARGET,))
+    if not cur.fetchone()['locked']:
+        return 0
+    cur.execute(COUNTER_FLUSH_SQL, (COUNTER_TARGET,))
+    return cur.rowcount
+
+def maybe_flush_counters(conn, cur) -> None:
+    global last_counter_flush
+    now = time.monotonic()
+    if now - last_counter_flush < COUNTER_FLUSH_INTERVAL:
+        return
+    last_counter_flush = now
+    try:
+        flush_counters(cur)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(json.dumps({'event': 'counter_flush_failed', 'function': FUNCTION_NAME, 'error': str(e)}))
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', '/tmp/response_cache.sqlite3')
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+    
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+    
+    def generation(self, scope: str) -> int:
+        with self._lock:
+            return self._generations.get(scope, 0)
+    
+    def bump(self, scope: str) -> int:
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            return self._generations[scope]
+    
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+class SqliteCacheBackend:
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        import sqlite3
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, used_at REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS generations (scope TEXT PRIMARY KEY, value INTEGER)")
+        self._lock = threading.Lock()
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (now, key))
+            return row[0]
+    
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                key_used, size = self._db.execute(
+                    "SELECT key, LENGTH(value) FROM entries ORDER BY used_at LIMIT 1"
+                ).fetchone()
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key_used,))
+                count, total = count - 1, total - size
+                self.evictions += 1
+    
+    def generation(self, scope: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM generations WHERE scope = ?", (scope,)).fetchone()
+            return row[0] if row else 0
+    
+    def bump(self, scope: str) -> int:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO generations (scope, value) VALUES (?, 1) ON CONFLICT(scope) DO UPDATE SET value = value + 1",
+                (scope,)
+            )
+            return self._db.execute("SELECT value FROM generations WHERE scope = ?", (scope,)).fetchone()[0]
+    
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+            return {'entries': count, 'bytes': total}
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    
+    def key(self, scope: str, params: Dict[str, Any]) -> str:
+        normalized = sorted((name, str(value)) for name, value in params.items() if value not in (None, ''))
+        return '{}:{}:{}'.format(scope, self.backend.generation(scope), json.dumps(normalized))
+    
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+    
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value, self.ttl)
+    
+    def invalidate(self, scope: str) -> None:
+        self.backend.bump(scope)
+        self.stats['invalidations'] += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+        return {
+            **self.stats, **self.backend.size(),
+            'evictions': self.backend.evictions, 'hit_rate': round(hit_rate, 4)
+        }
+
+def create_cache_backend():
+    if RESPONSE_CACHE_BACKEND == 'sqlite':
+        return SqliteCacheBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+    return MemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+
+response_cache = ResponseCache(create_cache_backend(), RESPONSE_CACHE_TTL)
+
+CACHE_SCOPE = 'topics'
+
+def list_cache_key(params: Dict[str, Any]) -> str:
+    return response_cache.key(CACHE_SCOPE, {'sort': params.get('sort') or 'new'})
+
+def store_cached_response(cache_key: Optional[str], body: str) -> None:
+    if cache_key is None:
+        return
+    response_cache.set(cache_key, body)
+    print(json.dumps({'event': 'response_cache', **response_cache.snapshot()}))
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return '"' + digest[:32] + '"'
+
+def has_validators(event: Dict[str, Any]) -> bool:
+    return get_header(event, 'if-none-match') is not None
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    return any(candidate.strip() == etag for candidate in if_none_match.split(','))
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    if_none_match = get_header(event, 'if-none-match')
+    return if_none_match is not None and etag_matches(if_none_match, etag)
+
+def validator_headers(event: Dict[str, Any], etag: str, cache_control: str = 'no-cache') -> Dict[str, str]:
+    encoding = response_encoding(event)
+    if encoding is not None:
+        etag = etag[:-1] + '-' + encoding + '"'
+    return {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+def not_modified_response(headers: Dict[str, str], validators: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {**headers, **validators},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def list_response(event: Dict[str, Any], headers: Dict[str, str], body: str, cache_status: str) -> Dict[str, Any]:
+    validators = validator_headers(event, make_etag(body))
+    if is_not_modified(event, validators['ETag']):
+        return not_modified_response(headers, validators)
+    return {
+        'statusCode': 200,
+        'headers': {**headers, **validators, 'X-Cache': cache_status},
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def text_field(body: Dict[str, Any], name: str) -> str:
+    value = body.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+MAINTENANCE_TOKEN = os.environ.get('MAINTENANCE_TOKEN', '')
+MAINTENANCE_HEADER = 'X-Maintenance-Token'
+MAINTENANCE_ACTIONS = ('reconcile_stats', 'flush_counters')
+
+def is_maintenance_token(value: Optional[str]) -> bool:
+    return bool(MAINTENANCE_TOKEN) and hmac.compare_digest((value or '').encode(), MAINTENANCE_TOKEN.encode())
+
+def check_request(method: str, params: Dict[str, Any], body: Dict[str, Any], token: Optional[str],
+                  maintenance_token: Optional[str]) -> Optional[Tuple[int, str]]:
+    if method == 'GET':
+        if not params.get('id') and (params.get('sort') or 'new') not in TOPIC_SORT_ORDERS:
+            return 400, 'sort must be new or activity'
+        return None
+    
+    if method == 'PUT':
+        if not body.get('topic_id') or body.get('status') not in ['open', 'closed']:
+            return 400, 'topic_id and valid status required'
+        return None
+    
+    if method != 'POST':
+        return 405, 'Method not allowed'
+    
+    if body.get('action') in MAINTENANCE_ACTIONS and not is_maintenance_token(maintenance_token):
+        return 403, 'Valid maintenance token required'
+    if body.get('action') in MAINTENANCE_ACTIONS:
+        return None
+    if AUTH_REQUIRED and not token:
+        return 401, 'Authentication required'
+    if not text_field(body, 'title') or not (token or body.get('author_id')):
+        return 400, 'title and author_id are required'
+    return None
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +894,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, If-None-Match, If-Modified-Since, X-Read-After',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -34,110 +906,207 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    params = event.get('queryStringParameters') or {}
+    try:
+        body = parse_body(event) if method in ('POST', 'PUT') else {}
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    rejection = check_request(method, params, body, get_auth_token(event),
+                              get_header(event, MAINTENANCE_HEADER.lower()))
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    read_after = parse_lsn(get_header(event, READ_AFTER_HEADER.lower()))
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        cache_key = None
+        if method == 'GET':
+            if not params.get('id'):
+                cache_key = list_cache_key(params)
+                cached = response_cache.get(cache_key) if read_after is None else None
+                if cached is not None:
+                    return list_response(event, headers, cached, 'HIT')
+        
+        conn = get_db_connection(read_only=method == 'GET' and not params.get('id'), read_after=read_after)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
-            params = event.get('queryStringParameters') or {}
             topic_id = params.get('id')
             
             if topic_id:
-                cur.execute("""
-                    SELECT t.*, u.username as author_name,
-                           (SELECT COUNT(*) FROM forum_replies WHERE topic_id = t.id) as replies
-                    FROM forum_topics t
-                    JOIN users u ON t.author_id = u.id
-                    WHERE t.id = %s
-                """, (topic_id,))
-                topic = cur.fetchone()
+                validators = None
+                if has_validators(event):
+                    cur.execute("""
+                        SELECT t.id, t.xmin::text as row_version, u.username as author_name
+                        FROM forum_topics t
+                        JOIN users u ON t.author_id = u.id
+                        WHERE t.id = %s
+                    """, (topic_id,))
+                    meta = cur.fetchone()
+                    
+                    if meta:
+                        validators = validator_headers(
+                            event,
+                            make_etag('topic', meta['id'], meta['row_version'], meta['author_name'])
+                        )
+                        if not is_not_modified(event, validators['ETag']):
+                            validators = None
                 
-                if not topic:
-                    return {
-                        'statusCode': 404,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'Topic not found'}),
-                        'isBase64Encoded': False
-                    }
+                if validators is None:
+                    cur.execute("""
+                        SELECT t.*, t.xmin::text as row_version, u.username as author_name, t.reply_count as replies
+                        FROM forum_topics t
+                        JOIN users u ON t.author_id = u.id
+                        WHERE t.id = %s
+                    """, (topic_id,))
+                    topic = cur.fetchone()
+                    encoder = RowEncoder(cur.description)
+                    
+                    if not topic:
+                        return {
+                            'statusCode': 404,
+                            'headers': headers,
+                            'body': json.dumps({'error': 'Topic not found'}),
+                            'isBase64Encoded': False
+                        }
                 
-                cur.execute("UPDATE forum_topics SET views = views + 1 WHERE id = %s", (topic_id,))
+                record_counter_event(cur, topic_id)
                 conn.commit()
+                maybe_flush_counters(conn, cur)
+                
+                if validators is not None:
+                    return not_modified_response(headers, validators)
+                
+                validators = validator_headers(
+                    event,
+                    make_etag('topic', topic['id'], topic['row_version'], topic['author_name'])
+                )
+                topic = encoder.record(topic)
+                del topic['row_version']
                 
                 return {
                     'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'topic': dict(topic)}, default=str),
+                    'headers': {**headers, **validators},
+                    'body': encode_body({'topic': topic}),
                     'isBase64Encoded': False
                 }
             
-            cur.execute("""
-                SELECT t.*, u.username as author_name,
-                       (SELECT COUNT(*) FROM forum_replies WHERE topic_id = t.id) as replies
-                FROM forum_topics t
-                JOIN users u ON t.author_id = u.id
-                ORDER BY t.created_at DESC
-                LIMIT 50
-            """)
-            topics = [dict(row) for row in cur.fetchall()]
+            sort = params.get('sort') or 'new'
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'topics': topics}, default=str),
-                'isBase64Encoded': False
-            }
+            with conn.cursor() as rows_cur:
+                rows_cur.execute("""
+                    SELECT t.*, u.username as author_name, t.reply_count as replies
+                    FROM forum_topics t
+                    JOIN users u ON t.author_id = u.id
+                    ORDER BY """ + TOPIC_SORT_ORDERS[sort] + """
+                    LIMIT 50
+                """)
+                topics = RowEncoder(rows_cur.description).records(rows_cur.fetchall())
+            
+            response_body = encode_body({'topics': topics})
+            store_cached_response(cache_key, response_body)
+            
+            return list_response(event, headers, response_body, 'MISS')
         
         elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
+            if body.get('action') == 'reconcile_stats':
+                cur.execute("SELECT reconcile_forum_topic_stats() as fixed")
+                fixed = cur.fetchone()['fixed']
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'fixed': fixed}),
+                    'isBase64Encoded': False
+                }
+            
+            if body.get('action') == 'flush_counters':
+                flushed = flush_counters(cur)
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'flushed': flushed}),
+                    'isBase64Encoded': False
+                }
+            
             title = body.get('title', '').strip()
-            author_id = body.get('author_id')
+            author_id, auth_error = resolve_user_id(event, cur, body.get('author_id'))
             
-            if not title or not author_id:
+            if auth_error:
                 return {
-                    'statusCode': 400,
+                    'statusCode': 401,
                     'headers': headers,
-                    'body': json.dumps({'error': 'title and author_id are required'}),
+                    'body': json.dumps({'error': auth_error}),
                     'isBase64Encoded': False
                 }
             
             cur.execute("""
-                INSERT INTO forum_topics (title, author_id)
-                VALUES (%s, %s)
-                RETURNING id, title, author_id, status, views, created_at
+                WITH topic AS (
+                    INSERT INTO forum_topics (title, author_id)
+                    VALUES (%s, %s)
+                    RETURNING id, title, author_id, status, views, reply_count, last_activity_at, created_at
+                ), activity AS (
+                    INSERT INTO activity_events (kind, subject_id, actor_id, payload)
+                    SELECT 'topic_created', id, author_id, jsonb_build_object('title', title, 'status', status)
+                    FROM topic
+                )
+                SELECT * FROM topic
             """, (title, author_id))
             
-            topic = dict(cur.fetchone())
+            topic = RowEncoder(cur.description).record(cur.fetchone())
             conn.commit()
+            response_cache.invalidate(CACHE_SCOPE)
+            headers.update(read_after_headers(cur))
             
             return {
                 'statusCode': 201,
                 'headers': headers,
-                'body': json.dumps({'success': True, 'topic': topic}, default=str),
+                'body': encode_body({'success': True, 'topic': topic}),
                 'isBase64Encoded': False
             }
         
         elif method == 'PUT':
-            body = json.loads(event.get('body', '{}'))
             topic_id = body.get('topic_id')
             status = body.get('status')
             
-            if not topic_id or status not in ['open', 'closed']:
-                return {
-                    'statusCode': 400,
-                    'headers': headers,
-                    'body': json.dumps({'error': 'topic_id and valid status required'}),
-                    'isBase64Encoded': False
-                }
-            
-            cur.execute(
-                "UPDATE forum_topics SET status = %s, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *",
-                (status, topic_id)
-            )
+            cur.execute("""
+                WITH previous AS (
+                    SELECT id, status FROM forum_topics WHERE id = %(topic_id)s FOR UPDATE
+                ), topic AS (
+                    UPDATE forum_topics t
+                    SET status = %(status)s, updated_at = CURRENT_TIMESTAMP
+                    FROM previous
+                    WHERE t.id = previous.id
+                    RETURNING t.*
+                ), activity AS (
+                    INSERT INTO activity_events (kind, subject_id, actor_id, payload)
+                    SELECT 'topic_status_changed', topic.id, topic.author_id,
+                           jsonb_build_object('title', topic.title, 'status', topic.status, 'previous_status', previous.status)
+                    FROM topic
+                    JOIN previous ON previous.id = topic.id
+                    WHERE previous.status IS DISTINCT FROM topic.status
+                )
+                SELECT * FROM topic
+            """, {'topic_id': topic_id, 'status': status})
             
             topic = cur.fetchone()
+            encoder = RowEncoder(cur.description)
             
             if not topic:
                 return {
@@ -148,24 +1117,18 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 }
             
             conn.commit()
+            response_cache.invalidate(CACHE_SCOPE)
+            headers.update(read_after_headers(cur))
             
             return {
                 'statusCode': 200,
                 'headers': headers,
-                'body': json.dumps({'success': True, 'topic': dict(topic)}, default=str),
-                'isBase64Encoded': False
-            }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
+                'body': encode_body({'success': True, 'topic': encoder.record(topic)}),
                 'isBase64Encoded': False
             }
     
     except Exception as e:
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         return {
             'statusCode': 500,
@@ -177,4 +1140,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
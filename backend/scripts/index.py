@@ -3,16 +3,1075 @@ Business: Manages Lua scripts - create, read, update, like, download
 Args: event with httpMethod, body (title, code, category, author_id)
 Returns: HTTP response with script data or list of scripts
 '''
+import base64
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib
 import json
 import os
-from typing import Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'scripts'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        RealDictCursor = importlib.import_module('psycopg2.extras').RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+TEXT_ENCODED_TYPE_OIDS = frozenset((1082, 1083, 1114, 1184, 1186, 1266, 1700))
+
+class RowEncoder:
+    def __init__(self, description):
+        self.names = [column[0] for column in description]
+        self.positions = {name: position for position, name in enumerate(self.names)}
+        self.text_positions = [
+            position for position, column in enumerate(description) if column[1] in TEXT_ENCODED_TYPE_OIDS
+        ]
+    
+    def value(self, row: Tuple[Any, ...], name: str) -> Any:
+        return row[self.positions[name]]
+    
+    def record(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(row)
+        for position in self.text_positions:
+            name = self.names[position]
+            if record[name] is not None:
+                record[name] = str(record[name])
+        return record
+    
+    def records(self, rows: List[Tuple[Any, ...]]) -> List[Dict[str, Any]]:
+        names = self.names
+        if not self.text_positions or not rows:
+            return [dict(zip(names, row)) for row in rows]
+        columns = [list(column) for column in zip(*rows)]
+        for position in self.text_positions:
+            columns[position] = [None if value is None else str(value) for value in columns[position]]
+        return [dict(zip(names, row)) for row in zip(*columns)]
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+DATABASE_REPLICA_URLS = [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_CHECK_INTERVAL = float(os.environ.get('REPLICA_CHECK_INTERVAL', '1'))
+READ_AFTER_HEADER = 'X-Read-After'
+
+REPLICA_STATUS_SQL = """
+    SELECT CASE WHEN pg_is_in_recovery() THEN pg_last_wal_replay_lsn() ELSE pg_current_wal_lsn() END::text,
+           CASE WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+           END::float8
+"""
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    high, separator, low = (value or '').strip().partition('/')
+    if not separator:
+        return None
+    try:
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+class ReplicaRouter:
+    def __init__(self, pools: List[ConnectionPool], max_lag: float, check_interval: float):
+        self.pools = pools
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._status: Dict[int, Tuple[int, float, float]] = {}
+        self._leased: Dict[int, ConnectionPool] = {}
+        self._next = 0
+        self._lock = threading.Lock()
+        self.stats = {'reads': 0, 'fallbacks': 0, 'lagging': 0, 'behind': 0, 'errors': 0}
+    
+    def _cached_status(self, index: int) -> Optional[Tuple[int, float, float]]:
+        status = self._status.get(index)
+        if status is None or time.monotonic() - status[2] >= self.check_interval:
+            return None
+        return status
+    
+    def _probe(self, index: int, conn) -> Tuple[int, float, float]:
+        with conn.cursor() as cur:
+            cur.execute(REPLICA_STATUS_SQL)
+            replay_lsn, lag = cur.fetchone()
+        conn.rollback()
+        self._status[index] = (parse_lsn(replay_lsn) or 0, lag, time.monotonic())
+        return self._status[index]
+    
+    def _mark_failed(self, index: int) -> None:
+        self._status[index] = (0, float('inf'), time.monotonic())
+        self.stats['errors'] += 1
+    
+    def getconn(self, read_after: Optional[int]):
+        with self._lock:
+            start = self._next
+            self._next = (self._next + 1) % len(self.pools)
+        
+        for offset in range(len(self.pools)):
+            index = (start + offset) % len(self.pools)
+            pool = self.pools[index]
+            status = self._cached_status(index)
+            if status is not None and status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+                continue
+            
+            try:
+                conn = pool.getconn()
+            except psycopg2.Error:
+                self._mark_failed(index)
+                continue
+            
+            try:
+                if status is None or (read_after is not None and status[0] < read_after):
+                    status = self._probe(index, conn)
+            except psycopg2.Error:
+                pool.putconn(conn)
+                self._mark_failed(index)
+                continue
+            
+            if status[1] > self.max_lag:
+                self.stats['lagging'] += 1
+            elif read_after is not None and status[0] < read_after:
+                self.stats['behind'] += 1
+            else:
+                with self._lock:
+                    self._leased[id(conn)] = pool
+                self.stats['reads'] += 1
+                return conn
+            pool.putconn(conn)
+        
+        self.stats['fallbacks'] += 1
+        return None
+    
+    def putconn(self, conn) -> bool:
+        with self._lock:
+            pool = self._leased.pop(id(conn), None)
+        if pool is None:
+            return False
+        pool.putconn(conn)
+        return True
+    
+    def snapshot(self) -> Dict[str, int]:
+        return {**self.stats, 'pools': len(self.pools)}
+
+replica_router = ReplicaRouter(
+    [
+        ConnectionPool(dsn, DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER)
+        for dsn in DATABASE_REPLICA_URLS
+    ],
+    REPLICA_MAX_LAG_SECONDS, REPLICA_CHECK_INTERVAL
+) if DATABASE_REPLICA_URLS else None
+
+def get_db_connection(read_only: bool = False, read_after: Optional[int] = None):
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        conn = replica_router.getconn(read_after) if read_only and replica_router is not None else None
+        return conn if conn is not None else db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    if replica_router is None or not replica_router.putconn(conn):
+        db_pool.putconn(conn)
+    snapshot = db_pool.snapshot()
+    if replica_router is not None:
+        snapshot['replicas'] = replica_router.snapshot()
+    print(json.dumps({'event': 'db_pool', **snapshot}))
+
+def read_after_headers(cur) -> Dict[str, str]:
+    if replica_router is None:
+        return {}
+    cur.execute("SELECT pg_current_wal_lsn()::text as lsn")
+    return {READ_AFTER_HEADER: cur.fetchone()['lsn'], 'Access-Control-Expose-Headers': READ_AFTER_HEADER}
+
+def use_autocommit(conn) -> None:
+    if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        conn.commit()
+    conn.autocommit = True
+
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_REVOCATION_CHECK_INTERVAL = float(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '1'))
+
+class TokenCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked': 0}
+        self.revision: Optional[str] = None
+        self._synced_at = 0.0
+    
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+    
+    def put(self, key: str, user_id: int, expires_in: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def revocations_due(self, interval: float) -> bool:
+        with self._lock:
+            return self.revision is None or time.monotonic() - self._synced_at >= interval
+    
+    def revoke(self, keys: List[str], revision: str) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['revoked'] += 1
+            self.revision = revision
+            self._synced_at = time.monotonic()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return {**self.stats, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+token_cache = TokenCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'x-auth-token' and value:
+            return value
+    return None
+
+REVOCATIONS_SQL = """
+    WITH horizon AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin
+    )
+    SELECT h.xmin::text as horizon,
+           ARRAY(SELECT r.token_hash::text FROM session_revocations r
+                 WHERE r.txid >= COALESCE(%s::xid8, h.xmin)) as revoked
+    FROM horizon h
+"""
+
+def sync_revocations(cur) -> None:
+    cur.execute(REVOCATIONS_SQL, (token_cache.revision,))
+    row = cur.fetchone()
+    token_cache.revoke(row['revoked'], row['horizon'])
+
+def verify_token(cur, token: str) -> Optional[int]:
+    key = hash_token(token)
+    if token_cache.revocations_due(AUTH_REVOCATION_CHECK_INTERVAL):
+        sync_revocations(cur)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    cur.execute("""
+        SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as expires_in
+        FROM sessions
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP
+    """, (key,))
+    session = cur.fetchone()
+    print(json.dumps({'event': 'auth_cache', **token_cache.snapshot()}))
+    
+    if not session:
+        return None
+    
+    token_cache.put(key, session['user_id'], float(session['expires_in']))
+    return session['user_id']
+
+def resolve_user_id(event: Dict[str, Any], cur, claimed_id: Any) -> Tuple[Any, Optional[str]]:
+    token = get_auth_token(event)
+    if not token:
+        if AUTH_REQUIRED:
+            return None, 'Authentication required'
+        return claimed_id, None
+    
+    user_id = verify_token(cur, token)
+    if user_id is None:
+        return None, 'Invalid or expired token'
+    if claimed_id and str(claimed_id) != str(user_id):
+        return None, 'Token does not belong to this user'
+    return user_id, None
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+EXCERPT_LENGTH = 200
+
+LIST_COLUMNS = {
+    'summary': """
+        s.id, s.title, s.category, LEFT(s.description, %s) as excerpt,
+        s.likes, s.downloads, s.code_size, s.code_lines, s.created_at,
+        u.username as author_name, s.author_id
+    """,
+    'full': """
+        s.id, s.title, s.category, b.code, s.description, s.code_size, s.code_lines,
+        s.likes, s.downloads, s.created_at, u.username as author_name, s.author_id
+    """
+}
+LIST_JOINS = {
+    'summary': '',
+    'full': 'JOIN code_blobs b ON b.hash = s.code_hash'
+}
+DETAIL_COLUMNS = """
+    s.id, s.title, s.category, s.description, b.code, s.code_hash, s.code_size, s.code_lines,
+    s.likes, s.downloads, s.comment_count, s.created_at, s.updated_at, u.username as author_name, s.author_id
+"""
+
+CODE_HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+RAW_CODE_HEADERS = {
+    'Content-Type': 'text/x-lua; charset=utf-8',
+    'Access-Control-Allow-Origin': '*'
+}
+
+def hash_code(code: str) -> str:
+    return hashlib.sha256(code.encode()).hexdigest()
+
+def pack_cursor(values: List[Any]) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def unpack_cursor(cursor: str) -> List[Any]:
+    padded = cursor + '=' * (-len(cursor) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode()))
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    return pack_cursor([created_at.isoformat(), row_id])
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        created_at, row_id = unpack_cursor(cursor)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def encode_rank_cursor(rank: int) -> str:
+    return pack_cursor([rank])
+
+def decode_rank_cursor(cursor: str) -> int:
+    try:
+        rank, = unpack_cursor(cursor)
+        return int(rank)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def encode_search_cursor(score: float, row_id: int) -> str:
+    return pack_cursor([score, row_id])
+
+def decode_search_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        score, row_id = unpack_cursor(cursor)
+        return float(score), int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError('Invalid cursor')
+
+def parse_page_size(value: Optional[str]) -> int:
+    if value is None or value == '':
+        return DEFAULT_PAGE_SIZE
+    try:
+        size = int(value)
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    if size < 1:
+        raise ValueError('limit must be positive')
+    return min(size, MAX_PAGE_SIZE)
+
+SEARCH_MIN_LENGTH = 2
+SEARCH_MAX_LENGTH = 200
+SEARCH_HIGHLIGHT_OPTIONS = 'StartSel=<mark>, StopSel=</mark>, MaxWords=30, MinWords=10, MaxFragments=2'
+
+def search_scripts(cur, term: str, category: Optional[str], author_id: Optional[str],
+                   cursor: Optional[Tuple[float, int]], page_size: int) -> List[Dict[str, Any]]:
+    conditions = ["(s.search_vector @@ websearch_to_tsquery('simple', %(term)s) OR %(term)s <%% s.title)"]
+    query_params: Dict[str, Any] = {'term': term, 'limit': page_size + 1}
+    
+    if category:
+        conditions.append("s.category = %(category)s")
+        query_params['category'] = category
+    if author_id:
+        conditions.append("s.author_id = %(author_id)s")
+        query_params['author_id'] = author_id
+    
+    page_condition = ''
+    if cursor:
+        page_condition = "WHERE (score, id) < (%(cursor_score)s, %(cursor_id)s)"
+        query_params['cursor_score'], query_params['cursor_id'] = cursor
+    
+    cur.execute("""
+        WITH ranked AS (
+            SELECT s.id, s.title, s.category, s.description, s.likes, s.downloads,
+                   s.code_size, s.code_lines, s.created_at, s.author_id,
+                   (ts_rank_cd(s.search_vector, websearch_to_tsquery('simple', %(term)s))
+                    + word_similarity(%(term)s, s.title))::float8 as score
+            FROM scripts s
+            WHERE """ + " AND ".join(conditions) + """
+        ), page AS (
+            SELECT * FROM ranked
+            """ + page_condition + """
+            ORDER BY score DESC, id DESC
+            LIMIT %(limit)s
+        )
+        SELECT p.id, p.title, p.category, p.likes, p.downloads, p.code_size, p.code_lines,
+               p.created_at, p.author_id, u.username as author_name, p.score,
+               ts_headline('simple', p.title, websearch_to_tsquery('simple', %(term)s),
+                           'StartSel=<mark>, StopSel=</mark>, HighlightAll=true') as title_highlight,
+               ts_headline('simple', COALESCE(p.description, ''), websearch_to_tsquery('simple', %(term)s),
+                           %(highlight)s) as snippet
+        FROM page p
+        JOIN users u ON p.author_id = u.id
+        ORDER BY p.score DESC, p.id DESC
+    """, {**query_params, 'highlight': SEARCH_HIGHLIGHT_OPTIONS})
+    return RowEncoder(cur.description).records(cur.fetchall())
+
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '30'))
+COUNTER_TARGET = 'script_download'
+TRENDING_DOWNLOAD_WEIGHT = 0.25
+COUNTER_FLUSH_SQL = """
+    WITH drained AS (
+        DELETE FROM counter_events WHERE target = %s RETURNING target_id, delta
+    ), totals AS (
+        SELECT target_id, SUM(delta) as delta FROM drained GROUP BY target_id
+    ), bumped AS (
+        UPDATE scripts
+        SET downloads = scripts.downloads + totals.delta,
+            trending_score = trending_add(scripts.trending_score, trending_event(%s * totals.delta, CURRENT_TIMESTAMP))
+        FROM totals
+        WHERE scripts.id = totals.target_id
+        RETURNING scripts.author_id, totals.delta
+    ), author_stats AS (
+        INSERT INTO user_stats (user_id, downloads_received)
+        SELECT author_id, SUM(delta) FROM bumped WHERE author_id IS NOT NULL GROUP BY author_id
+        ON CONFLICT (user_id) DO UPDATE
+        SET downloads_received = user_stats.downloads_received + EXCLUDED.downloads_received,
+            updated_at = CURRENT_TIMESTAMP
+    )
+    SELECT COUNT(*) as flushed FROM bumped
+"""
+last_counter_flush = 0.0
+
+def record_counter_event(cur, target_id: Any) -> None:
+    cur.execute(
+        "INSERT INTO counter_events (target, target_id) VALUES (%s, %s)",
+        (COUNTER_TARGET, target_id)
+    )
+
+def flush_counters(cur) -> int:
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", ('counter_flush:' + COUNTER_TARGET,))
+    if not cur.fetchone()['locked']:
+        return 0
+    cur.execute(COUNTER_FLUSH_SQL, (COUNTER_TARGET, TRENDING_DOWNLOAD_WEIGHT))
+    return cur.fetchone()['flushed']
+
+def maybe_flush_counters(conn, cur) -> None:
+    global last_counter_flush
+    now = time.monotonic()
+    if now - last_counter_flush < COUNTER_FLUSH_INTERVAL:
+        return
+    last_counter_flush = now
+    try:
+        flush_counters(cur)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(json.dumps({'event': 'counter_flush_failed', 'function': FUNCTION_NAME, 'error': str(e)}))
+
+SCRIPT_SORTS = ('new', 'top', 'trending')
+RANKING_DEPTH = int(os.environ.get('RANKING_DEPTH', '10000'))
+
+def refresh_rankings(cur, max_age: float) -> int:
+    cur.execute("SELECT refresh_script_rankings(%s, %s) as ranked", (int(max_age), RANKING_DEPTH))
+    return cur.fetchone()['ranked']
+
+REPUTATION_FOLD_BATCH = int(os.environ.get('REPUTATION_FOLD_BATCH', '5000'))
+
+def fold_reputation(cur) -> int:
+    cur.execute("SELECT fold_reputation_ledger(%s) as folded", (REPUTATION_FOLD_BATCH,))
+    return cur.fetchone()['folded']
+
+RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')
+RESPONSE_CACHE_TTL = float(os.environ.get('RESPONSE_CACHE_TTL', '30'))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', '1000'))
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+RESPONSE_CACHE_PATH = os.environ.get('RESPONSE_CACHE_PATH', '/tmp/response_cache.sqlite3')
+
+class MemoryCacheBackend:
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+    
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._bytes += len(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+    
+    def _remove(self, key: str) -> None:
+        value, _ = self._entries.pop(key)
+        self._bytes -= len(value)
+    
+    def generation(self, scope: str) -> int:
+        with self._lock:
+            return self._generations.get(scope, 0)
+    
+    def bump(self, scope: str) -> int:
+        with self._lock:
+            self._generations[scope] = self._generations.get(scope, 0) + 1
+            return self._generations[scope]
+    
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes}
+
+class SqliteCacheBackend:
+    def __init__(self, path: str, max_entries: int, max_bytes: int):
+        import sqlite3
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self._db = sqlite3.connect(path, timeout=1, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT, expires_at REAL, used_at REAL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS generations (scope TEXT PRIMARY KEY, value INTEGER)")
+        self._lock = threading.Lock()
+        self.evictions = 0
+    
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT value, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                return None
+            self._db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (now, key))
+            return row[0]
+    
+    def set(self, key: str, value: str, ttl: float) -> None:
+        if len(value) > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, value, expires_at, used_at) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now)
+            )
+            self._db.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+            while count > self.max_entries or total > self.max_bytes:
+                key_used, size = self._db.execute(
+                    "SELECT key, LENGTH(value) FROM entries ORDER BY used_at LIMIT 1"
+                ).fetchone()
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key_used,))
+                count, total = count - 1, total - size
+                self.evictions += 1
+    
+    def generation(self, scope: str) -> int:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM generations WHERE scope = ?", (scope,)).fetchone()
+            return row[0] if row else 0
+    
+    def bump(self, scope: str) -> int:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO generations (scope, value) VALUES (?, 1) ON CONFLICT(scope) DO UPDATE SET value = value + 1",
+                (scope,)
+            )
+            return self._db.execute("SELECT value FROM generations WHERE scope = ?", (scope,)).fetchone()[0]
+    
+    def size(self) -> Dict[str, int]:
+        with self._lock:
+            count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM entries").fetchone()
+            return {'entries': count, 'bytes': total}
+
+class ResponseCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+    
+    def key(self, scope: str, params: Dict[str, Any]) -> str:
+        normalized = sorted((name, str(value)) for name, value in params.items() if value not in (None, ''))
+        return '{}:{}:{}'.format(scope, self.backend.generation(scope), json.dumps(normalized))
+    
+    def get(self, key: str) -> Optional[str]:
+        value = self.backend.get(key)
+        self.stats['hits' if value is not None else 'misses'] += 1
+        return value
+    
+    def set(self, key: str, value: str) -> None:
+        self.backend.set(key, value, self.ttl)
+    
+    def invalidate(self, scope: str) -> None:
+        self.backend.bump(scope)
+        self.stats['invalidations'] += 1
+    
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats['hits'] + self.stats['misses']
+        hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+        return {
+            **self.stats, **self.backend.size(),
+            'evictions': self.backend.evictions, 'hit_rate': round(hit_rate, 4)
+        }
+
+def create_cache_backend():
+    if RESPONSE_CACHE_BACKEND == 'sqlite':
+        return SqliteCacheBackend(RESPONSE_CACHE_PATH, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+    return MemoryCacheBackend(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_MAX_BYTES)
+
+response_cache = ResponseCache(create_cache_backend(), RESPONSE_CACHE_TTL)
+
+CACHE_SCOPE = 'scripts'
+
+def list_cache_key(params: Dict[str, Any]) -> str:
+    return response_cache.key(CACHE_SCOPE, {
+        'category': params.get('category'),
+        'author_id': params.get('author_id'),
+        'search': (params.get('search') or '').strip(),
+        'view': params.get('view') or 'summary',
+        'sort': params.get('sort') or 'new',
+        'limit': params.get('limit') or DEFAULT_PAGE_SIZE,
+        'cursor': params.get('cursor')
+    })
+
+def store_cached_response(cache_key: Optional[str], body: str) -> None:
+    if cache_key is None:
+        return
+    response_cache.set(cache_key, body)
+    print(json.dumps({'event': 'response_cache', **response_cache.snapshot()}))
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def make_etag(*parts: Any) -> str:
+    digest = hashlib.sha256(':'.join(str(part) for part in parts).encode()).hexdigest()
+    return '"' + digest[:32] + '"'
+
+def has_validators(event: Dict[str, Any]) -> bool:
+    return get_header(event, 'if-none-match') is not None
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if if_none_match.strip() == '*':
+        return True
+    return any(candidate.strip() == etag for candidate in if_none_match.split(','))
+
+def is_not_modified(event: Dict[str, Any], etag: str) -> bool:
+    if_none_match = get_header(event, 'if-none-match')
+    return if_none_match is not None and etag_matches(if_none_match, etag)
+
+def validator_headers(event: Dict[str, Any], etag: str, cache_control: str = 'no-cache') -> Dict[str, str]:
+    encoding = response_encoding(event)
+    if encoding is not None:
+        etag = etag[:-1] + '-' + encoding + '"'
+    return {'ETag': etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+
+def not_modified_response(headers: Dict[str, str], validators: Dict[str, str]) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': {**headers, **validators},
+        'body': '',
+        'isBase64Encoded': False
+    }
+
+def list_response(event: Dict[str, Any], headers: Dict[str, str], body: str, cache_status: str) -> Dict[str, Any]:
+    validators = validator_headers(event, make_etag(body))
+    if is_not_modified(event, validators['ETag']):
+        return not_modified_response(headers, validators)
+    return {
+        'statusCode': 200,
+        'headers': {**headers, **validators, 'X-Cache': cache_status},
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def text_field(body: Dict[str, Any], name: str) -> str:
+    value = body.get(name)
+    return value.strip() if isinstance(value, str) else ''
+
+MAINTENANCE_TOKEN = os.environ.get('MAINTENANCE_TOKEN', '')
+MAINTENANCE_HEADER = 'X-Maintenance-Token'
+MAINTENANCE_ACTIONS = ('flush_counters', 'refresh_rankings', 'fold_reputation')
+
+def is_maintenance_token(value: Optional[str]) -> bool:
+    return bool(MAINTENANCE_TOKEN) and hmac.compare_digest((value or '').encode(), MAINTENANCE_TOKEN.encode())
+
+def check_request(method: str, params: Dict[str, Any], body: Dict[str, Any], token: Optional[str],
+                  maintenance_token: Optional[str]) -> Optional[Tuple[int, str]]:
+    if method == 'GET':
+        code_hash = params.get('hash')
+        if code_hash and not CODE_HASH_PATTERN.match(code_hash):
+            return 400, 'hash must be 64 lowercase hex characters'
+        if code_hash or params.get('id'):
+            return None
+        
+        search = (params.get('search') or '').strip()
+        sort = params.get('sort') or 'new'
+        if search and not SEARCH_MIN_LENGTH <= len(search) <= SEARCH_MAX_LENGTH:
+            return 400, 'search must be 2 to 200 characters'
+        if sort not in SCRIPT_SORTS:
+            return 400, 'sort must be new, top or trending'
+        if search and sort != 'new':
+            return 400, 'sort cannot be combined with search'
+        if not search and (params.get('view') or 'summary') not in LIST_COLUMNS:
+            return 400, 'view must be summary or full'
+        try:
+            parse_page_size(params.get('limit'))
+            if params.get('cursor'):
+                decode = decode_search_cursor if search else decode_cursor if sort == 'new' else decode_rank_cursor
+                decode(params['cursor'])
+        except ValueError as e:
+            return 400, str(e)
+        return None
+    
+    if method != 'POST':
+        return 405, 'Method not allowed'
+    
+    action = body.get('action')
+    if action not in ('create', 'like', 'download', 'flush_counters', 'refresh_rankings', 'fold_reputation'):
+        return 400, 'Invalid action'
+    if action in MAINTENANCE_ACTIONS and not is_maintenance_token(maintenance_token):
+        return 403, 'Valid maintenance token required'
+    if action in ('create', 'like') and AUTH_REQUIRED and not token:
+        return 401, 'Authentication required'
+    if action == 'create':
+        if not text_field(body, 'title') or not text_field(body, 'code') or not text_field(body, 'category'):
+            return 400, 'Title, code, category and author_id are required'
+        if not token and not body.get('author_id'):
+            return 400, 'Title, code, category and author_id are required'
+    if action == 'like' and (not body.get('script_id') or not (token or body.get('user_id'))):
+        return 400, 'script_id and user_id are required'
+    if action == 'download' and not body.get('script_id'):
+        return 400, 'script_id is required'
+    return None
+
+@instrumented
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -22,7 +1081,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, If-None-Match, If-Modified-Since, X-Read-After',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
@@ -34,27 +1093,121 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         'Access-Control-Allow-Origin': '*'
     }
     
+    params = event.get('queryStringParameters') or {}
+    try:
+        body = parse_body(event) if method == 'POST' else {}
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    rejection = check_request(method, params, body, get_auth_token(event),
+                              get_header(event, MAINTENANCE_HEADER.lower()))
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    read_after = parse_lsn(get_header(event, READ_AFTER_HEADER.lower()))
     conn = None
     cur = None
     
     try:
-        conn = get_db_connection()
+        cache_key = None
+        if method == 'GET':
+            if not params.get('id') and not params.get('hash'):
+                cache_key = list_cache_key(params)
+                cached = response_cache.get(cache_key) if read_after is None else None
+                if cached is not None:
+                    return list_response(event, headers, cached, 'HIT')
+        
+        conn = get_db_connection(read_only=method == 'GET', read_after=read_after)
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
         if method == 'GET':
-            params = event.get('queryStringParameters') or {}
             category = params.get('category')
             author_id = params.get('author_id')
             script_id = params.get('id')
+            code_hash = params.get('hash')
+            
+            if code_hash or (script_id and params.get('raw') in ('1', 'true')):
+                immutable = code_hash is not None
+                if not immutable:
+                    cur.execute("SELECT code_hash FROM scripts WHERE id = %s", (script_id,))
+                    row = cur.fetchone()
+                    code_hash = row['code_hash'] if row else None
+                
+                if code_hash is None:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Script not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                validators = validator_headers(
+                    event,
+                    '"' + code_hash + '"',
+                    'public, max-age=31536000, immutable' if immutable else 'no-cache'
+                )
+                if is_not_modified(event, validators['ETag']):
+                    return not_modified_response(RAW_CODE_HEADERS, validators)
+                
+                cur.execute("SELECT code FROM code_blobs WHERE hash = %s", (code_hash,))
+                blob = cur.fetchone()
+                
+                if not blob:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Code not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {
+                        **RAW_CODE_HEADERS,
+                        **validators,
+                        'Content-Disposition': 'attachment; filename="{}.lua"'.format(code_hash[:12])
+                    },
+                    'body': blob['code'],
+                    'isBase64Encoded': False
+                }
             
             if script_id:
+                if has_validators(event):
+                    cur.execute("""
+                        SELECT s.id, s.xmin::text as row_version, u.username as author_name
+                        FROM scripts s
+                        JOIN users u ON s.author_id = u.id
+                        WHERE s.id = %s
+                    """, (script_id,))
+                    meta = cur.fetchone()
+                    
+                    if meta:
+                        validators = validator_headers(
+                            event,
+                            make_etag('script', meta['id'], meta['row_version'], meta['author_name'])
+                        )
+                        if is_not_modified(event, validators['ETag']):
+                            return not_modified_response(headers, validators)
+                
                 cur.execute("""
-                    SELECT s.*, u.username as author_name 
-                    FROM scripts s 
-                    JOIN users u ON s.author_id = u.id 
+                    SELECT """ + DETAIL_COLUMNS + """, s.xmin::text as row_version
+                    FROM scripts s
+                    JOIN users u ON s.author_id = u.id
+                    JOIN code_blobs b ON b.hash = s.code_hash
                     WHERE s.id = %s
                 """, (script_id,))
                 script = cur.fetchone()
+                encoder = RowEncoder(cur.description)
                 
                 if not script:
                     return {
@@ -64,42 +1217,102 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                         'isBase64Encoded': False
                     }
                 
+                validators = validator_headers(
+                    event,
+                    make_etag('script', script['id'], script['row_version'], script['author_name'])
+                )
+                script = encoder.record(script)
+                del script['row_version']
+                
                 return {
                     'statusCode': 200,
-                    'headers': headers,
-                    'body': json.dumps({'script': dict(script)}, default=str),
+                    'headers': {**headers, **validators},
+                    'body': encode_body({'script': script}),
                     'isBase64Encoded': False
                 }
             
-            query = """
-                SELECT s.id, s.title, s.category, s.code, s.description, 
-                       s.likes, s.downloads, s.created_at, u.username as author_name, s.author_id
-                FROM scripts s
-                JOIN users u ON s.author_id = u.id
-            """
-            query_params = []
+            search = (params.get('search') or '').strip()
+            
+            if search:
+                page_size = parse_page_size(params.get('limit'))
+                cursor = decode_search_cursor(params['cursor']) if params.get('cursor') else None
+                
+                with conn.cursor() as rows_cur:
+                    scripts = search_scripts(rows_cur, search, category, author_id, cursor, page_size)
+                
+                next_cursor = None
+                if len(scripts) > page_size:
+                    scripts = scripts[:page_size]
+                    last = scripts[-1]
+                    next_cursor = encode_search_cursor(last['score'], last['id'])
+                
+                response_body = encode_body({'scripts': scripts, 'next_cursor': next_cursor})
+                store_cached_response(cache_key, response_body)
+                
+                return list_response(event, headers, response_body, 'MISS')
+            
+            view = params.get('view') or 'summary'
+            sort = params.get('sort') or 'new'
+            page_size = parse_page_size(params.get('limit'))
+            
+            if sort == 'new':
+                cursor = decode_cursor(params['cursor']) if params.get('cursor') else None
+                query = "SELECT " + LIST_COLUMNS[view] + """
+                    FROM scripts s
+                    JOIN users u ON s.author_id = u.id
+                """ + LIST_JOINS[view]
+            else:
+                cursor = decode_rank_cursor(params['cursor']) if params.get('cursor') else None
+                query = "SELECT " + LIST_COLUMNS[view] + """, r.rank
+                    FROM script_rankings r
+                    JOIN scripts s ON s.id = r.script_id
+                    JOIN users u ON s.author_id = u.id
+                """ + LIST_JOINS[view]
+            conditions = []
+            query_params = [EXCERPT_LENGTH] if view == 'summary' else []
             
+            if sort != 'new':
+                conditions.append("r.ranking = %s")
+                query_params.append(sort)
             if category:
-                query += " WHERE s.category = %s"
+                conditions.append("s.category = %s")
                 query_params.append(category)
-            elif author_id:
-                query += " WHERE s.author_id = %s"
+            if author_id:
+                conditions.append("s.author_id = %s")
                 query_params.append(author_id)
+            if cursor and sort == 'new':
+                conditions.append("(s.created_at, s.id) < (%s, %s)")
+                query_params.extend(cursor)
+            elif cursor:
+                conditions.append("r.rank > %s")
+                query_params.append(cursor)
             
-            query += " ORDER BY s.created_at DESC LIMIT 50"
+            if conditions:
+                query += " WHERE " + " AND ".join(conditions)
             
-            cur.execute(query, query_params)
-            scripts = [dict(row) for row in cur.fetchall()]
+            query += " ORDER BY s.created_at DESC, s.id DESC" if sort == 'new' else " ORDER BY r.rank"
+            query += " LIMIT %s"
+            query_params.append(page_size + 1)
             
-            return {
-                'statusCode': 200,
-                'headers': headers,
-                'body': json.dumps({'scripts': scripts}, default=str),
-                'isBase64Encoded': False
-            }
+            with conn.cursor() as rows_cur:
+                rows_cur.execute(query, query_params)
+                encoder = RowEncoder(rows_cur.description)
+                rows = rows_cur.fetchall()
+            
+            next_cursor = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                if sort == 'new':
+                    next_cursor = encode_cursor(encoder.value(rows[-1], 'created_at'), encoder.value(rows[-1], 'id'))
+                else:
+                    next_cursor = encode_rank_cursor(encoder.value(rows[-1], 'rank'))
+            
+            response_body = encode_body({'scripts': encoder.records(rows), 'next_cursor': next_cursor})
+            store_cached_response(cache_key, response_body)
+            
+            return list_response(event, headers, response_body, 'MISS')
         
         elif method == 'POST':
-            body = json.loads(event.get('body', '{}'))
             action = body.get('action')
             
             if action == 'create':
@@ -107,81 +1320,140 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 code = body.get('code', '').strip()
                 category = body.get('category', '').strip()
                 description = body.get('description', '').strip()
-                author_id = body.get('author_id')
+                author_id, auth_error = resolve_user_id(event, cur, body.get('author_id'))
                 
-                if not title or not code or not category or not author_id:
+                if auth_error:
                     return {
-                        'statusCode': 400,
+                        'statusCode': 401,
                         'headers': headers,
-                        'body': json.dumps({'error': 'Title, code, category and author_id are required'}),
+                        'body': json.dumps({'error': auth_error}),
                         'isBase64Encoded': False
                     }
                 
+                use_autocommit(conn)
                 cur.execute("""
-                    INSERT INTO scripts (title, code, category, description, author_id)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id, title, code, category, description, author_id, likes, downloads, created_at
-                """, (title, code, category, description, author_id))
-                
-                script = dict(cur.fetchone())
+                    WITH input AS (
+                        SELECT %(title)s::text as title, %(code)s::text as code, %(code_hash)s::char(64) as code_hash
+                    ), blob AS (
+                        INSERT INTO code_blobs (hash, code)
+                        SELECT code_hash, code FROM input
+                        ON CONFLICT (hash) DO NOTHING
+                    ), script AS (
+                        INSERT INTO scripts (title, code_hash, category, description, author_id,
+                                             code_size, code_lines, search_vector)
+                        SELECT title, code_hash, %(category)s, %(description)s, %(author_id)s,
+                               octet_length(code), code_line_count(code),
+                               scripts_search_vector(title, %(description)s, code)
+                        FROM input
+                        RETURNING id, title, code_hash, category, description, author_id, code_size, code_lines, likes, downloads, created_at
+                    ), author AS (
+                        INSERT INTO reputation_ledger (user_id, delta, reason, source_id)
+                        SELECT author_id, 10, 'script_created', id FROM script WHERE author_id IS NOT NULL
+                        RETURNING user_id, delta
+                    ), author_stats AS (
+                        INSERT INTO user_stats (user_id, scripts_authored)
+                        SELECT author_id, 1 FROM script WHERE author_id IS NOT NULL
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET scripts_authored = user_stats.scripts_authored + 1,
+                            updated_at = CURRENT_TIMESTAMP
+                    ), activity AS (
+                        INSERT INTO activity_events (kind, subject_id, actor_id, payload)
+                        SELECT 'script_created', id, author_id,
+                               jsonb_build_object('title', title, 'category', category)
+                        FROM script
+                    )
+                    SELECT script.*, input.code,
+                           (SELECT u.reputation + pending_reputation(u.id) + author.delta
+                            FROM author JOIN users u ON u.id = author.user_id) as author_reputation
+                    FROM script, input
+                """, {
+                    'title': title, 'code': code, 'code_hash': hash_code(code),
+                    'category': category, 'description': description, 'author_id': author_id
+                })
                 
-                cur.execute("UPDATE users SET reputation = reputation + 10 WHERE id = %s", (author_id,))
-                
-                conn.commit()
+                script = RowEncoder(cur.description).record(cur.fetchone())
+                response_cache.invalidate(CACHE_SCOPE)
+                headers.update(read_after_headers(cur))
                 
                 return {
                     'statusCode': 201,
                     'headers': headers,
-                    'body': json.dumps({'success': True, 'script': script}, default=str),
+                    'body': encode_body({'success': True, 'script': script}),
                     'isBase64Encoded': False
                 }
             
             elif action == 'like':
                 script_id = body.get('script_id')
-                user_id = body.get('user_id')
+                user_id, auth_error = resolve_user_id(event, cur, body.get('user_id'))
                 
-                if not script_id or not user_id:
+                if auth_error:
                     return {
-                        'statusCode': 400,
+                        'statusCode': 401,
                         'headers': headers,
-                        'body': json.dumps({'error': 'script_id and user_id are required'}),
+                        'body': json.dumps({'error': auth_error}),
                         'isBase64Encoded': False
                     }
                 
-                cur.execute(
-                    "INSERT INTO script_likes (script_id, user_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
-                    (script_id, user_id)
-                )
+                use_autocommit(conn)
+                cur.execute("""
+                    WITH liked AS (
+                        INSERT INTO script_likes (script_id, user_id)
+                        VALUES (%s, %s)
+                        ON CONFLICT DO NOTHING
+                        RETURNING script_id
+                    ), script AS (
+                        UPDATE scripts s
+                        SET likes = s.likes + 1,
+                            trending_score = trending_add(s.trending_score, trending_event(1, CURRENT_TIMESTAMP))
+                        FROM liked
+                        WHERE s.id = liked.script_id
+                        RETURNING s.id, s.likes, s.author_id
+                    ), author AS (
+                        INSERT INTO reputation_ledger (user_id, delta, reason, source_id)
+                        SELECT author_id, 1, 'like_received', id FROM script WHERE author_id IS NOT NULL
+                        RETURNING delta
+                    ), author_stats AS (
+                        INSERT INTO user_stats (user_id, likes_received)
+                        SELECT author_id, 1 FROM script WHERE author_id IS NOT NULL
+                        ON CONFLICT (user_id) DO UPDATE
+                        SET likes_received = user_stats.likes_received + 1,
+                            updated_at = CURRENT_TIMESTAMP
+                    )
+                    SELECT EXISTS (SELECT 1 FROM liked) as liked,
+                           COALESCE((SELECT likes FROM script), s.likes) as likes,
+                           u.reputation + pending_reputation(u.id) + COALESCE((SELECT delta FROM author), 0) as author_reputation
+                    FROM scripts s
+                    LEFT JOIN users u ON u.id = s.author_id
+                    WHERE s.id = %s
+                """, (script_id, user_id, script_id))
                 
-                if cur.rowcount > 0:
-                    cur.execute("UPDATE scripts SET likes = likes + 1 WHERE id = %s", (script_id,))
-                    cur.execute("SELECT author_id FROM scripts WHERE id = %s", (script_id,))
-                    author = cur.fetchone()
-                    if author:
-                        cur.execute("UPDATE users SET reputation = reputation + 1 WHERE id = %s", (author['author_id'],))
+                result = cur.fetchone()
                 
-                conn.commit()
+                if not result:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'Script not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                if result['liked']:
+                    response_cache.invalidate(CACHE_SCOPE)
+                    headers.update(read_after_headers(cur))
                 
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'success': True}),
+                    'body': json.dumps({'success': True, **dict(result)}),
                     'isBase64Encoded': False
                 }
             
             elif action == 'download':
                 script_id = body.get('script_id')
                 
-                if not script_id:
-                    return {
-                        'statusCode': 400,
-                        'headers': headers,
-                        'body': json.dumps({'error': 'script_id is required'}),
-                        'isBase64Encoded': False
-                    }
-                
-                cur.execute("UPDATE scripts SET downloads = downloads + 1 WHERE id = %s", (script_id,))
+                record_counter_event(cur, script_id)
                 conn.commit()
+                maybe_flush_counters(conn, cur)
                 
                 return {
                     'statusCode': 200,
@@ -190,24 +1462,42 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'isBase64Encoded': False
                 }
             
-            else:
+            elif action == 'flush_counters':
+                flushed = flush_counters(cur)
+                conn.commit()
+                
                 return {
-                    'statusCode': 400,
+                    'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps({'error': 'Invalid action'}),
+                    'body': json.dumps({'success': True, 'flushed': flushed}),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'refresh_rankings':
+                ranked = refresh_rankings(cur, 0)
+                conn.commit()
+                response_cache.invalidate(CACHE_SCOPE)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'ranked': ranked}),
+                    'isBase64Encoded': False
+                }
+            
+            elif action == 'fold_reputation':
+                folded = fold_reputation(cur)
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'folded': folded}),
                     'isBase64Encoded': False
                 }
-        
-        else:
-            return {
-                'statusCode': 405,
-                'headers': headers,
-                'body': json.dumps({'error': 'Method not allowed'}),
-                'isBase64Encoded': False
-            }
     
     except Exception as e:
-        if conn:
+        if conn and not conn.closed:
             conn.rollback()
         return {
             'statusCode': 500,
@@ -219,4 +1509,4 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         if cur:
             cur.close()
         if conn:
-            conn.close()
+            release_db_connection(conn)
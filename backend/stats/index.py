@@ -0,0 +1,725 @@
+'''
+Business: Serves per-user statistics and leaderboards, ingests activity heartbeats
+Args: event with httpMethod, queryStringParameters (user_id or leaderboard, limit), body (action, user_id)
+Returns: HTTP response with user stats or leaderboard entries
+'''
+import base64
+import functools
+import gzip
+import hashlib
+import hmac
+import importlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', '100'))
+QUERY_SLOW_SAMPLE_RATE = float(os.environ.get('QUERY_SLOW_SAMPLE_RATE', '1.0'))
+FUNCTION_NAME = 'stats'
+RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+RESPONSE_GZIP_LEVEL = int(os.environ.get('RESPONSE_GZIP_LEVEL', '6'))
+RESPONSE_BROTLI_QUALITY = int(os.environ.get('RESPONSE_BROTLI_QUALITY', '5'))
+
+class RequestMetrics:
+    def __init__(self):
+        self.phases = {'connect': 0.0, 'query': 0.0, 'serialize': 0.0, 'compress': 0.0}
+        self.statements = 0
+        self.rows = 0
+    
+    def add(self, phase: str, started: float) -> None:
+        self.phases[phase] += (time.perf_counter() - started) * 1000
+    
+    def server_timing(self, total_ms: float) -> str:
+        entries = ['{};dur={:.1f}'.format(phase, ms) for phase, ms in self.phases.items()]
+        entries.append('total;dur={:.1f}'.format(total_ms))
+        return ', '.join(entries)
+
+request_metrics = threading.local()
+
+def current_metrics() -> Optional[RequestMetrics]:
+    return getattr(request_metrics, 'current', None)
+
+def redact_statement(statement: str) -> str:
+    statement = re.sub(r"'(?:[^']|'')*'", "'?'", statement)
+    statement = re.sub(r'\b\d+(?:\.\d+)?\b', '?', statement)
+    return ' '.join(statement.split())
+
+def redact_params(params: Any) -> Any:
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {key: type(value).__name__ for key, value in params.items()}
+    return [type(value).__name__ for value in params]
+
+def log_slow_query(cur, query: Any, params: Any, elapsed_ms: float) -> None:
+    if hasattr(query, 'as_string'):
+        query = query.as_string(cur)
+    if isinstance(query, bytes):
+        query = query.decode(errors='replace')
+    print(json.dumps({
+        'event': 'slow_query',
+        'function': FUNCTION_NAME,
+        'ms': round(elapsed_ms, 1),
+        'statement': redact_statement(query),
+        'params': redact_params(params)
+    }))
+
+instrumented_cursor_classes: Dict[Any, Any] = {}
+
+def instrumented_cursor_class(base):
+    if base not in instrumented_cursor_classes:
+        class InstrumentedCursor(base):
+            def execute(self, query, params=None):
+                metrics = current_metrics()
+                if metrics is None:
+                    return super().execute(query, params)
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, params)
+                finally:
+                    elapsed_ms = (time.perf_counter() - started) * 1000
+                    metrics.phases['query'] += elapsed_ms
+                    metrics.statements += 1
+                    if self.description is not None and self.rowcount > 0:
+                        metrics.rows += self.rowcount
+                    if elapsed_ms >= QUERY_SLOW_MS and random.random() < QUERY_SLOW_SAMPLE_RATE:
+                        log_slow_query(self, query, params, elapsed_ms)
+        instrumented_cursor_classes[base] = InstrumentedCursor
+    return instrumented_cursor_classes[base]
+
+psycopg2: Any = None
+RealDictCursor: Any = None
+InstrumentedConnection: Any = None
+db_stack_lock = threading.Lock()
+
+def load_db_stack() -> None:
+    global psycopg2, RealDictCursor, InstrumentedConnection
+    if InstrumentedConnection is not None:
+        return
+    with db_stack_lock:
+        if InstrumentedConnection is not None:
+            return
+        psycopg2 = importlib.import_module('psycopg2')
+        extras = importlib.import_module('psycopg2.extras')
+        RealDictCursor = extras.RealDictCursor
+        
+        class InstrumentedConnection(psycopg2.extensions.connection):
+            def cursor(self, *args, **kwargs):
+                base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+                return super().cursor(*args, cursor_factory=instrumented_cursor_class(base), **kwargs)
+
+json_encoder = json.JSONEncoder(check_circular=False)
+
+def encode_body(payload: Any) -> str:
+    started = time.perf_counter()
+    body = json_encoder.encode(payload)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.add('serialize', started)
+    return body
+
+def accepted_encodings(event: Dict[str, Any]) -> List[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == 'accept-encoding' and value:
+            encodings = []
+            for part in value.split(','):
+                coding, _, weight = part.strip().partition(';')
+                if weight.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+                    encodings.append(coding.strip().lower())
+            return encodings
+    return []
+
+def response_encoding(event: Dict[str, Any]) -> Optional[str]:
+    encodings = accepted_encodings(event)
+    if brotli is not None and 'br' in encodings:
+        return 'br'
+    if 'gzip' in encodings:
+        return 'gzip'
+    return None
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> None:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < RESPONSE_COMPRESS_MIN_BYTES:
+        return
+    encoding = response_encoding(event)
+    if encoding == 'br':
+        data = brotli.compress(body.encode(), quality=RESPONSE_BROTLI_QUALITY)
+    elif encoding == 'gzip':
+        data = gzip.compress(body.encode(), compresslevel=RESPONSE_GZIP_LEVEL)
+    else:
+        return
+    response['headers'] = {**(response.get('headers') or {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'}
+    response['body'] = base64.b64encode(data).decode()
+    response['isBase64Encoded'] = True
+
+def instrumented(func):
+    @functools.wraps(func)
+    def wrapper(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+        metrics = RequestMetrics()
+        request_metrics.current = metrics
+        started = time.perf_counter()
+        try:
+            response = func(event, context)
+        finally:
+            request_metrics.current = None
+        body = response.get('body') or ''
+        response_bytes = len(body.encode()) if isinstance(body, str) else len(body)
+        compress_started = time.perf_counter()
+        compress_response(event, response)
+        metrics.add('compress', compress_started)
+        total_ms = (time.perf_counter() - started) * 1000
+        response['headers'] = {**(response.get('headers') or {}), 'Server-Timing': metrics.server_timing(total_ms)}
+        print(json.dumps({
+            'event': 'request',
+            'function': FUNCTION_NAME,
+            'method': event.get('httpMethod'),
+            'status': response.get('statusCode'),
+            'total_ms': round(total_ms, 1),
+            **{phase + '_ms': round(ms, 1) for phase, ms in metrics.phases.items()},
+            'statements': metrics.statements,
+            'rows': metrics.rows,
+            'response_bytes': response_bytes,
+            'encoding': response['headers'].get('Content-Encoding', 'identity'),
+            'encoded_bytes': len(response.get('body') or '')
+        }))
+        return response
+    return wrapper
+
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+DB_POOL_IDLE_TIMEOUT = float(os.environ.get('DB_POOL_IDLE_TIMEOUT', '300'))
+DB_POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+DB_POOL_PING_AFTER = float(os.environ.get('DB_POOL_PING_AFTER', '30'))
+
+class ConnectionPool:
+    def __init__(self, dsn: Optional[str], max_size: int, idle_timeout: float,
+                 wait_timeout: float, ping_after: float):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.ping_after = ping_after
+        self._idle: List[Tuple[Any, float]] = []
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'connects': 0, 'hits': 0, 'waits': 0, 'reconnects': 0, 'evictions': 0}
+    
+    def _connect(self):
+        self.stats['connects'] += 1
+        return psycopg2.connect(self.dsn, connection_factory=InstrumentedConnection)
+    
+    def _close(self, conn) -> None:
+        try:
+            conn.close()
+        except Exception:
+            pass
+    
+    def _evict_idle(self, now: float) -> None:
+        fresh = []
+        for conn, released_at in self._idle:
+            if now - released_at > self.idle_timeout:
+                self._close(conn)
+                self.stats['evictions'] += 1
+            else:
+                fresh.append((conn, released_at))
+        self._idle = fresh
+    
+    def _is_healthy(self, conn, idle_for: float) -> bool:
+        if conn.closed:
+            return False
+        if idle_for < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    
+    def getconn(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            self._evict_idle(time.monotonic())
+            while not self._idle and self._in_use >= self.max_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise psycopg2.OperationalError('Connection pool exhausted')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+            self._in_use += 1
+            pooled = self._idle.pop() if self._idle else None
+        
+        try:
+            if pooled is not None:
+                conn, released_at = pooled
+                if self._is_healthy(conn, time.monotonic() - released_at):
+                    self.stats['hits'] += 1
+                    return conn
+                self._close(conn)
+                self.stats['reconnects'] += 1
+            return self._connect()
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+    
+    def putconn(self, conn) -> None:
+        reusable = not conn.closed
+        if reusable and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                reusable = False
+        if reusable and conn.autocommit:
+            conn.autocommit = False
+        if not reusable:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if reusable:
+                self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+    
+    def snapshot(self) -> Dict[str, int]:
+        with self._cond:
+            return {**self.stats, 'idle': len(self._idle), 'in_use': self._in_use}
+
+db_pool = ConnectionPool(
+    os.environ.get('DATABASE_URL'),
+    DB_POOL_MAX_SIZE, DB_POOL_IDLE_TIMEOUT, DB_POOL_WAIT_TIMEOUT, DB_POOL_PING_AFTER
+)
+
+def get_db_connection():
+    load_db_stack()
+    metrics = current_metrics()
+    request_metrics.current = None
+    started = time.perf_counter()
+    try:
+        return db_pool.getconn()
+    finally:
+        request_metrics.current = metrics
+        if metrics is not None:
+            metrics.add('connect', started)
+
+def release_db_connection(conn) -> None:
+    db_pool.putconn(conn)
+    print(json.dumps({'event': 'db_pool', **db_pool.snapshot()}))
+
+AUTH_REQUIRED = os.environ.get('AUTH_REQUIRED', '0') == '1'
+AUTH_CACHE_TTL = float(os.environ.get('AUTH_CACHE_TTL', '60'))
+AUTH_CACHE_SIZE = int(os.environ.get('AUTH_CACHE_SIZE', '10000'))
+AUTH_REVOCATION_CHECK_INTERVAL = float(os.environ.get('AUTH_REVOCATION_CHECK_INTERVAL', '1'))
+
+class TokenCache:
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = ttl
+        self.max_size = max(1, max_size)
+        self._entries: 'OrderedDict[str, Tuple[int, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'revoked': 0}
+        self.revision: Optional[str] = None
+        self._synced_at = 0.0
+    
+    def get(self, key: str) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats['hits'] += 1
+            return entry[0]
+    
+    def put(self, key: str, user_id: int, expires_in: float) -> None:
+        with self._lock:
+            self._entries[key] = (user_id, time.monotonic() + min(self.ttl, expires_in))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats['evictions'] += 1
+    
+    def invalidate(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+    
+    def revocations_due(self, interval: float) -> bool:
+        with self._lock:
+            return self.revision is None or time.monotonic() - self._synced_at >= interval
+    
+    def revoke(self, keys: List[str], revision: str) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, None) is not None:
+                    self.stats['revoked'] += 1
+            self.revision = revision
+            self._synced_at = time.monotonic()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats['hits'] + self.stats['misses']
+            hit_rate = self.stats['hits'] / lookups if lookups else 0.0
+            return {**self.stats, 'size': len(self._entries), 'hit_rate': round(hit_rate, 4)}
+
+token_cache = TokenCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_auth_token(event: Dict[str, Any]) -> Optional[str]:
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'x-auth-token' and value:
+            return value
+    return None
+
+REVOCATIONS_SQL = """
+    WITH horizon AS (
+        SELECT pg_snapshot_xmin(pg_current_snapshot()) as xmin
+    )
+    SELECT h.xmin::text as horizon,
+           ARRAY(SELECT r.token_hash::text FROM session_revocations r
+                 WHERE r.txid >= COALESCE(%s::xid8, h.xmin)) as revoked
+    FROM horizon h
+"""
+
+def sync_revocations(cur) -> None:
+    cur.execute(REVOCATIONS_SQL, (token_cache.revision,))
+    row = cur.fetchone()
+    token_cache.revoke(row['revoked'], row['horizon'])
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+def verify_token(cur, token: str) -> Optional[int]:
+    key = hash_token(token)
+    if token_cache.revocations_due(AUTH_REVOCATION_CHECK_INTERVAL):
+        sync_revocations(cur)
+    user_id = token_cache.get(key)
+    if user_id is not None:
+        return user_id
+    
+    cur.execute("""
+        SELECT user_id, EXTRACT(EPOCH FROM expires_at - CURRENT_TIMESTAMP) as expires_in
+        FROM sessions
+        WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > CURRENT_TIMESTAMP
+    """, (key,))
+    session = cur.fetchone()
+    print(json.dumps({'event': 'auth_cache', **token_cache.snapshot()}))
+    
+    if not session:
+        return None
+    
+    token_cache.put(key, session['user_id'], float(session['expires_in']))
+    return session['user_id']
+
+def resolve_user_id(event: Dict[str, Any], cur, claimed_id: Any) -> Tuple[Any, Optional[str]]:
+    token = get_auth_token(event)
+    if not token:
+        if AUTH_REQUIRED:
+            return None, 'Authentication required'
+        return claimed_id, None
+    
+    user_id = verify_token(cur, token)
+    if user_id is None:
+        return None, 'Invalid or expired token'
+    if claimed_id and str(claimed_id) != str(user_id):
+        return None, 'Token does not belong to this user'
+    return user_id, None
+
+HEARTBEAT_FLUSH_INTERVAL = float(os.environ.get('HEARTBEAT_FLUSH_INTERVAL', '60'))
+
+HEARTBEAT_FLUSH_SQL = """
+    WITH drained AS (
+        DELETE FROM heartbeat_events RETURNING user_id, minute
+    ), pending AS (
+        SELECT user_id, array_agg(minute) as minutes FROM drained GROUP BY user_id
+    ), bumped AS (
+        UPDATE users u
+        SET time_spent_minutes = u.time_spent_minutes + (
+                SELECT COUNT(*) FROM unnest(v.minutes) m WHERE m > COALESCE(u.last_active_minute, 0)
+            ),
+            last_active_minute = GREATEST(
+                COALESCE(u.last_active_minute, 0), (SELECT MAX(m) FROM unnest(v.minutes) m)
+            )
+        FROM pending v
+        WHERE u.id = v.user_id
+        RETURNING u.id
+    )
+    SELECT COUNT(*) as flushed FROM bumped
+"""
+last_heartbeat_flush = 0.0
+
+def record_heartbeat(cur, user_id: int, at: float) -> None:
+    cur.execute(
+        "INSERT INTO heartbeat_events (user_id, minute) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+        (user_id, int(at // 60))
+    )
+
+def flush_heartbeats(cur) -> int:
+    cur.execute("SELECT pg_try_advisory_xact_lock(hashtext(%s)) as locked", ('heartbeat_flush',))
+    if not cur.fetchone()['locked']:
+        return 0
+    cur.execute(HEARTBEAT_FLUSH_SQL)
+    flushed = cur.fetchone()['flushed']
+    print(json.dumps({'event': 'heartbeat_flush', 'users': flushed}))
+    return flushed
+
+def maybe_flush_heartbeats(conn, cur) -> None:
+    global last_heartbeat_flush
+    now = time.monotonic()
+    if now - last_heartbeat_flush < HEARTBEAT_FLUSH_INTERVAL:
+        return
+    last_heartbeat_flush = now
+    try:
+        flush_heartbeats(cur)
+        conn.commit()
+    except psycopg2.Error as e:
+        conn.rollback()
+        print(json.dumps({'event': 'heartbeat_flush_failed', 'function': FUNCTION_NAME, 'error': str(e)}))
+
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+STATS_COLUMNS = """
+    u.id as user_id, u.username, u.rank, u.reputation, u.time_spent_minutes,
+    COALESCE(st.scripts_authored, 0) as scripts_authored,
+    COALESCE(st.likes_received, 0) as likes_received,
+    COALESCE(st.downloads_received, 0) as downloads_received,
+    COALESCE(st.replies_posted, 0) as replies_posted,
+    COALESCE(st.comments_posted, 0) as comments_posted
+"""
+
+LEADERBOARDS = {
+    'reputation': """
+        SELECT """ + STATS_COLUMNS + """
+        FROM users u
+        LEFT JOIN user_stats st ON st.user_id = u.id
+        ORDER BY u.reputation DESC, u.id
+        LIMIT %s
+    """,
+    'downloads': """
+        SELECT """ + STATS_COLUMNS + """
+        FROM user_stats st
+        JOIN users u ON u.id = st.user_id
+        ORDER BY st.downloads_received DESC, st.user_id
+        LIMIT %s
+    """,
+    'likes': """
+        SELECT """ + STATS_COLUMNS + """
+        FROM user_stats st
+        JOIN users u ON u.id = st.user_id
+        ORDER BY st.likes_received DESC, st.user_id
+        LIMIT %s
+    """
+}
+
+def parse_body(event: Dict[str, Any]) -> Dict[str, Any]:
+    body = json.loads(event.get('body') or '{}')
+    if not isinstance(body, dict):
+        raise ValueError('Request body must be a JSON object')
+    return body
+
+def leaderboard_limit(params: Dict[str, Any]) -> int:
+    try:
+        return int(params.get('limit') or DEFAULT_LEADERBOARD_SIZE)
+    except ValueError:
+        return 0
+
+MAINTENANCE_TOKEN = os.environ.get('MAINTENANCE_TOKEN', '')
+MAINTENANCE_HEADER = 'X-Maintenance-Token'
+MAINTENANCE_ACTIONS = ('flush_heartbeats', 'rebuild')
+
+def is_maintenance_token(value: Optional[str]) -> bool:
+    return bool(MAINTENANCE_TOKEN) and hmac.compare_digest((value or '').encode(), MAINTENANCE_TOKEN.encode())
+
+def check_request(method: str, params: Dict[str, Any], body: Dict[str, Any], token: Optional[str],
+                  maintenance_token: Optional[str]) -> Optional[Tuple[int, str]]:
+    if method == 'GET':
+        if params.get('user_id'):
+            return None
+        if params.get('leaderboard') not in LEADERBOARDS:
+            return 400, 'user_id or leaderboard (reputation, downloads, likes) required'
+        if leaderboard_limit(params) < 1:
+            return 400, 'limit must be a positive integer'
+        return None
+    
+    if method != 'POST':
+        return 405, 'Method not allowed'
+    
+    action = body.get('action')
+    if action not in ('heartbeat', 'flush_heartbeats', 'rebuild'):
+        return 400, 'Invalid action'
+    if action in MAINTENANCE_ACTIONS and not is_maintenance_token(maintenance_token):
+        return 403, 'Valid maintenance token required'
+    if action == 'heartbeat':
+        if AUTH_REQUIRED and not token:
+            return 401, 'Authentication required'
+        if not token and not str(body.get('user_id') or '').isdigit():
+            return 400, 'user_id is required'
+    return None
+
+@instrumented
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    method: str = event.get('httpMethod', 'GET')
+    
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+    
+    headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    
+    params = event.get('queryStringParameters') or {}
+    try:
+        body = parse_body(event) if method == 'POST' else {}
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': 'Request body must be a JSON object'}),
+            'isBase64Encoded': False
+        }
+    
+    rejection = check_request(method, params, body, get_auth_token(event),
+                              get_header(event, MAINTENANCE_HEADER.lower()))
+    if rejection:
+        return {
+            'statusCode': rejection[0],
+            'headers': headers,
+            'body': json.dumps({'error': rejection[1]}),
+            'isBase64Encoded': False
+        }
+    
+    conn = None
+    cur = None
+    
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+        
+        if method == 'GET':
+            user_id = params.get('user_id')
+            leaderboard = params.get('leaderboard')
+            
+            if user_id:
+                cur.execute("""
+                    SELECT """ + STATS_COLUMNS + """
+                    FROM users u
+                    LEFT JOIN user_stats st ON st.user_id = u.id
+                    WHERE u.id = %s
+                """, (user_id,))
+                stats = cur.fetchone()
+                
+                if not stats:
+                    return {
+                        'statusCode': 404,
+                        'headers': headers,
+                        'body': json.dumps({'error': 'User not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': encode_body({'stats': dict(stats)}),
+                    'isBase64Encoded': False
+                }
+            
+            limit = min(leaderboard_limit(params), MAX_LEADERBOARD_SIZE)
+            cur.execute(LEADERBOARDS[leaderboard], (limit,))
+            entries = [dict(row) for row in cur.fetchall()]
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': encode_body({'leaderboard': leaderboard, 'entries': entries}),
+                'isBase64Encoded': False
+            }
+        
+        elif method == 'POST':
+            action = body.get('action')
+            
+            if action == 'heartbeat':
+                user_id, auth_error = resolve_user_id(event, cur, body.get('user_id'))
+                
+                if auth_error:
+                    return {
+                        'statusCode': 401,
+                        'headers': headers,
+                        'body': json.dumps({'error': auth_error}),
+                        'isBase64Encoded': False
+                    }
+                
+                record_heartbeat(cur, int(user_id), time.time())
+                conn.commit()
+                maybe_flush_heartbeats(conn, cur)
+                
+                return {
+                    'statusCode': 202,
+                    'headers': headers,
+                    'body': json.dumps({'success': True}),
+                    'isBase64Encoded': False
+                }
+            
+            if action == 'flush_heartbeats':
+                flushed = flush_heartbeats(cur)
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': headers,
+                    'body': json.dumps({'success': True, 'flushed': flushed}),
+                    'isBase64Encoded': False
+                }
+            
+            cur.execute("SELECT rebuild_user_stats() as fixed")
+            fixed = cur.fetchone()['fixed']
+            conn.commit()
+            
+            return {
+                'statusCode': 200,
+                'headers': headers,
+                'body': json.dumps({'success': True, 'fixed': fixed}),
+                'isBase64Encoded': False
+            }
+    
+    except Exception as e:
+        if conn and not conn.closed:
+            conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+    finally:
+        if cur:
+            cur.close()
+        if conn:
+            release_db_connection(conn)
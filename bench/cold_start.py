@@ -0,0 +1,116 @@
+'''
+Business: Measures cold-start cost of each backend function in a fresh interpreter: module import time, whether the
+          DB driver got imported, and first-response latency for a preflight, a validation failure and a DB request
+Args: --runs per function (default 5), --functions subset; DATABASE_URL env enables the DB request probe
+Returns: JSON report with median milliseconds per phase per function
+'''
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS = ['auth', 'scripts', 'forum', 'comments', 'stats', 'batch', 'feed']
+
+PROBES = {
+    'auth': {
+        'invalid': {'httpMethod': 'POST', 'body': json.dumps({'action': 'unknown'})},
+        'db': {'httpMethod': 'GET', 'headers': {'X-Auth-Token': 'cold-start-probe'}}
+    },
+    'scripts': {
+        'invalid': {'httpMethod': 'GET', 'queryStringParameters': {'hash': 'not-a-hash'}},
+        'db': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '10'}}
+    },
+    'forum': {
+        'invalid': {'httpMethod': 'GET', 'queryStringParameters': {'sort': 'unknown'}},
+        'db': {'httpMethod': 'GET', 'queryStringParameters': {}}
+    },
+    'comments': {
+        'invalid': {'httpMethod': 'GET', 'queryStringParameters': {}},
+        'db': {'httpMethod': 'GET', 'queryStringParameters': {'script_id': '1'}}
+    },
+    'stats': {
+        'invalid': {'httpMethod': 'GET', 'queryStringParameters': {}},
+        'db': {'httpMethod': 'GET', 'queryStringParameters': {'leaderboard': 'reputation'}}
+    },
+    'batch': {
+        'invalid': {'httpMethod': 'POST', 'body': json.dumps({'requests': []})},
+        'db': {'httpMethod': 'POST', 'body': json.dumps({'requests': [
+            {'function': 'scripts', 'httpMethod': 'GET', 'queryStringParameters': {'limit': '1'}}
+        ]})}
+    },
+    'feed': {
+        'invalid': {'httpMethod': 'GET', 'queryStringParameters': {'kinds': 'unknown'}},
+        'db': {'httpMethod': 'GET', 'queryStringParameters': {'limit': '20'}}
+    }
+}
+
+def elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 3)
+
+def probe(name: str, with_db: bool) -> Dict[str, Any]:
+    result: Dict[str, Any] = {}
+    started = time.perf_counter()
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name + '_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    result['import_ms'] = elapsed_ms(started)
+    result['driver_after_import'] = 'psycopg2' in sys.modules
+
+    started = time.perf_counter()
+    response = module.handler({'httpMethod': 'OPTIONS'}, None)
+    result['options_ms'] = elapsed_ms(started)
+    result['options_status'] = response['statusCode']
+
+    started = time.perf_counter()
+    response = module.handler(PROBES[name]['invalid'], None)
+    result['invalid_ms'] = elapsed_ms(started)
+    result['invalid_status'] = response['statusCode']
+    result['driver_after_invalid'] = 'psycopg2' in sys.modules
+
+    if with_db:
+        started = time.perf_counter()
+        response = module.handler(PROBES[name]['db'], None)
+        result['db_ms'] = elapsed_ms(started)
+        result['db_status'] = response['statusCode']
+    return result
+
+def run_probe(name: str, with_db: bool) -> Dict[str, Any]:
+    env = dict(os.environ, DATABASE_URL=os.environ.get('DATABASE_URL') or 'postgresql://cold-start-probe/none')
+    args = [sys.executable, os.path.abspath(__file__), '--probe', name] + (['--with-db'] if with_db else [])
+    output = subprocess.run(args, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    for key, value in samples[0].items():
+        if key.endswith('_ms'):
+            summary[key] = round(statistics.median(sample[key] for sample in samples), 3)
+        else:
+            summary[key] = value
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark cold-start latency of the backend functions')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--functions', nargs='+', choices=FUNCTIONS, default=FUNCTIONS)
+    parser.add_argument('--probe', choices=FUNCTIONS, help=argparse.SUPPRESS)
+    parser.add_argument('--with-db', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        result = probe(args.probe, args.with_db)
+        print(json.dumps(result))
+        sys.exit(0)
+
+    with_db = bool(os.environ.get('DATABASE_URL'))
+    report: Dict[str, Optional[Dict[str, Any]]] = {}
+    for name in args.functions:
+        report[name] = summarize([run_probe(name, with_db) for _ in range(args.runs)])
+    print(json.dumps({'runs': args.runs, 'with_db': with_db, 'functions': report}, indent=2))
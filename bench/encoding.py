@@ -0,0 +1,103 @@
+'''
+Business: Compares the previous RealDictCursor + json.dumps(default=str) list path with plain tuples, RowEncoder
+          and the shared encoder, and measures gzip/brotli cost and ratio on the resulting bodies
+Args: --rows per page (default 100), --iterations per measurement, --view summary|full; DATABASE_URL env
+      pointing at a seeded database (bench/suite.py or bench/search_scripts.py seed one)
+Returns: JSON report with fetch+encode time per page for both paths and compressed sizes per encoding
+'''
+import argparse
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import sys
+import time
+from typing import Any, Callable, Dict, Tuple
+
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_module():
+    path = os.path.join(ROOT, 'backend', 'scripts', 'index.py')
+    spec = importlib.util.spec_from_file_location('scripts_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def timed(func: Callable[[], Any], iterations: int) -> Tuple[float, Any]:
+    result = func()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        result = func()
+    return (time.perf_counter() - started) * 1000 / iterations, result
+
+def compression_report(module, raw: bytes, iterations: int) -> Dict[str, Any]:
+    codecs = {'gzip': lambda: gzip.compress(raw, compresslevel=module.RESPONSE_GZIP_LEVEL)}
+    if module.brotli is not None:
+        codecs['br'] = lambda: module.brotli.compress(raw, quality=module.RESPONSE_BROTLI_QUALITY)
+    report = {}
+    for encoding, compress in codecs.items():
+        elapsed_ms, data = timed(compress, iterations)
+        report[encoding] = {
+            'ms': round(elapsed_ms, 3),
+            'bytes': len(data),
+            'base64_bytes': len(base64.b64encode(data)),
+            'ratio': round(len(raw) / len(data), 2)
+        }
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark response encoding and compression')
+    parser.add_argument('--rows', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--view', choices=['summary', 'full'], default='full')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    module = load_module()
+    query = "SELECT " + module.LIST_COLUMNS[args.view] + """
+        FROM scripts s
+        JOIN users u ON s.author_id = u.id
+    """ + module.LIST_JOINS[args.view] + """
+        ORDER BY s.created_at DESC, s.id DESC
+        LIMIT %s
+    """
+    query_params = [module.EXCERPT_LENGTH, args.rows] if args.view == 'summary' else [args.rows]
+    conn = psycopg2.connect(dsn)
+
+    def previous_path() -> str:
+        with conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(query, query_params)
+            scripts = [dict(row) for row in cur.fetchall()]
+        return json.dumps({'scripts': scripts, 'next_cursor': None}, default=str)
+
+    def encoder_path() -> str:
+        with conn.cursor() as cur:
+            cur.execute(query, query_params)
+            encoder = module.RowEncoder(cur.description)
+            rows = cur.fetchall()
+        return module.encode_body({'scripts': encoder.records(rows), 'next_cursor': None})
+
+    previous_ms, previous_body = timed(previous_path, args.iterations)
+    encoder_ms, encoder_body = timed(encoder_path, args.iterations)
+    conn.close()
+    if json.loads(previous_body) != json.loads(encoder_body):
+        sys.exit('RowEncoder output differs from the previous path')
+
+    raw = encoder_body.encode()
+    print(json.dumps({
+        'rows': args.rows,
+        'view': args.view,
+        'body_bytes': len(raw),
+        'previous_ms': round(previous_ms, 3),
+        'encoder_ms': round(encoder_ms, 3),
+        'speedup': round(previous_ms / encoder_ms, 2),
+        'compress_min_bytes': module.RESPONSE_COMPRESS_MIN_BYTES,
+        'compression': compression_report(module, raw, args.iterations)
+    }, indent=2))
@@ -0,0 +1,95 @@
+'''
+Business: Measures sustained heartbeat ingest through the stats handler
+Args: --heartbeats total, --users, --sessions per user, --flush-interval seconds; DATABASE_URL env
+Returns: JSON report with heartbeats per second, flush count and statements per flush
+'''
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_stats_module():
+    path = os.path.join(ROOT, 'backend', 'stats', 'index.py')
+    spec = importlib.util.spec_from_file_location('stats_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def seed_users(dsn: str, count: int) -> list:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash)
+        SELECT 'bench_hb_' || i, 'bench_hb_' || i || '@example.com', 'bench'
+        FROM generate_series(1, %s) i
+        ON CONFLICT (username) DO UPDATE SET username = EXCLUDED.username
+        RETURNING id
+    """, (count,))
+    user_ids = [row[0] for row in cur.fetchall()]
+    conn.commit()
+    cur.close()
+    conn.close()
+    return user_ids
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark heartbeat ingestion')
+    parser.add_argument('--heartbeats', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--sessions', type=int, default=2)
+    parser.add_argument('--flush-interval', type=float, default=1.0)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    maintenance_token = os.environ.setdefault('MAINTENANCE_TOKEN', 'bench-heartbeats')
+    user_ids = seed_users(dsn, args.users)
+    stats = load_stats_module()
+    stats.HEARTBEAT_FLUSH_INTERVAL = args.flush_interval
+    stats.release_db_connection = stats.db_pool.putconn
+    flushed_users = []
+    flush_heartbeats = stats.flush_heartbeats
+
+    def counted_flush(cur) -> int:
+        flushed_users.append(flush_heartbeats(cur))
+        return flushed_users[-1]
+
+    stats.flush_heartbeats = counted_flush
+
+    events = [
+        {'httpMethod': 'POST', 'body': json.dumps({'action': 'heartbeat', 'user_id': user_id})}
+        for user_id in user_ids
+        for _ in range(args.sessions)
+    ]
+
+    started = time.perf_counter()
+    for i in range(args.heartbeats):
+        response = stats.handler(events[i % len(events)], None)
+        if response['statusCode'] != 202:
+            sys.exit('heartbeat failed: ' + response['body'])
+    response = stats.handler({
+        'httpMethod': 'POST',
+        'headers': {'X-Maintenance-Token': maintenance_token},
+        'body': json.dumps({'action': 'flush_heartbeats'})
+    }, None)
+    if response['statusCode'] != 200:
+        sys.exit('flush failed: ' + response['body'])
+    elapsed = time.perf_counter() - started
+
+    print(json.dumps({
+        'heartbeats': args.heartbeats,
+        'users': len(user_ids),
+        'sessions_per_user': args.sessions,
+        'elapsed_s': round(elapsed, 3),
+        'heartbeats_per_s': round(args.heartbeats / elapsed),
+        'flushes': sum(1 for users in flushed_users if users),
+        'statements_per_flush': 1,
+        'users_flushed': sum(flushed_users)
+    }, indent=2))
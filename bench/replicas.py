@@ -0,0 +1,185 @@
+'''
+Business: Verifies primary/replica routing against two local Postgres instances: reads go to the streaming replica,
+          writes return an X-Read-After LSN token, token reads wait for the replica or fall back to the primary,
+          lagging or unreachable replicas fall back to the primary
+Args: --scale for the seeded catalog (default 200), --max-lag seconds the handlers tolerate (default 1)
+Returns: JSON report of every check with the router counters it observed; exit code 1 when a check fails
+'''
+import argparse
+import importlib.util
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+import psycopg2
+
+from suite import LocalPostgres, apply_migrations, free_port, seed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class LocalStandby:
+    def __init__(self, primary: LocalPostgres, port: int):
+        self.primary = primary
+        self.port = port
+        self.datadir = tempfile.mkdtemp(prefix='bench-pg-standby-')
+
+    def start(self) -> str:
+        shutil.rmtree(self.datadir)
+        subprocess.check_call([
+            os.path.join(self.primary.bindir, 'pg_basebackup'), '-h', self.primary.datadir,
+            '-p', str(self.primary.port), '-U', 'bench', '-D', self.datadir, '-R', '-X', 'stream'
+        ], stdout=subprocess.DEVNULL)
+        self.run_ctl('start')
+        return 'host={} port={} user=bench dbname=bench'.format(self.datadir, self.port)
+
+    def run_ctl(self, action: str) -> None:
+        subprocess.check_call([
+            os.path.join(self.primary.bindir, 'pg_ctl'), '-D', self.datadir, '-w', '-l',
+            os.path.join(self.datadir, 'server.log'), '-o',
+            '-p {} -k {} -c hot_standby=on'.format(self.port, self.datadir),
+            action
+        ], stdout=subprocess.DEVNULL)
+
+    def stop(self) -> None:
+        subprocess.call(
+            [os.path.join(self.primary.bindir, 'pg_ctl'), '-D', self.datadir, '-m', 'fast', 'stop'],
+            stdout=subprocess.DEVNULL
+        )
+
+    def cleanup(self) -> None:
+        self.stop()
+        shutil.rmtree(self.datadir, ignore_errors=True)
+
+def load_module(name: str):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location('replicas_' + name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def replica_sql(dsn: str, query: str, params: Tuple = ()) -> Any:
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        row = cur.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+def wait_for(condition: Callable[[], bool], timeout: float = 10.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def counters(module) -> Dict[str, int]:
+    return dict(module.replica_router.stats)
+
+def delta(before: Dict[str, int], after: Dict[str, int]) -> Dict[str, int]:
+    return {key: after[key] - before[key] for key in after if after[key] != before[key]}
+
+def call(module, method: str, params: Dict[str, Any] = None, body: Dict[str, Any] = None,
+         headers: Dict[str, str] = None) -> Dict[str, Any]:
+    return module.handler({
+        'httpMethod': method,
+        'queryStringParameters': params or {},
+        'headers': headers or {},
+        'body': json.dumps(body) if body is not None else None
+    }, None)
+
+def run_checks(modules: Dict[str, Any], replica_dsn: str, standby: LocalStandby, max_lag: float) -> List[Dict[str, Any]]:
+    comments = modules['comments']
+    results = []
+
+    def check(name: str, module, passed: bool, before: Dict[str, int], **extra: Any) -> None:
+        results.append({'check': name, 'passed': bool(passed), 'router': delta(before, counters(module)), **extra})
+
+    for name in ('scripts', 'forum', 'comments'):
+        module = modules[name]
+        params = {'script_id': '1'} if name == 'comments' else {'limit': '10'}
+        before = counters(module)
+        response = call(module, 'GET', params)
+        check(name + '_list_reads_replica', module,
+              response['statusCode'] == 200 and counters(module)['reads'] == before['reads'] + 1, before)
+
+    before = counters(comments)
+    created = call(comments, 'POST', body={'type': 'script', 'script_id': 1, 'author_id': 1, 'content': 'replica check'})
+    token = created['headers'].get(comments.READ_AFTER_HEADER)
+    check('write_returns_read_after_token', comments,
+          created['statusCode'] == 201 and token is not None and counters(comments)['reads'] == before['reads'], before,
+          token=token)
+
+    wait_for(lambda: replica_sql(replica_dsn, 'SELECT pg_last_wal_replay_lsn() >= %s::pg_lsn', (token,)))
+    before = counters(comments)
+    page = call(comments, 'GET', {'script_id': '1', 'limit': '5'}, headers={comments.READ_AFTER_HEADER: token})
+    found = 'replica check' in page['body']
+    check('token_read_uses_caught_up_replica', comments,
+          found and counters(comments)['reads'] == before['reads'] + 1, before)
+
+    replica_sql(replica_dsn, 'SELECT pg_wal_replay_pause()')
+    created = call(comments, 'POST', body={'type': 'script', 'script_id': 1, 'author_id': 1, 'content': 'paused replay'})
+    token = created['headers'].get(comments.READ_AFTER_HEADER)
+    before = counters(comments)
+    page = call(comments, 'GET', {'script_id': '1', 'limit': '5'}, headers={comments.READ_AFTER_HEADER: token})
+    check('token_read_falls_back_when_replica_behind', comments,
+          'paused replay' in page['body'] and counters(comments)['fallbacks'] == before['fallbacks'] + 1, before)
+
+    time.sleep(max_lag + comments.REPLICA_CHECK_INTERVAL + 0.5)
+    before = counters(comments)
+    call(comments, 'GET', {'script_id': '1'})
+    check('lagging_replica_falls_back', comments,
+          counters(comments)['lagging'] > before['lagging'] and counters(comments)['fallbacks'] > before['fallbacks'],
+          before)
+
+    replica_sql(replica_dsn, 'SELECT pg_wal_replay_resume()')
+    wait_for(lambda: replica_sql(replica_dsn, 'SELECT pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()'))
+    time.sleep(comments.REPLICA_CHECK_INTERVAL + 0.1)
+    before = counters(comments)
+    page = call(comments, 'GET', {'script_id': '1', 'limit': '5'})
+    check('resumed_replica_serves_reads', comments,
+          'paused replay' in page['body'] and counters(comments)['reads'] == before['reads'] + 1, before)
+
+    standby.stop()
+    time.sleep(comments.REPLICA_CHECK_INTERVAL + 0.1)
+    before = counters(comments)
+    page = call(comments, 'GET', {'script_id': '1'})
+    check('unreachable_replica_falls_back', comments,
+          page['statusCode'] == 200 and counters(comments)['fallbacks'] == before['fallbacks'] + 1, before)
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check primary/replica routing against two local Postgres instances')
+    parser.add_argument('--scale', type=int, default=200)
+    parser.add_argument('--max-lag', type=float, default=1.0)
+    args = parser.parse_args()
+
+    primary = LocalPostgres(free_port())
+    standby = LocalStandby(primary, free_port())
+    try:
+        primary_dsn = primary.start()
+        apply_migrations(primary_dsn)
+        seed(primary_dsn, args.scale)
+        replica_dsn = standby.start()
+
+        os.environ['DATABASE_URL'] = primary_dsn
+        os.environ['DATABASE_REPLICA_URLS'] = replica_dsn
+        os.environ['REPLICA_MAX_LAG_SECONDS'] = str(args.max_lag)
+        os.environ['REPLICA_CHECK_INTERVAL'] = '0.2'
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+        modules = {name: load_module(name) for name in ('scripts', 'forum', 'comments')}
+
+        results = run_checks(modules, replica_dsn, standby, args.max_lag)
+    finally:
+        standby.cleanup()
+        primary.stop()
+
+    print(json.dumps({'checks': results}, indent=2))
+    if not all(result['passed'] for result in results):
+        sys.exit(1)
@@ -0,0 +1,108 @@
+'''
+Business: Asserts how many database round trips each hot write action costs
+Args: DATABASE_URL env pointing at a migrated database
+Returns: JSON report per action, exit code 1 when an action exceeds its budget
+'''
+import importlib.util
+import json
+import os
+import secrets
+import sys
+from typing import Any, Dict
+
+import psycopg2
+import psycopg2.extensions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPECTED_ROUND_TRIPS = {
+    'register': 1,
+    'login': 2,
+    'create': 1,
+    'like': 1
+}
+
+class CountingConnection(psycopg2.extensions.connection):
+    round_trips = 0
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=counting_cursor_class(base), **kwargs)
+
+    def count_statement(self) -> None:
+        if not self.autocommit and self.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            self.round_trips += 1
+        self.round_trips += 1
+
+    def commit(self):
+        if not self.autocommit and self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            self.round_trips += 1
+        return super().commit()
+
+    def rollback(self):
+        if not self.autocommit and self.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            self.round_trips += 1
+        return super().rollback()
+
+def counting_cursor_class(base):
+    class CountingCursor(base):
+        def execute(self, query, params=None):
+            self.connection.count_statement()
+            return super().execute(query, params)
+    return CountingCursor
+
+def load_module(name: str):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location(name + '_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def measure(module, event: Dict[str, Any]) -> Dict[str, Any]:
+    conn = psycopg2.connect(os.environ['DATABASE_URL'], connection_factory=CountingConnection)
+    module.db_pool._idle = [(conn, float('inf'))]
+    module.db_pool.ping_after = float('inf')
+    response = module.handler(event, None)
+    trips = conn.round_trips
+    conn.close()
+    module.db_pool._idle = []
+    return {'status': response['statusCode'], 'round_trips': trips, 'body': json.loads(response['body'] or '{}')}
+
+def post(body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'POST', 'body': json.dumps(body)}
+
+if __name__ == '__main__':
+    if not os.environ.get('DATABASE_URL'):
+        sys.exit('DATABASE_URL is required')
+
+    auth = load_module('auth')
+    scripts = load_module('scripts')
+    suffix = secrets.token_hex(4)
+    username = 'roundtrip_' + suffix
+    results = {}
+
+    results['register'] = measure(auth, post({
+        'action': 'register', 'username': username,
+        'email': username + '@example.com', 'password': 'roundtrip-password'
+    }))
+    author_id = results['register']['body']['user']['id']
+    results['login'] = measure(auth, post({'action': 'login', 'username': username, 'password': 'roundtrip-password'}))
+    results['create'] = measure(scripts, post({
+        'action': 'create', 'title': 'Round trip ' + suffix, 'code': 'return 1',
+        'category': 'Utility', 'author_id': author_id
+    }))
+    script_id = results['create']['body']['script']['id']
+    results['like'] = measure(scripts, post({'action': 'like', 'script_id': script_id, 'user_id': author_id}))
+
+    failed = False
+    report = {}
+    for action, result in results.items():
+        ok = result['status'] < 300 and result['round_trips'] <= EXPECTED_ROUND_TRIPS[action]
+        failed = failed or not ok
+        report[action] = {
+            'status': result['status'],
+            'round_trips': result['round_trips'],
+            'expected': EXPECTED_ROUND_TRIPS[action],
+            'ok': ok
+        }
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,148 @@
+'''
+Business: Benchmarks the scripts search mode against a large seeded catalog
+Args: --rows to seed (default 1M), --queries to run, --p95-target-ms budget; DATABASE_URL env
+Returns: JSON latency report, exit code 1 when p95 exceeds the target
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List
+
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = [
+    'inventory', 'teleport', 'spawner', 'leaderboard', 'quest', 'dialog', 'camera', 'vehicle',
+    'weapon', 'shop', 'currency', 'pathfinding', 'tween', 'particle', 'sound', 'admin',
+    'command', 'chat', 'badge', 'datastore', 'matchmaking', 'lobby', 'round', 'timer',
+    'health', 'damage', 'respawn', 'checkpoint', 'obby', 'tycoon', 'pet', 'trade',
+    'animation', 'ragdoll', 'physics', 'lighting', 'weather', 'minimap', 'notification', 'keybind'
+]
+CATEGORIES = ['Utility', 'Game', 'UI', 'Network', 'Data']
+SEED_BATCH = 50000
+
+def load_handler():
+    path = os.path.join(ROOT, 'backend', 'scripts', 'index.py')
+    spec = importlib.util.spec_from_file_location('scripts_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+def seed(dsn: str, rows: int) -> None:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute("""
+        INSERT INTO users (username, email, password_hash)
+        VALUES ('bench_author', 'bench_author@example.com', 'bench')
+        ON CONFLICT (username) DO UPDATE SET username = EXCLUDED.username
+        RETURNING id
+    """)
+    author_id = cur.fetchone()[0]
+    cur.execute("SELECT COUNT(*) FROM scripts WHERE author_id = %s", (author_id,))
+    existing = cur.fetchone()[0]
+
+    for start in range(existing, rows, SEED_BATCH):
+        end = min(start + SEED_BATCH, rows) - 1
+        cur.execute("""
+            WITH generated AS (
+                SELECT title, category, code, description, encode(sha256(convert_to(code, 'UTF8')), 'hex') as code_hash
+                FROM (
+                    SELECT w[1 + (i * 7) %% n] || ' ' || w[1 + (i * 13) %% n] || ' ' || w[1 + (i * 31) %% n] as title,
+                           c[1 + i %% array_length(c, 1)] as category,
+                           'local function ' || w[1 + (i * 17) %% n] || '_' || i || '(player)' || E'\\n'
+                               || '  return ' || w[1 + (i * 19) %% n] || 'Service:Get(player)' || E'\\n' || 'end' as code,
+                           'Handles ' || w[1 + (i * 23) %% n] || ' and ' || w[1 + (i * 29) %% n]
+                               || ' for ' || w[1 + (i * 37) %% n] || ' systems' as description
+                    FROM generate_series(%(start)s, %(end)s) i,
+                         (SELECT %(words)s::text[] as w, %(n)s as n, %(categories)s::text[] as c) vocab
+                ) rows
+            ), blobs AS (
+                INSERT INTO code_blobs (hash, code)
+                SELECT code_hash, code FROM generated
+                ON CONFLICT (hash) DO NOTHING
+            )
+            INSERT INTO scripts (title, category, code_hash, description, author_id,
+                                 code_size, code_lines, search_vector)
+            SELECT title, category, code_hash, description, %(author_id)s,
+                   octet_length(code), code_line_count(code), scripts_search_vector(title, description, code)
+            FROM generated
+        """, {
+            'author_id': author_id, 'start': start, 'end': end,
+            'words': WORDS, 'n': len(WORDS), 'categories': CATEGORIES
+        })
+        conn.commit()
+        print(json.dumps({'event': 'seed', 'rows': end + 1}), file=sys.stderr)
+
+    cur.execute("ANALYZE scripts")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+def make_typo(word: str, rng: random.Random) -> str:
+    pos = rng.randrange(1, len(word) - 1)
+    return word[:pos] + word[pos + 1] + word[pos] + word[pos + 2:]
+
+def make_terms(count: int, rng: random.Random) -> List[str]:
+    terms = []
+    for _ in range(count):
+        kind = rng.random()
+        if kind < 0.5:
+            terms.append(rng.choice(WORDS))
+        elif kind < 0.8:
+            terms.append(' '.join(rng.sample(WORDS, 2)))
+        else:
+            terms.append(make_typo(rng.choice(WORDS), rng))
+    return terms
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * fraction))
+    return sorted_values[index]
+
+def run(handler, terms: List[str], page_size: int) -> Dict[str, Any]:
+    timings = []
+    errors = 0
+    for term in terms:
+        event = {'httpMethod': 'GET', 'queryStringParameters': {'search': term, 'limit': str(page_size)}}
+        started = time.perf_counter()
+        response = handler(event, None)
+        timings.append((time.perf_counter() - started) * 1000)
+        if response['statusCode'] != 200:
+            errors += 1
+    timings.sort()
+    return {
+        'queries': len(terms),
+        'errors': errors,
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'max_ms': round(timings[-1], 2)
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark scripts search latency')
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--p95-target-ms', type=float, default=150.0)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--random-seed', type=int, default=42)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    if not args.skip_seed:
+        seed(dsn, args.rows)
+
+    handler = load_handler()
+    rng = random.Random(args.random_seed)
+    run(handler, make_terms(20, rng), args.page_size)
+    report = run(handler, make_terms(args.queries, rng), args.page_size)
+    report['p95_target_ms'] = args.p95_target_ms
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report['p95_ms'] > args.p95_target_ms or report['errors'] else 0)
@@ -0,0 +1,434 @@
+'''
+Business: End-to-end load benchmark for all backend handlers against a seeded Postgres
+Args: --scale rows, --concurrency threads, --duration seconds, --local-postgres or DATABASE_URL env,
+      --save-baseline / --compare baseline file
+Returns: JSON report with throughput, p50/p95/p99, queries per request and EXPLAIN plans per scenario;
+         exit code 1 when --compare finds a regression
+'''
+import argparse
+import importlib.util
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.extensions
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MIGRATIONS_DIR = os.path.join(ROOT, 'db_migrations')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SEED_BATCH = 100000
+WORDS = [
+    'inventory', 'teleport', 'spawner', 'leaderboard', 'quest', 'dialog', 'camera', 'vehicle',
+    'weapon', 'shop', 'currency', 'pathfinding', 'tween', 'particle', 'sound', 'admin',
+    'command', 'chat', 'badge', 'datastore', 'matchmaking', 'lobby', 'round', 'timer'
+]
+CATEGORIES = ['Utility', 'Game', 'UI', 'Network', 'Data']
+
+query_counter = threading.local()
+
+class CountingConnection(psycopg2.extensions.connection):
+    def cursor(self, *args, **kwargs):
+        base = kwargs.pop('cursor_factory', None) or psycopg2.extensions.cursor
+        return super().cursor(*args, cursor_factory=counting_cursor_class(base), **kwargs)
+
+counting_cursor_classes: Dict[Any, Any] = {}
+
+def counting_cursor_class(base):
+    if base not in counting_cursor_classes:
+        class CountingCursor(base):
+            def execute(self, query, params=None):
+                query_counter.count = getattr(query_counter, 'count', 0) + 1
+                if getattr(query_counter, 'capture', None) is not None:
+                    query_counter.capture.append(self.mogrify(query, params).decode())
+                return super().execute(query, params)
+        counting_cursor_classes[base] = CountingCursor
+    return counting_cursor_classes[base]
+
+class LocalPostgres:
+    def __init__(self, port: int):
+        self.port = port
+        self.bindir = self.find_bindir()
+        self.datadir = tempfile.mkdtemp(prefix='bench-pg-')
+
+    @staticmethod
+    def find_bindir() -> str:
+        initdb = shutil.which('initdb')
+        if initdb:
+            return os.path.dirname(initdb)
+        pg_config = shutil.which('pg_config')
+        if pg_config:
+            return subprocess.check_output([pg_config, '--bindir']).decode().strip()
+        raise RuntimeError('initdb not found; install PostgreSQL server binaries or pass DATABASE_URL')
+
+    def start(self) -> str:
+        subprocess.check_call(
+            [os.path.join(self.bindir, 'initdb'), '-D', self.datadir, '-U', 'bench', '-A', 'trust'],
+            stdout=subprocess.DEVNULL
+        )
+        subprocess.check_call([
+            os.path.join(self.bindir, 'pg_ctl'), '-D', self.datadir, '-w', '-l',
+            os.path.join(self.datadir, 'server.log'), '-o',
+            '-p {} -k {} -c max_connections=200 -c shared_buffers=256MB'.format(self.port, self.datadir),
+            'start'
+        ], stdout=subprocess.DEVNULL)
+        admin = psycopg2.connect(host=self.datadir, port=self.port, user='bench', dbname='postgres')
+        admin.autocommit = True
+        with admin.cursor() as cur:
+            cur.execute('CREATE DATABASE bench')
+        admin.close()
+        return 'host={} port={} user=bench dbname=bench'.format(self.datadir, self.port)
+
+    def stop(self) -> None:
+        subprocess.call(
+            [os.path.join(self.bindir, 'pg_ctl'), '-D', self.datadir, '-m', 'fast', 'stop'],
+            stdout=subprocess.DEVNULL
+        )
+        shutil.rmtree(self.datadir, ignore_errors=True)
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def apply_migrations(dsn: str) -> List[str]:
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('CREATE TABLE IF NOT EXISTS bench_migrations (version INTEGER PRIMARY KEY)')
+    cur.execute('SELECT version FROM bench_migrations')
+    done = {row[0] for row in cur.fetchall()}
+    applied = []
+    files = sorted(
+        (int(match.group(1)), name) for name in os.listdir(MIGRATIONS_DIR)
+        for match in [re.match(r'V(\d+)__.*\.sql$', name)] if match
+    )
+    for version, name in files:
+        if version in done:
+            continue
+        with open(os.path.join(MIGRATIONS_DIR, name)) as migration:
+            cur.execute(migration.read())
+        cur.execute('INSERT INTO bench_migrations (version) VALUES (%s)', (version,))
+        conn.commit()
+        applied.append(name)
+    cur.close()
+    conn.close()
+    return applied
+
+def seed_sizes(scale: int) -> Dict[str, int]:
+    return {
+        'users': max(100, scale // 10),
+        'scripts': scale,
+        'topics': max(10, scale // 5),
+        'replies': scale,
+        'comments': scale,
+        'likes': scale // 2
+    }
+
+SEED_SQL = {
+    'users': """
+        INSERT INTO users (username, email, password_hash, reputation)
+        SELECT 'bench_user_' || i, 'bench_user_' || i || '@example.com', 'bench', (i * 37) %% 5000
+        FROM generate_series(%(start)s, %(end)s) i
+        ON CONFLICT DO NOTHING
+    """,
+    'scripts': """
+        WITH generated AS (
+            SELECT title, category, code, description, author_id, created_at,
+                   encode(sha256(convert_to(code, 'UTF8')), 'hex') as code_hash
+            FROM (
+                SELECT w[1 + (i * 7) %% n] || ' ' || w[1 + (i * 13) %% n] || ' ' || w[1 + (i * 31) %% n] as title,
+                       c[1 + i %% array_length(c, 1)] as category,
+                       repeat('local ' || w[1 + (i * 17) %% n] || ' = require(script.' || w[1 + (i * 19) %% n] || ')'
+                              || E'\\n', 1 + i %% 40) as code,
+                       'Handles ' || w[1 + (i * 23) %% n] || ' and ' || w[1 + (i * 29) %% n] as description,
+                       1 + (i * 7919) %% %(users)s as author_id,
+                       CURRENT_TIMESTAMP - make_interval(secs => i) as created_at
+                FROM generate_series(%(start)s, %(end)s) i,
+                     (SELECT %(words)s::text[] as w, %(n)s as n, %(categories)s::text[] as c) vocab
+            ) rows
+        ), blobs AS (
+            INSERT INTO code_blobs (hash, code)
+            SELECT DISTINCT ON (code_hash) code_hash, code FROM generated
+            ON CONFLICT (hash) DO NOTHING
+        )
+        INSERT INTO scripts (title, category, code_hash, description, author_id, likes, downloads, created_at,
+                             code_size, code_lines, search_vector)
+        SELECT title, category, code_hash, description, author_id, 0, 0, created_at,
+               octet_length(code), code_line_count(code), scripts_search_vector(title, description, code)
+        FROM generated
+    """,
+    'topics': """
+        INSERT INTO forum_topics (title, author_id, created_at, last_activity_at)
+        SELECT 'Topic about ' || w[1 + (i * 11) %% n], 1 + (i * 104729) %% %(users)s,
+               CURRENT_TIMESTAMP - make_interval(secs => i), CURRENT_TIMESTAMP - make_interval(secs => i)
+        FROM generate_series(%(start)s, %(end)s) i,
+             (SELECT %(words)s::text[] as w, %(n)s as n) vocab
+    """,
+    'replies': """
+        INSERT INTO forum_replies (topic_id, author_id, content, created_at)
+        SELECT 1 + (i * 15485863) %% %(topics)s, 1 + (i * 7919) %% %(users)s, 'Reply number ' || i,
+               CURRENT_TIMESTAMP - make_interval(secs => i)
+        FROM generate_series(%(start)s, %(end)s) i
+    """,
+    'comments': """
+        INSERT INTO script_comments (script_id, author_id, content, created_at)
+        SELECT 1 + (i * 15485863) %% %(scripts)s, 1 + (i * 104729) %% %(users)s, 'Comment number ' || i,
+               CURRENT_TIMESTAMP - make_interval(secs => i)
+        FROM generate_series(%(start)s, %(end)s) i
+    """,
+    'likes': """
+        INSERT INTO script_likes (script_id, user_id)
+        SELECT 1 + (i * 15485863) %% %(scripts)s, 1 + (i * 7919) %% %(users)s
+        FROM generate_series(%(start)s, %(end)s) i
+        ON CONFLICT DO NOTHING
+    """
+}
+
+def seed(dsn: str, scale: int) -> Dict[str, int]:
+    sizes = seed_sizes(scale)
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute('SELECT COUNT(*) FROM scripts')
+    if cur.fetchone()[0] >= scale:
+        cur.close()
+        conn.close()
+        return sizes
+
+    for table, total in sizes.items():
+        for start in range(1, total + 1, SEED_BATCH):
+            cur.execute(SEED_SQL[table], {
+                **sizes, 'start': start, 'end': min(start + SEED_BATCH - 1, total),
+                'words': WORDS, 'n': len(WORDS), 'categories': CATEGORIES
+            })
+            conn.commit()
+        print(json.dumps({'event': 'seed', 'table': table, 'rows': total}), file=sys.stderr)
+
+    cur.execute("""
+        UPDATE scripts s SET likes = l.likes, trending_score = trending_event(l.likes, l.last_liked_at)
+        FROM (
+            SELECT script_id, COUNT(*) AS likes, MAX(created_at) AS last_liked_at
+            FROM script_likes GROUP BY script_id
+        ) l
+        WHERE s.id = l.script_id
+    """)
+    cur.execute('SELECT reconcile_forum_topic_stats()')
+    cur.execute('SELECT reconcile_script_comment_counts()')
+    cur.execute('SELECT rebuild_user_stats()')
+    cur.execute('SELECT refresh_script_rankings(0, 10000)')
+    cur.execute("""
+        INSERT INTO reputation_ledger (user_id, delta, reason, folded_at)
+        SELECT u.id, u.reputation, 'opening_balance', CURRENT_TIMESTAMP
+        FROM users u
+        WHERE u.reputation <> 0 AND NOT EXISTS (SELECT 1 FROM reputation_ledger l WHERE l.user_id = u.id)
+    """)
+    cur.execute('UPDATE users SET rank = reputation_rank(reputation)')
+    conn.commit()
+    conn.autocommit = True
+    cur.execute('VACUUM ANALYZE')
+    cur.close()
+    conn.close()
+    return sizes
+
+def load_module(name: str):
+    path = os.path.join(ROOT, 'backend', name, 'index.py')
+    spec = importlib.util.spec_from_file_location('bench_' + name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    pool = module.db_pool
+
+    def connect():
+        pool.stats['connects'] += 1
+        return psycopg2.connect(pool.dsn, connection_factory=CountingConnection)
+
+    pool._connect = connect
+    module.release_db_connection = pool.putconn
+    return module
+
+def get(params: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'GET', 'queryStringParameters': {k: str(v) for k, v in params.items()}}
+
+def post(body: Dict[str, Any]) -> Dict[str, Any]:
+    return {'httpMethod': 'POST', 'body': json.dumps(body)}
+
+def build_scenarios(sizes: Dict[str, int]) -> List[Tuple[str, str, int, Callable[[random.Random], Dict[str, Any]]]]:
+    users, scripts, topics = sizes['users'], sizes['scripts'], sizes['topics']
+    return [
+        ('scripts_list', 'scripts', 20, lambda rng: get({'category': rng.choice(CATEGORIES), 'limit': 20})),
+        ('scripts_detail', 'scripts', 20, lambda rng: get({'id': rng.randint(1, scripts)})),
+        ('scripts_ranked', 'scripts', 6, lambda rng: get({'sort': rng.choice(['top', 'trending']), 'limit': 20})),
+        ('scripts_search', 'scripts', 10, lambda rng: get({'search': rng.choice(WORDS), 'limit': 20})),
+        ('topics_list', 'forum', 10, lambda rng: get({'sort': rng.choice(['new', 'activity'])})),
+        ('topic_detail', 'forum', 10, lambda rng: get({'id': rng.randint(1, topics)})),
+        ('comments_page', 'comments', 10, lambda rng: get({'script_id': rng.randint(1, scripts), 'limit': 20})),
+        ('replies_page', 'comments', 10, lambda rng: get({'topic_id': rng.randint(1, topics), 'limit': 20})),
+        ('like', 'scripts', 4, lambda rng: post({
+            'action': 'like', 'script_id': rng.randint(1, scripts), 'user_id': rng.randint(1, users)
+        })),
+        ('download', 'scripts', 4, lambda rng: post({'action': 'download', 'script_id': rng.randint(1, scripts)})),
+        ('reply', 'comments', 2, lambda rng: post({
+            'type': 'forum', 'topic_id': rng.randint(1, topics),
+            'author_id': rng.randint(1, users), 'content': 'bench reply'
+        }))
+    ]
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def run_load(modules: Dict[str, Any], scenarios, concurrency: int, duration: float,
+             random_seed: int) -> Dict[str, Any]:
+    weighted = [scenario for scenario in scenarios for _ in range(scenario[2])]
+    samples: Dict[str, List[Tuple[float, int, bool]]] = {scenario[0]: [] for scenario in scenarios}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(worker_id: int) -> None:
+        rng = random.Random(random_seed + worker_id)
+        local: Dict[str, List[Tuple[float, int, bool]]] = {name: [] for name in samples}
+        while time.monotonic() < deadline:
+            name, function, _, make_event = rng.choice(weighted)
+            event = make_event(rng)
+            query_counter.count = 0
+            started = time.perf_counter()
+            response = modules[function].handler(event, None)
+            elapsed = (time.perf_counter() - started) * 1000
+            local[name].append((elapsed, query_counter.count, response['statusCode'] < 500))
+        with lock:
+            for name, values in local.items():
+                samples[name].extend(values)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    wall = time.monotonic() - started
+
+    report = {}
+    for name, values in samples.items():
+        latencies = sorted(value[0] for value in values)
+        report[name] = {
+            'requests': len(values),
+            'errors': sum(1 for value in values if not value[2]),
+            'throughput_rps': round(len(values) / wall, 1),
+            'p50_ms': round(percentile(latencies, 0.50), 2),
+            'p95_ms': round(percentile(latencies, 0.95), 2),
+            'p99_ms': round(percentile(latencies, 0.99), 2),
+            'queries_per_request': round(sum(value[1] for value in values) / len(values), 2) if values else 0
+        }
+    total = sum(len(values) for values in samples.values())
+    report['total'] = {'requests': total, 'throughput_rps': round(total / wall, 1)}
+    return report
+
+def capture_plans(dsn: str, modules: Dict[str, Any], scenarios, random_seed: int) -> Dict[str, List[str]]:
+    rng = random.Random(random_seed)
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    plans = {}
+    for name, function, _, make_event in scenarios:
+        if name in ('like', 'download', 'reply'):
+            continue
+        module = modules[function]
+        if hasattr(module, 'response_cache'):
+            module.response_cache.invalidate(module.CACHE_SCOPE)
+        query_counter.capture = []
+        module.handler(make_event(rng), None)
+        statements = [sql for sql in query_counter.capture if re.match(r'\s*(SELECT|WITH)\b', sql, re.I)]
+        query_counter.capture = None
+        plans[name] = []
+        with conn.cursor() as cur:
+            for sql in statements:
+                if re.search(r'\b(INSERT|UPDATE|DELETE)\b', sql, re.I):
+                    continue
+                cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + sql)
+                plans[name].append('\n'.join(row[0] for row in cur.fetchall()))
+    conn.close()
+    return plans
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    regressions = []
+    for name, current in report['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous or name == 'total':
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append('{}: p95 {} ms > baseline {} ms'.format(name, current['p95_ms'], previous['p95_ms']))
+        if current['throughput_rps'] < previous['throughput_rps'] * (1 - tolerance):
+            regressions.append('{}: throughput {} rps < baseline {} rps'.format(
+                name, current['throughput_rps'], previous['throughput_rps']))
+        if current['queries_per_request'] > previous['queries_per_request']:
+            regressions.append('{}: {} queries per request > baseline {}'.format(
+                name, current['queries_per_request'], previous['queries_per_request']))
+    return regressions
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the backend handlers against a seeded Postgres')
+    parser.add_argument('--scale', type=int, default=10000, help='number of scripts; other tables scale from it')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of load')
+    parser.add_argument('--local-postgres', action='store_true', help='initdb a throwaway cluster instead of DATABASE_URL')
+    parser.add_argument('--no-response-cache', action='store_true')
+    parser.add_argument('--no-plans', action='store_true')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--compare', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--random-seed', type=int, default=42)
+    args = parser.parse_args()
+
+    local_postgres: Optional[LocalPostgres] = None
+    if args.local_postgres:
+        local_postgres = LocalPostgres(free_port())
+        dsn = local_postgres.start()
+    else:
+        dsn = os.environ.get('DATABASE_URL')
+        if not dsn:
+            sys.exit('Pass --local-postgres or set DATABASE_URL')
+
+    os.environ['DATABASE_URL'] = dsn
+    os.environ.pop('DATABASE_REPLICA_URLS', None)
+    os.environ['DB_POOL_MAX_SIZE'] = str(args.concurrency)
+    os.environ['COUNTER_FLUSH_INTERVAL'] = '5'
+    if args.no_response_cache:
+        os.environ['RESPONSE_CACHE_TTL'] = '0'
+
+    try:
+        applied = apply_migrations(dsn)
+        sizes = seed(dsn, args.scale)
+        modules = {name: load_module(name) for name in ('scripts', 'forum', 'comments')}
+        scenarios = build_scenarios(sizes)
+        run_load(modules, scenarios, args.concurrency, min(5.0, args.duration), args.random_seed)
+        report = {
+            'scale': args.scale,
+            'concurrency': args.concurrency,
+            'duration_s': args.duration,
+            'migrations_applied': applied,
+            'scenarios': run_load(modules, scenarios, args.concurrency, args.duration, args.random_seed)
+        }
+        if not args.no_plans:
+            report['plans'] = capture_plans(dsn, modules, scenarios, args.random_seed)
+    finally:
+        if local_postgres:
+            local_postgres.stop()
+
+    regressions = []
+    if args.compare:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.tolerance)
+        report['regressions'] = regressions
+    if args.save_baseline:
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump({key: report[key] for key in ('scale', 'concurrency', 'duration_s', 'scenarios')},
+                      baseline_file, indent=2)
+
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,10 @@
+UPDATE scripts SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE scripts ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_scripts_created ON scripts(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scripts_category_created ON scripts(category, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scripts_author_created ON scripts(author_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_scripts_category_author_created ON scripts(category, author_id, created_at DESC, id DESC);
+
+DROP INDEX IF EXISTS idx_scripts_category;
+DROP INDEX IF EXISTS idx_scripts_author;
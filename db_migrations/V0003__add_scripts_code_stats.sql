@@ -0,0 +1,3 @@
+ALTER TABLE scripts
+    ADD COLUMN IF NOT EXISTS code_size INTEGER GENERATED ALWAYS AS (octet_length(code)) STORED,
+    ADD COLUMN IF NOT EXISTS code_lines INTEGER GENERATED ALWAYS AS (length(code) - length(replace(code, E'\n', '')) + 1) STORED;
@@ -0,0 +1,6 @@
+CREATE UNLOGGED TABLE IF NOT EXISTS counter_events (
+    target VARCHAR(30) NOT NULL,
+    target_id INTEGER NOT NULL,
+    delta INTEGER NOT NULL DEFAULT 1,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
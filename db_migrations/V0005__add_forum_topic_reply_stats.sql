@@ -0,0 +1,30 @@
+ALTER TABLE forum_topics
+    ADD COLUMN IF NOT EXISTS reply_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS last_reply_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS last_activity_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP;
+
+CREATE OR REPLACE FUNCTION reconcile_forum_topic_stats() RETURNS INTEGER AS $$
+    WITH actual AS (
+        SELECT t.id, COUNT(r.id) AS reply_count, MAX(r.created_at) AS last_reply_at
+        FROM forum_topics t
+        LEFT JOIN forum_replies r ON r.topic_id = t.id
+        GROUP BY t.id
+    ), fixed AS (
+        UPDATE forum_topics t
+        SET reply_count = a.reply_count,
+            last_reply_at = a.last_reply_at,
+            last_activity_at = COALESCE(a.last_reply_at, t.created_at, t.last_activity_at)
+        FROM actual a
+        WHERE t.id = a.id
+          AND (t.reply_count <> a.reply_count
+               OR t.last_reply_at IS DISTINCT FROM a.last_reply_at
+               OR t.last_activity_at IS DISTINCT FROM COALESCE(a.last_reply_at, t.created_at, t.last_activity_at))
+        RETURNING t.id
+    )
+    SELECT COUNT(*)::INTEGER FROM fixed;
+$$ LANGUAGE sql;
+
+SELECT reconcile_forum_topic_stats();
+
+CREATE INDEX IF NOT EXISTS idx_forum_topics_activity ON forum_topics(last_activity_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_forum_topics_created ON forum_topics(created_at DESC, id DESC);
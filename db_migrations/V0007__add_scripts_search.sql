@@ -0,0 +1,11 @@
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+ALTER TABLE scripts
+    ADD COLUMN IF NOT EXISTS search_vector TSVECTOR GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', title), 'A')
+        || setweight(to_tsvector('simple', COALESCE(description, '')), 'B')
+        || setweight(to_tsvector('simple', regexp_replace(LEFT(code, 100000), '[^[:alnum:]_]+', ' ', 'g')), 'C')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_scripts_search ON scripts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_scripts_title_trgm ON scripts USING GIN (title gin_trgm_ops);
@@ -0,0 +1,30 @@
+UPDATE script_comments SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE script_comments ALTER COLUMN created_at SET NOT NULL;
+UPDATE forum_replies SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+ALTER TABLE forum_replies ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_script_comments_script_created ON script_comments(script_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_forum_replies_topic_created ON forum_replies(topic_id, created_at, id);
+
+DROP INDEX IF EXISTS idx_script_comments_script;
+DROP INDEX IF EXISTS idx_forum_replies_topic;
+
+ALTER TABLE scripts ADD COLUMN IF NOT EXISTS comment_count INTEGER NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION reconcile_script_comment_counts() RETURNS INTEGER AS $$
+    WITH actual AS (
+        SELECT s.id, COUNT(c.id) AS comment_count
+        FROM scripts s
+        LEFT JOIN script_comments c ON c.script_id = s.id
+        GROUP BY s.id
+    ), fixed AS (
+        UPDATE scripts s
+        SET comment_count = a.comment_count
+        FROM actual a
+        WHERE s.id = a.id AND s.comment_count <> a.comment_count
+        RETURNING s.id
+    )
+    SELECT COUNT(*)::INTEGER FROM fixed;
+$$ LANGUAGE sql;
+
+SELECT reconcile_script_comment_counts();
@@ -0,0 +1,65 @@
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users(id),
+    scripts_authored INTEGER NOT NULL DEFAULT 0,
+    likes_received INTEGER NOT NULL DEFAULT 0,
+    downloads_received INTEGER NOT NULL DEFAULT 0,
+    replies_posted INTEGER NOT NULL DEFAULT 0,
+    comments_posted INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_stats_downloads ON user_stats(downloads_received DESC, user_id);
+CREATE INDEX IF NOT EXISTS idx_user_stats_likes ON user_stats(likes_received DESC, user_id);
+CREATE INDEX IF NOT EXISTS idx_users_reputation ON users(reputation DESC, id);
+
+CREATE OR REPLACE FUNCTION rebuild_user_stats() RETURNS INTEGER AS $$
+    WITH authored AS (
+        SELECT author_id AS user_id, COUNT(*) AS scripts_authored, SUM(downloads) AS downloads_received
+        FROM scripts
+        GROUP BY author_id
+    ), liked AS (
+        SELECT s.author_id AS user_id, COUNT(*) AS likes_received
+        FROM script_likes l
+        JOIN scripts s ON s.id = l.script_id
+        GROUP BY s.author_id
+    ), replied AS (
+        SELECT author_id AS user_id, COUNT(*) AS replies_posted
+        FROM forum_replies
+        GROUP BY author_id
+    ), commented AS (
+        SELECT author_id AS user_id, COUNT(*) AS comments_posted
+        FROM script_comments
+        GROUP BY author_id
+    ), actual AS (
+        SELECT u.id AS user_id,
+               COALESCE(a.scripts_authored, 0) AS scripts_authored,
+               COALESCE(l.likes_received, 0) AS likes_received,
+               COALESCE(a.downloads_received, 0) AS downloads_received,
+               COALESCE(r.replies_posted, 0) AS replies_posted,
+               COALESCE(c.comments_posted, 0) AS comments_posted
+        FROM users u
+        LEFT JOIN authored a ON a.user_id = u.id
+        LEFT JOIN liked l ON l.user_id = u.id
+        LEFT JOIN replied r ON r.user_id = u.id
+        LEFT JOIN commented c ON c.user_id = u.id
+    ), fixed AS (
+        INSERT INTO user_stats AS st (user_id, scripts_authored, likes_received, downloads_received, replies_posted, comments_posted)
+        SELECT user_id, scripts_authored, likes_received, downloads_received, replies_posted, comments_posted
+        FROM actual
+        ON CONFLICT (user_id) DO UPDATE
+        SET scripts_authored = EXCLUDED.scripts_authored,
+            likes_received = EXCLUDED.likes_received,
+            downloads_received = EXCLUDED.downloads_received,
+            replies_posted = EXCLUDED.replies_posted,
+            comments_posted = EXCLUDED.comments_posted,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE (st.scripts_authored, st.likes_received, st.downloads_received, st.replies_posted, st.comments_posted)
+              IS DISTINCT FROM
+              (EXCLUDED.scripts_authored, EXCLUDED.likes_received, EXCLUDED.downloads_received,
+               EXCLUDED.replies_posted, EXCLUDED.comments_posted)
+        RETURNING st.user_id
+    )
+    SELECT COUNT(*)::INTEGER FROM fixed;
+$$ LANGUAGE sql;
+
+SELECT rebuild_user_stats();
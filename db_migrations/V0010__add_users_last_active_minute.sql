@@ -0,0 +1 @@
+ALTER TABLE users ADD COLUMN IF NOT EXISTS last_active_minute INTEGER;
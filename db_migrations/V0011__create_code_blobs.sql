@@ -0,0 +1,54 @@
+CREATE TABLE IF NOT EXISTS code_blobs (
+    hash CHAR(64) PRIMARY KEY,
+    code TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+) WITH (toast_tuple_target = 128);
+
+DO $$
+BEGIN
+    EXECUTE 'ALTER TABLE code_blobs ALTER COLUMN code SET COMPRESSION lz4';
+EXCEPTION WHEN syntax_error OR feature_not_supported THEN
+    RAISE NOTICE 'code_blobs.code keeps the default pglz compression';
+END $$;
+
+ALTER TABLE scripts ADD COLUMN IF NOT EXISTS code_hash CHAR(64) REFERENCES code_blobs(hash);
+
+CREATE OR REPLACE FUNCTION scripts_search_vector(title TEXT, description TEXT, code TEXT) RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('simple', title), 'A')
+        || setweight(to_tsvector('simple', COALESCE(description, '')), 'B')
+        || setweight(to_tsvector('simple', regexp_replace(LEFT(code, 100000), '[^[:alnum:]_]+', ' ', 'g')), 'C')
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION code_line_count(code TEXT) RETURNS INTEGER AS $$
+    SELECT length(code) - length(replace(code, E'\n', '')) + 1
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE scripts
+    ALTER COLUMN code_size DROP EXPRESSION IF EXISTS,
+    ALTER COLUMN code_lines DROP EXPRESSION IF EXISTS,
+    ALTER COLUMN search_vector DROP EXPRESSION IF EXISTS;
+
+ALTER TABLE scripts ALTER COLUMN code DROP NOT NULL;
+
+CREATE OR REPLACE FUNCTION backfill_code_blobs(after_id INTEGER, batch_size INTEGER, OUT moved INTEGER, OUT last_id INTEGER) AS $$
+BEGIN
+    WITH batch AS (
+        SELECT id, code, encode(sha256(convert_to(code, 'UTF8')), 'hex') AS hash
+        FROM scripts
+        WHERE id > after_id AND code_hash IS NULL
+        ORDER BY id
+        LIMIT batch_size
+    ), blobs AS (
+        INSERT INTO code_blobs (hash, code)
+        SELECT DISTINCT ON (hash) hash, code FROM batch
+        ON CONFLICT (hash) DO NOTHING
+    ), updated AS (
+        UPDATE scripts s
+        SET code_hash = batch.hash
+        FROM batch
+        WHERE s.id = batch.id
+        RETURNING s.id
+    )
+    SELECT COUNT(*)::integer, MAX(id) INTO moved, last_id FROM updated;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,87 @@
+ALTER TABLE scripts ADD COLUMN IF NOT EXISTS trending_score DOUBLE PRECISION;
+
+CREATE OR REPLACE FUNCTION trending_event(weight DOUBLE PRECISION, at TIMESTAMP) RETURNS DOUBLE PRECISION AS $$
+    SELECT ln(weight) + EXTRACT(EPOCH FROM at)::float8 * ln(2) / 86400
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION trending_add(score DOUBLE PRECISION, event DOUBLE PRECISION) RETURNS DOUBLE PRECISION AS $$
+    SELECT CASE WHEN score IS NULL THEN event
+                ELSE GREATEST(score, event) + ln(1 + exp(GREATEST(LEAST(score, event) - GREATEST(score, event), -700)))
+           END
+$$ LANGUAGE sql IMMUTABLE;
+
+WITH events AS (
+    SELECT script_id, trending_event(1, created_at) AS event
+    FROM script_likes
+    WHERE created_at IS NOT NULL
+), peaks AS (
+    SELECT script_id, MAX(event) AS peak FROM events GROUP BY script_id
+), scores AS (
+    SELECT e.script_id, p.peak + ln(SUM(exp(GREATEST(e.event - p.peak, -700)))) AS score
+    FROM events e
+    JOIN peaks p ON p.script_id = e.script_id
+    GROUP BY e.script_id, p.peak
+)
+UPDATE scripts s
+SET trending_score = scores.score
+FROM scores
+WHERE s.id = scores.script_id AND s.trending_score IS NULL;
+
+CREATE TABLE IF NOT EXISTS script_rankings (
+    ranking VARCHAR(16) NOT NULL,
+    rank INTEGER NOT NULL,
+    script_id INTEGER NOT NULL REFERENCES scripts(id) ON DELETE CASCADE,
+    PRIMARY KEY (ranking, rank)
+);
+
+CREATE TABLE IF NOT EXISTS script_ranking_refreshes (
+    ranking VARCHAR(16) PRIMARY KEY,
+    ranked INTEGER NOT NULL,
+    refreshed_at TIMESTAMP NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION refresh_script_rankings(max_age_seconds INTEGER, depth INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    top_ranked INTEGER;
+    trending_ranked INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('refresh_script_rankings')) THEN
+        RETURN 0;
+    END IF;
+    IF EXISTS (
+        SELECT 1 FROM script_ranking_refreshes
+        WHERE refreshed_at > clock_timestamp() - make_interval(secs => max_age_seconds)
+    ) THEN
+        RETURN 0;
+    END IF;
+
+    DELETE FROM script_rankings;
+
+    INSERT INTO script_rankings (ranking, rank, script_id)
+    SELECT 'top', row_number() OVER (ORDER BY likes DESC, downloads DESC, id DESC), id
+    FROM (
+        SELECT id, likes, downloads FROM scripts
+        ORDER BY likes DESC, downloads DESC, id DESC
+        LIMIT depth
+    ) ranked;
+    GET DIAGNOSTICS top_ranked = ROW_COUNT;
+
+    INSERT INTO script_rankings (ranking, rank, script_id)
+    SELECT 'trending', row_number() OVER (ORDER BY trending_score DESC NULLS LAST, id DESC), id
+    FROM (
+        SELECT id, trending_score FROM scripts
+        ORDER BY trending_score DESC NULLS LAST, id DESC
+        LIMIT depth
+    ) ranked;
+    GET DIAGNOSTICS trending_ranked = ROW_COUNT;
+
+    INSERT INTO script_ranking_refreshes (ranking, ranked, refreshed_at)
+    VALUES ('top', top_ranked, clock_timestamp()), ('trending', trending_ranked, clock_timestamp())
+    ON CONFLICT (ranking) DO UPDATE
+    SET ranked = EXCLUDED.ranked, refreshed_at = EXCLUDED.refreshed_at;
+
+    RETURN top_ranked + trending_ranked;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT refresh_script_rankings(0, 10000);
@@ -0,0 +1,25 @@
+CREATE TABLE IF NOT EXISTS activity_events (
+    id BIGSERIAL PRIMARY KEY,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    kind VARCHAR(32) NOT NULL,
+    subject_id INTEGER NOT NULL,
+    parent_id INTEGER,
+    actor_id INTEGER,
+    payload JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_activity_events_position ON activity_events(txid, id);
+CREATE INDEX IF NOT EXISTS idx_activity_events_created ON activity_events(created_at);
+
+CREATE OR REPLACE FUNCTION notify_activity_events() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('activity_events', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS activity_events_notify ON activity_events;
+CREATE TRIGGER activity_events_notify
+    AFTER INSERT ON activity_events
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_activity_events();
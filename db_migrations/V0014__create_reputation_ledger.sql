@@ -0,0 +1,79 @@
+CREATE TABLE IF NOT EXISTS reputation_ranks (
+    rank VARCHAR(50) PRIMARY KEY,
+    min_reputation INTEGER NOT NULL UNIQUE
+);
+
+INSERT INTO reputation_ranks (rank, min_reputation) VALUES
+    ('Newbie', 0),
+    ('Scripter', 50),
+    ('Skilled Scripter', 250),
+    ('Veteran Scripter', 1000),
+    ('Legendary Scripter', 5000)
+ON CONFLICT (rank) DO NOTHING;
+
+CREATE TABLE IF NOT EXISTS reputation_ledger (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    delta INTEGER NOT NULL,
+    reason VARCHAR(32) NOT NULL,
+    source_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    folded_at TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_reputation_ledger_unfolded ON reputation_ledger(user_id) WHERE folded_at IS NULL;
+
+INSERT INTO reputation_ledger (user_id, delta, reason, folded_at)
+SELECT u.id, u.reputation, 'opening_balance', CURRENT_TIMESTAMP
+FROM users u
+WHERE COALESCE(u.reputation, 0) <> 0
+  AND NOT EXISTS (SELECT 1 FROM reputation_ledger l WHERE l.user_id = u.id);
+
+CREATE OR REPLACE FUNCTION reputation_rank(reputation INTEGER) RETURNS VARCHAR AS $$
+    SELECT COALESCE(
+        (SELECT rank FROM reputation_ranks WHERE min_reputation <= reputation ORDER BY min_reputation DESC LIMIT 1),
+        (SELECT rank FROM reputation_ranks ORDER BY min_reputation LIMIT 1)
+    )
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION pending_reputation(uid INTEGER) RETURNS INTEGER AS $$
+    SELECT COALESCE(SUM(delta), 0)::integer FROM reputation_ledger WHERE user_id = uid AND folded_at IS NULL
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION fold_reputation_ledger(batch_size INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    folded INTEGER;
+BEGIN
+    IF NOT pg_try_advisory_xact_lock(hashtext('fold_reputation_ledger')) THEN
+        RETURN 0;
+    END IF;
+
+    WITH batch AS (
+        UPDATE reputation_ledger l
+        SET folded_at = clock_timestamp()
+        WHERE l.id IN (
+            SELECT id FROM reputation_ledger
+            WHERE folded_at IS NULL
+            LIMIT batch_size
+        )
+        RETURNING l.user_id, l.delta
+    ), totals AS (
+        SELECT user_id, SUM(delta)::integer as delta, COUNT(*) as entries
+        FROM batch
+        GROUP BY user_id
+    ), bumped AS (
+        UPDATE users u
+        SET reputation = COALESCE(u.reputation, 0) + totals.delta,
+            rank = reputation_rank(COALESCE(u.reputation, 0) + totals.delta)
+        FROM totals
+        WHERE u.id = totals.user_id
+    )
+    SELECT COALESCE(SUM(entries), 0) INTO folded FROM totals;
+
+    RETURN folded;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE users
+SET rank = reputation_rank(COALESCE(reputation, 0))
+WHERE rank IS DISTINCT FROM reputation_rank(COALESCE(reputation, 0));
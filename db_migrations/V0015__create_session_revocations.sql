@@ -0,0 +1,25 @@
+CREATE TABLE IF NOT EXISTS session_revocations (
+    token_hash CHAR(64) PRIMARY KEY,
+    txid XID8 NOT NULL DEFAULT pg_current_xact_id(),
+    expires_at TIMESTAMP NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_session_revocations_txid ON session_revocations(txid);
+CREATE INDEX IF NOT EXISTS idx_session_revocations_expires ON session_revocations(expires_at);
+
+CREATE OR REPLACE FUNCTION record_session_revocation() RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM session_revocations WHERE expires_at < CURRENT_TIMESTAMP;
+    INSERT INTO session_revocations (token_hash, expires_at)
+    VALUES (NEW.token_hash, NEW.expires_at)
+    ON CONFLICT (token_hash) DO UPDATE SET txid = pg_current_xact_id();
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS sessions_revoked ON sessions;
+CREATE TRIGGER sessions_revoked
+    AFTER UPDATE OF revoked_at ON sessions
+    FOR EACH ROW
+    WHEN (OLD.revoked_at IS NULL AND NEW.revoked_at IS NOT NULL)
+    EXECUTE FUNCTION record_session_revocation();
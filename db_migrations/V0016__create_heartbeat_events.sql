@@ -0,0 +1,5 @@
+CREATE TABLE IF NOT EXISTS heartbeat_events (
+    user_id INTEGER NOT NULL,
+    minute INTEGER NOT NULL,
+    PRIMARY KEY (user_id, minute)
+);
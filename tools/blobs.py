@@ -0,0 +1,79 @@
+'''
+Business: Finishes the V0011 move of scripts.code into code_blobs: backfill hashes and stores existing code in
+          committed batches and resumes where it stopped, finalize drops scripts.code once every script has a blob
+Args: backfill [--batch N]; finalize; DATABASE_URL env
+Returns: progress lines on stderr, JSON summary on stdout; finalize changes nothing while scripts are pending
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+import psycopg2
+
+PENDING_SQL = "SELECT COUNT(*) FROM scripts WHERE code_hash IS NULL"
+
+def backfill(conn, batch: int) -> Dict[str, Any]:
+    started = time.monotonic()
+    total = 0
+    rounds = 0
+    after_id = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute('SELECT moved, last_id FROM backfill_code_blobs(%s, %s)', (after_id, batch))
+            moved, last_id = cur.fetchone()
+            conn.commit()
+            if last_id is None:
+                break
+            after_id = last_id
+            total += moved
+            rounds += 1
+            elapsed = max(time.monotonic() - started, 1e-9)
+            print(json.dumps({'event': 'backfill', 'moved': total, 'rounds': rounds, 'last_id': last_id,
+                              'scripts_per_s': round(total / elapsed)}), file=sys.stderr)
+        cur.execute(PENDING_SQL)
+        pending = cur.fetchone()[0]
+    conn.commit()
+    return {'moved': total, 'rounds': rounds, 'pending': pending, 'seconds': round(time.monotonic() - started, 2)}
+
+def finalize(conn) -> Dict[str, Any]:
+    started = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute(PENDING_SQL)
+        pending = cur.fetchone()[0]
+        if pending:
+            conn.rollback()
+            return {'pending': pending, 'finalized': False, 'seconds': round(time.monotonic() - started, 2)}
+        cur.execute('ALTER TABLE scripts ALTER COLUMN code_hash SET NOT NULL')
+        cur.execute('ALTER TABLE scripts DROP COLUMN IF EXISTS code')
+        cur.execute('DROP FUNCTION IF EXISTS backfill_code_blobs(INTEGER, INTEGER)')
+    conn.commit()
+    return {'pending': 0, 'finalized': True, 'seconds': round(time.monotonic() - started, 2)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill code_blobs from scripts.code and drop the inline column')
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill_parser = commands.add_parser('backfill', help='move inline script code into code_blobs in batches')
+    backfill_parser.add_argument('--batch', type=int, default=5000)
+    commands.add_parser('finalize', help='require code_hash and drop scripts.code once the backfill is complete')
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    conn = psycopg2.connect(dsn)
+    try:
+        if args.command == 'backfill':
+            result = backfill(conn, args.batch)
+        else:
+            result = finalize(conn)
+    except psycopg2.Error as e:
+        conn.rollback()
+        sys.exit('{} failed: {}'.format(args.command, e))
+    finally:
+        conn.close()
+
+    print(json.dumps({'command': args.command, **result}, indent=2, default=str))
@@ -0,0 +1,419 @@
+'''
+Business: Bulk-loads and exports users, scripts, topics, replies, comments and likes without going through the handlers.
+          Import streams NDJSON or CSV files into staged temp tables with COPY and resolves foreign keys set-wise
+          through source-to-target id maps; export streams the same entities from one snapshot through a server-side
+          cursor (NDJSON) or COPY TO (CSV) in constant memory
+Args: import --dir with <entity>.ndjson or <entity>.csv files, export --dir --format ndjson|csv, --entities subset;
+      DATABASE_URL env. Entities without a file resolve their ids against existing rows
+Returns: progress lines on stderr, JSON summary with rows and rows/s per entity on stdout; import is all-or-nothing
+'''
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, IO, List, Optional, Tuple
+
+import psycopg2
+
+PROGRESS_INTERVAL = 2.0
+EXPORT_FETCH_SIZE = 5000
+RANKING_DEPTH = 10000
+
+ENTITIES: Dict[str, Dict[str, Any]] = {
+    'users': {
+        'table': 'users',
+        'columns': [
+            ('id', 'INTEGER'), ('username', 'TEXT'), ('email', 'TEXT'), ('password_hash', 'TEXT'),
+            ('rank', 'TEXT'), ('reputation', 'INTEGER'), ('time_spent_minutes', 'INTEGER'),
+            ('created_at', 'TIMESTAMP'), ('last_login', 'TIMESTAMP')
+        ],
+        'required': ['username', 'email', 'password_hash'],
+        'export': """
+            SELECT id, username, email, password_hash, rank, reputation, time_spent_minutes, created_at, last_login
+            FROM users ORDER BY id
+        """
+    },
+    'scripts': {
+        'table': 'scripts',
+        'columns': [
+            ('id', 'INTEGER'), ('author_id', 'INTEGER'), ('title', 'TEXT'), ('category', 'TEXT'),
+            ('description', 'TEXT'), ('code', 'TEXT'), ('likes', 'INTEGER'), ('downloads', 'INTEGER'),
+            ('created_at', 'TIMESTAMP')
+        ],
+        'required': ['title', 'category', 'code'],
+        'export': """
+            SELECT s.id, s.author_id, s.title, s.category, s.description, b.code, s.likes, s.downloads, s.created_at
+            FROM scripts s
+            JOIN code_blobs b ON b.hash = s.code_hash
+            ORDER BY s.id
+        """
+    },
+    'topics': {
+        'table': 'forum_topics',
+        'columns': [
+            ('id', 'INTEGER'), ('author_id', 'INTEGER'), ('title', 'TEXT'), ('status', 'TEXT'),
+            ('views', 'INTEGER'), ('created_at', 'TIMESTAMP')
+        ],
+        'required': ['title'],
+        'export': "SELECT id, author_id, title, status, views, created_at FROM forum_topics ORDER BY id"
+    },
+    'replies': {
+        'table': 'forum_replies',
+        'columns': [
+            ('id', 'INTEGER'), ('topic_id', 'INTEGER'), ('author_id', 'INTEGER'), ('content', 'TEXT'),
+            ('created_at', 'TIMESTAMP')
+        ],
+        'required': ['content'],
+        'export': "SELECT id, topic_id, author_id, content, created_at FROM forum_replies ORDER BY id"
+    },
+    'comments': {
+        'table': 'script_comments',
+        'columns': [
+            ('id', 'INTEGER'), ('script_id', 'INTEGER'), ('author_id', 'INTEGER'), ('content', 'TEXT'),
+            ('created_at', 'TIMESTAMP')
+        ],
+        'required': ['content'],
+        'export': "SELECT id, script_id, author_id, content, created_at FROM script_comments ORDER BY id"
+    },
+    'likes': {
+        'table': 'script_likes',
+        'columns': [('script_id', 'INTEGER'), ('user_id', 'INTEGER'), ('created_at', 'TIMESTAMP')],
+        'export': "SELECT script_id, user_id, created_at FROM script_likes ORDER BY id"
+    }
+}
+
+ID_MAPS = {'users': 'users', 'scripts': 'scripts', 'topics': 'forum_topics'}
+
+LOAD_SQL = {
+    'users': ["""
+        INSERT INTO users (username, email, password_hash, rank, reputation, time_spent_minutes, created_at, last_login)
+        SELECT DISTINCT ON (username) username, email, password_hash, COALESCE(rank, 'Newbie'), COALESCE(reputation, 0),
+               COALESCE(time_spent_minutes, 0), COALESCE(created_at, CURRENT_TIMESTAMP),
+               COALESCE(last_login, created_at, CURRENT_TIMESTAMP)
+        FROM stage_users
+        WHERE username IS NOT NULL AND email IS NOT NULL AND password_hash IS NOT NULL
+        ORDER BY username
+        ON CONFLICT DO NOTHING
+    """, """
+        INSERT INTO map_users (source_id, target_id)
+        SELECT st.id, u.id
+        FROM stage_users st
+        JOIN users u ON u.username = st.username
+        WHERE st.id IS NOT NULL
+        ON CONFLICT (source_id) DO NOTHING
+    """, """
+        INSERT INTO reputation_ledger (user_id, delta, reason, folded_at)
+        SELECT u.id, u.reputation, 'opening_balance', CURRENT_TIMESTAMP
+        FROM users u
+        WHERE u.id IN (SELECT target_id FROM map_users)
+          AND COALESCE(u.reputation, 0) <> 0
+          AND NOT EXISTS (SELECT 1 FROM reputation_ledger l WHERE l.user_id = u.id)
+    """],
+    'scripts': ["""
+        INSERT INTO map_scripts (source_id, target_id)
+        SELECT DISTINCT ON (st.id) st.id, nextval(pg_get_serial_sequence('scripts', 'id'))
+        FROM stage_scripts st
+        JOIN map_users a ON a.source_id = st.author_id
+        WHERE st.id IS NOT NULL AND st.title IS NOT NULL AND st.category IS NOT NULL AND st.code IS NOT NULL
+        ORDER BY st.id
+    """, """
+        INSERT INTO code_blobs (hash, code)
+        SELECT DISTINCT ON (hash) hash, code
+        FROM (
+            SELECT encode(sha256(convert_to(st.code, 'UTF8')), 'hex') AS hash, st.code
+            FROM stage_scripts st
+            JOIN map_scripts m ON m.source_id = st.id
+        ) blobs
+        ON CONFLICT (hash) DO NOTHING
+    """, """
+        INSERT INTO scripts (id, title, code_hash, category, description, author_id, likes, downloads,
+                             created_at, updated_at, code_size, code_lines, search_vector)
+        SELECT DISTINCT ON (st.id) m.target_id, st.title, encode(sha256(convert_to(st.code, 'UTF8')), 'hex'),
+               st.category, st.description, a.target_id, COALESCE(st.likes, 0), COALESCE(st.downloads, 0),
+               COALESCE(st.created_at, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP,
+               octet_length(st.code), code_line_count(st.code), scripts_search_vector(st.title, st.description, st.code)
+        FROM stage_scripts st
+        JOIN map_scripts m ON m.source_id = st.id
+        JOIN map_users a ON a.source_id = st.author_id
+        ORDER BY st.id
+    """],
+    'topics': ["""
+        INSERT INTO map_topics (source_id, target_id)
+        SELECT DISTINCT ON (st.id) st.id, nextval(pg_get_serial_sequence('forum_topics', 'id'))
+        FROM stage_topics st
+        JOIN map_users a ON a.source_id = st.author_id
+        WHERE st.id IS NOT NULL AND st.title IS NOT NULL
+        ORDER BY st.id
+    """, """
+        INSERT INTO forum_topics (id, title, author_id, status, views, created_at, updated_at, last_activity_at)
+        SELECT DISTINCT ON (st.id) m.target_id, st.title, a.target_id, COALESCE(st.status, 'open'), COALESCE(st.views, 0),
+               COALESCE(st.created_at, CURRENT_TIMESTAMP), CURRENT_TIMESTAMP, COALESCE(st.created_at, CURRENT_TIMESTAMP)
+        FROM stage_topics st
+        JOIN map_topics m ON m.source_id = st.id
+        JOIN map_users a ON a.source_id = st.author_id
+        ORDER BY st.id
+    """],
+    'replies': ["""
+        INSERT INTO forum_replies (topic_id, author_id, content, created_at)
+        SELECT t.target_id, a.target_id, st.content, COALESCE(st.created_at, CURRENT_TIMESTAMP)
+        FROM stage_replies st
+        JOIN map_topics t ON t.source_id = st.topic_id
+        JOIN map_users a ON a.source_id = st.author_id
+        WHERE st.content IS NOT NULL
+        ORDER BY st.created_at, st.id
+    """],
+    'comments': ["""
+        INSERT INTO script_comments (script_id, author_id, content, created_at)
+        SELECT s.target_id, a.target_id, st.content, COALESCE(st.created_at, CURRENT_TIMESTAMP)
+        FROM stage_comments st
+        JOIN map_scripts s ON s.source_id = st.script_id
+        JOIN map_users a ON a.source_id = st.author_id
+        WHERE st.content IS NOT NULL
+        ORDER BY st.created_at, st.id
+    """],
+    'likes': ["""
+        INSERT INTO script_likes (script_id, user_id, created_at)
+        SELECT s.target_id, u.target_id, COALESCE(st.created_at, CURRENT_TIMESTAMP)
+        FROM stage_likes st
+        JOIN map_scripts s ON s.source_id = st.script_id
+        JOIN map_users u ON u.source_id = st.user_id
+        ON CONFLICT (script_id, user_id) DO NOTHING
+    """]
+}
+
+TRENDING_BACKFILL_SQL = """
+    WITH events AS (
+        SELECT l.script_id, trending_event(1, l.created_at) AS event
+        FROM script_likes l
+        JOIN map_scripts m ON m.target_id = l.script_id
+    ), peaks AS (
+        SELECT script_id, MAX(event) AS peak FROM events GROUP BY script_id
+    ), scores AS (
+        SELECT e.script_id, p.peak + ln(SUM(exp(GREATEST(e.event - p.peak, -700)))) AS score
+        FROM events e
+        JOIN peaks p ON p.script_id = e.script_id
+        GROUP BY e.script_id, p.peak
+    )
+    UPDATE scripts s
+    SET trending_score = scores.score
+    FROM scores
+    WHERE s.id = scores.script_id
+"""
+
+class Progress:
+    def __init__(self, entity: str, phase: str, total_bytes: Optional[int] = None):
+        self.entity = entity
+        self.phase = phase
+        self.total_bytes = total_bytes
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self.reported = self.started
+
+    def add(self, rows: int, size: int) -> None:
+        self.rows += rows
+        self.bytes += size
+        now = time.monotonic()
+        if now - self.reported >= PROGRESS_INTERVAL:
+            self.reported = now
+            self.report()
+
+    def report(self, **extra: Any) -> Dict[str, Any]:
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        line = {
+            'event': self.phase, 'entity': self.entity, 'rows': self.rows, 'bytes': self.bytes,
+            'seconds': round(elapsed, 2), 'rows_per_s': round(self.rows / elapsed),
+            'mb_per_s': round(self.bytes / elapsed / 1e6, 2), **extra
+        }
+        if self.total_bytes:
+            line['percent'] = round(100.0 * self.bytes / self.total_bytes, 1)
+        print(json.dumps(line), file=sys.stderr)
+        return line
+
+class ProgressReader:
+    def __init__(self, source: IO[str], progress: Progress):
+        self.source = source
+        self.progress = progress
+
+    def read(self, size: int = -1) -> str:
+        chunk = self.source.read(size)
+        self.progress.add(chunk.count('\n'), len(chunk.encode()))
+        return chunk
+
+    def readline(self, size: int = -1) -> str:
+        line = self.source.readline(size)
+        self.progress.add(1 if line else 0, len(line.encode()))
+        return line
+
+class ProgressWriter:
+    def __init__(self, target: IO[str], progress: Progress):
+        self.target = target
+        self.progress = progress
+
+    def write(self, data: str) -> int:
+        self.progress.add(data.count('\n'), len(data.encode()))
+        return self.target.write(data)
+
+def entity_file(directory: str, entity: str) -> Tuple[Optional[str], Optional[str]]:
+    for file_format in ('ndjson', 'csv'):
+        path = os.path.join(directory, entity + '.' + file_format)
+        if os.path.exists(path):
+            return path, file_format
+    return None, None
+
+def create_staging(cur, entity: str) -> None:
+    columns = ', '.join(name + ' ' + kind for name, kind in ENTITIES[entity]['columns'])
+    cur.execute('CREATE TEMP TABLE stage_{} ({}) ON COMMIT DROP'.format(entity, columns))
+
+def copy_ndjson(cur, entity: str, path: str) -> Dict[str, Any]:
+    progress = Progress(entity, 'copy', os.path.getsize(path))
+    cur.execute('CREATE TEMP TABLE IF NOT EXISTS stage_raw (doc JSONB) ON COMMIT DROP')
+    cur.execute('TRUNCATE stage_raw')
+    with open(path, encoding='utf-8') as source:
+        cur.copy_expert(
+            "COPY stage_raw (doc) FROM STDIN WITH (FORMAT csv, QUOTE e'\\x01', DELIMITER e'\\x02')",
+            ProgressReader(source, progress)
+        )
+    cur.execute(
+        'INSERT INTO stage_{0} SELECT (jsonb_populate_record(NULL::stage_{0}, doc)).* FROM stage_raw WHERE doc IS NOT NULL'.format(entity)
+    )
+    return progress.report(staged=cur.rowcount)
+
+def copy_csv(cur, entity: str, path: str) -> Dict[str, Any]:
+    progress = Progress(entity, 'copy', os.path.getsize(path))
+    known = {name for name, _ in ENTITIES[entity]['columns']}
+    with open(path, encoding='utf-8', newline='') as source:
+        header = next(csv.reader([source.readline()]), [])
+        unknown = [name for name in header if name not in known]
+        if not header or unknown:
+            raise ValueError('{}: unknown or missing CSV columns {}'.format(path, unknown or header))
+        cur.copy_expert(
+            'COPY stage_{} ({}) FROM STDIN WITH (FORMAT csv)'.format(entity, ', '.join(header)),
+            ProgressReader(source, progress)
+        )
+    cur.execute('SELECT COUNT(*) FROM stage_{}'.format(entity))
+    return progress.report(staged=cur.fetchone()[0])
+
+def count_rejected(cur, entity: str) -> int:
+    required = ENTITIES[entity].get('required')
+    if not required:
+        return 0
+    cur.execute('SELECT COUNT(*) FROM stage_{} WHERE {}'.format(entity, ' OR '.join(name + ' IS NULL' for name in required)))
+    return cur.fetchone()[0]
+
+def import_entities(conn, directory: str, entities: List[str]) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    cur = conn.cursor()
+    for name in ID_MAPS:
+        cur.execute('CREATE TEMP TABLE map_{} (source_id INTEGER PRIMARY KEY, target_id INTEGER NOT NULL) ON COMMIT DROP'.format(name))
+
+    for entity in ENTITIES:
+        path, file_format = entity_file(directory, entity) if entity in entities else (None, None)
+        if path is None:
+            if entity in ID_MAPS:
+                cur.execute('INSERT INTO map_{} (source_id, target_id) SELECT id, id FROM {}'.format(entity, ID_MAPS[entity]))
+            continue
+
+        create_staging(cur, entity)
+        copied = copy_ndjson(cur, entity, path) if file_format == 'ndjson' else copy_csv(cur, entity, path)
+        rejected = count_rejected(cur, entity)
+        progress = Progress(entity, 'load')
+        inserted = 0
+        for statement in LOAD_SQL[entity]:
+            cur.execute(statement)
+            if statement.lstrip().startswith('INSERT INTO ' + ENTITIES[entity]['table'] + ' '):
+                inserted = cur.rowcount
+        progress.rows = inserted
+        loaded = progress.report()
+        summary[entity] = {
+            'file': path,
+            'staged': copied['staged'],
+            'inserted': inserted,
+            'rejected': rejected,
+            'skipped': copied['staged'] - inserted - rejected,
+            'copy_rows_per_s': copied['rows_per_s'],
+            'load_rows_per_s': loaded['rows_per_s']
+        }
+
+    progress = Progress('all', 'reconcile')
+    cur.execute('SELECT reconcile_forum_topic_stats()')
+    cur.execute('SELECT reconcile_script_comment_counts()')
+    cur.execute(TRENDING_BACKFILL_SQL)
+    cur.execute('SELECT rebuild_user_stats()')
+    cur.execute('SELECT refresh_script_rankings(0, %s)', (RANKING_DEPTH,))
+    summary['reconcile_seconds'] = progress.report()['seconds']
+    cur.close()
+    return summary
+
+def export_entities(conn, directory: str, entities: List[str], file_format: str) -> Dict[str, Any]:
+    summary: Dict[str, Any] = {}
+    os.makedirs(directory, exist_ok=True)
+    for entity in entities:
+        path = os.path.join(directory, entity + '.' + file_format)
+        progress = Progress(entity, 'export')
+        rows = 0
+        with open(path, 'w', encoding='utf-8', newline='') as target:
+            if file_format == 'csv':
+                with conn.cursor() as cur:
+                    cur.copy_expert(
+                        'COPY ({}) TO STDOUT WITH (FORMAT csv, HEADER true)'.format(ENTITIES[entity]['export'].strip()),
+                        ProgressWriter(target, progress)
+                    )
+                    rows = cur.rowcount
+            else:
+                with conn.cursor(name='export_' + entity) as cur:
+                    cur.itersize = EXPORT_FETCH_SIZE
+                    cur.execute('SELECT row_to_json(e)::text FROM ({}) e'.format(ENTITIES[entity]['export']))
+                    for row in cur:
+                        line = row[0] + '\n'
+                        target.write(line)
+                        progress.add(1, len(line.encode()))
+                        rows += 1
+        exported = progress.report()
+        summary[entity] = {
+            'file': path,
+            'rows': rows,
+            'bytes': exported['bytes'],
+            'rows_per_s': exported['rows_per_s']
+        }
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Bulk import and export of users, scripts, forum and likes')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='load <entity>.ndjson / <entity>.csv files from a directory')
+    import_parser.add_argument('--dir', required=True)
+    import_parser.add_argument('--entities', nargs='+', choices=list(ENTITIES), default=list(ENTITIES))
+    export_parser = commands.add_parser('export', help='write one file per entity from a single snapshot')
+    export_parser.add_argument('--dir', required=True)
+    export_parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+    export_parser.add_argument('--entities', nargs='+', choices=list(ENTITIES), default=list(ENTITIES))
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    conn = psycopg2.connect(dsn)
+    started = time.monotonic()
+    try:
+        if args.command == 'import':
+            result = import_entities(conn, args.dir, args.entities)
+            conn.commit()
+        else:
+            conn.set_session(isolation_level='REPEATABLE READ', readonly=True)
+            result = export_entities(conn, args.dir, args.entities, args.format)
+            conn.rollback()
+    except (psycopg2.Error, ValueError) as e:
+        conn.rollback()
+        sys.exit('{} failed: {}'.format(args.command, e))
+    finally:
+        conn.close()
+
+    print(json.dumps({
+        'command': args.command,
+        'seconds': round(time.monotonic() - started, 2),
+        'entities': result
+    }, indent=2, default=str))
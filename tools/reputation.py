@@ -0,0 +1,124 @@
+'''
+Business: Maintains users.reputation and users.rank from the reputation ledger: fold drains pending ledger entries
+          in batches, replay rebuilds every user's reputation and rank from the full ledger and reports drift
+Args: fold [--batch N]; replay [--dry-run] [--sample N]; DATABASE_URL env
+Returns: progress lines on stderr, JSON summary on stdout; replay changes nothing with --dry-run
+'''
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict
+
+import psycopg2
+
+LOCK_KEY = 'fold_reputation_ledger'
+
+DRIFT_SQL = """
+    WITH totals AS (
+        SELECT user_id, SUM(delta) FILTER (WHERE folded_at IS NOT NULL)::integer as total
+        FROM reputation_ledger
+        GROUP BY user_id
+    )
+    SELECT u.id, u.username, COALESCE(u.reputation, 0) as reputation, COALESCE(t.total, 0) as ledger,
+           u.rank, reputation_rank(COALESCE(t.total, 0)) as ledger_rank
+    FROM users u
+    LEFT JOIN totals t ON t.user_id = u.id
+    WHERE COALESCE(u.reputation, 0) <> COALESCE(t.total, 0)
+       OR u.rank IS DISTINCT FROM reputation_rank(COALESCE(t.total, 0))
+    ORDER BY abs(COALESCE(u.reputation, 0) - COALESCE(t.total, 0)) DESC, u.id
+"""
+
+REPLAY_SQL = """
+    WITH folded AS (
+        UPDATE reputation_ledger SET folded_at = clock_timestamp() WHERE folded_at IS NULL RETURNING id
+    ), totals AS (
+        SELECT user_id, SUM(delta)::integer as total FROM reputation_ledger GROUP BY user_id
+    ), target AS (
+        SELECT u.id, COALESCE(t.total, 0) as total
+        FROM users u
+        LEFT JOIN totals t ON t.user_id = u.id
+    ), rebuilt AS (
+        UPDATE users u
+        SET reputation = target.total, rank = reputation_rank(target.total)
+        FROM target
+        WHERE u.id = target.id
+          AND (COALESCE(u.reputation, 0) <> target.total OR u.rank IS DISTINCT FROM reputation_rank(target.total))
+        RETURNING u.id
+    )
+    SELECT (SELECT COUNT(*) FROM folded) as folded, (SELECT COUNT(*) FROM rebuilt) as rebuilt
+"""
+
+def fold(conn, batch: int) -> Dict[str, Any]:
+    started = time.monotonic()
+    total = 0
+    rounds = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute('SELECT fold_reputation_ledger(%s)', (batch,))
+            folded = cur.fetchone()[0]
+            conn.commit()
+            if not folded:
+                break
+            total += folded
+            rounds += 1
+            elapsed = max(time.monotonic() - started, 1e-9)
+            print(json.dumps({'event': 'fold', 'folded': total, 'rounds': rounds,
+                              'entries_per_s': round(total / elapsed)}), file=sys.stderr)
+        cur.execute('SELECT COUNT(*) FROM reputation_ledger WHERE folded_at IS NULL')
+        pending = cur.fetchone()[0]
+    conn.commit()
+    return {'folded': total, 'rounds': rounds, 'pending': pending, 'seconds': round(time.monotonic() - started, 2)}
+
+def replay(conn, dry_run: bool, sample: int) -> Dict[str, Any]:
+    started = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute('SELECT pg_advisory_xact_lock(hashtext(%s))', (LOCK_KEY,))
+        cur.execute(DRIFT_SQL)
+        columns = [column[0] for column in cur.description]
+        drifted = [dict(zip(columns, row)) for row in cur.fetchall()]
+        print(json.dumps({'event': 'drift', 'users': len(drifted)}), file=sys.stderr)
+        summary = {
+            'drifted_users': len(drifted),
+            'reputation_drift': sum(row['reputation'] - row['ledger'] for row in drifted),
+            'sample': drifted[:sample],
+            'dry_run': dry_run
+        }
+        if dry_run:
+            conn.rollback()
+        else:
+            cur.execute(REPLAY_SQL)
+            folded, rebuilt = cur.fetchone()
+            conn.commit()
+            summary.update({'folded': folded, 'rebuilt': rebuilt})
+    summary['seconds'] = round(time.monotonic() - started, 2)
+    return summary
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fold or replay the reputation ledger into users')
+    commands = parser.add_subparsers(dest='command', required=True)
+    fold_parser = commands.add_parser('fold', help='drain pending ledger entries into users.reputation and rank')
+    fold_parser.add_argument('--batch', type=int, default=5000)
+    replay_parser = commands.add_parser('replay', help='rebuild reputation and rank for every user from the ledger')
+    replay_parser.add_argument('--dry-run', action='store_true')
+    replay_parser.add_argument('--sample', type=int, default=20)
+    args = parser.parse_args()
+
+    dsn = os.environ.get('DATABASE_URL')
+    if not dsn:
+        sys.exit('DATABASE_URL is required')
+
+    conn = psycopg2.connect(dsn)
+    try:
+        if args.command == 'fold':
+            result = fold(conn, args.batch)
+        else:
+            result = replay(conn, args.dry_run, args.sample)
+    except psycopg2.Error as e:
+        conn.rollback()
+        sys.exit('{} failed: {}'.format(args.command, e))
+    finally:
+        conn.close()
+
+    print(json.dumps({'command': args.command, **result}, indent=2, default=str))